@@ -0,0 +1,32 @@
+import os
+import sys
+
+# add parent dir to path to access webrecorder package
+wr_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, wr_path)
+
+from redis import StrictRedis
+from webrecorder.models.base import BaseAccess
+from webrecorder.models import User, Collection
+
+
+# ============================================================================
+def main():
+    """Build user and collection admin indexes from existing data."""
+    r = StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    access = BaseAccess()
+
+    for username in r.smembers('s:users'):
+        user = User(my_id=username, redis=r, access=access)
+        user.reindex()
+
+        for coll in r.hvals(User.COLLS_KEY.format(user=username)):
+            collection = Collection(my_id=coll, redis=r, access=access)
+            collection.owner = user
+            collection.reindex()
+
+        print('indexed: ' + username)
+
+
+main()
@@ -175,13 +175,15 @@ class TestAdminAPI(FullStackTests):
                               {'target': USER_LOGINS, 'type': 'timeserie'},
                               {'target': USER_LOGINS_100, 'type': 'timeserie'},
                               {'target': ACTIVE_SESSIONS, 'type': 'timeserie'},
+                              {'target': UNIQUE_SESSIONS, 'type': 'timeserie'},
+                              {'target': TOTAL_TEMP_USERS, 'type': 'timeserie'},
                              ]
                  }
 
         res = self.testapp.post_json('/api/v1/stats/query', params=params)
 
         assert isinstance(res.json, list)
-        assert len(res.json) == 4
+        assert len(res.json) == 6
 
         # 3 users created
         assert res.json[0]['datapoints'][0][0] == 3
@@ -195,10 +197,13 @@ class TestAdminAPI(FullStackTests):
         # 1 active session
         assert res.json[3]['datapoints'][0][0] == 1
 
-    def test_api_stats_query_users(self):
-        # user table cached
-        assert self.redis.get(AdminController.CACHE_USER_TABLE)
+        # 2 sessions seen today: anon session, then admin login session
+        assert res.json[4]['datapoints'][0][0] == 2
+
+        # 1 temp user
+        assert res.json[5]['datapoints'][0][0] == 1
 
+    def test_api_stats_query_users(self):
         params = {'range': {'from': today_str(),
                             'to': today_str()
                            },
@@ -217,6 +222,9 @@ class TestAdminAPI(FullStackTests):
 
         assert set(data[0] for data in data['rows']) == {'test', 'another', 'adminuser'}
 
+        # user table cached
+        assert self.redis.get(AdminController.CACHE_USER_TABLE)
+
         # total query
         assert res.json[1]['datapoints'][0][0] == 3
 
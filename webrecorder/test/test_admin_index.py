@@ -0,0 +1,212 @@
+from webrecorder.models import User, Collection
+from webrecorder.models.base import BaseAccess
+from webrecorder.admincontroller import AdminController
+from webrecorder.rec.webrecrecorder import WebRecRedisIndexer
+
+from fakeredis import FakeStrictRedis
+from datetime import datetime, timedelta
+from mock import patch, Mock
+
+import os
+import runpy
+
+
+# ============================================================================
+class TestAdminIndexes(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.user = self.create_user('test')
+        self.coll = self.user.create_collection('coll', title='coll')
+
+    def create_user(self, name):
+        user = User(my_id=name,
+                    redis=self.redis,
+                    access=BaseAccess())
+
+        user.create_new()
+        return user
+
+    def scores(self, index_key):
+        return dict(self.redis.zrange(index_key, 0, -1, withscores=True))
+
+    def all_indexed(self, comp_cls):
+        return [set(self.redis.zrange(index_key, 0, -1)) for index_key in comp_cls.INDEX_KEYS.values()]
+
+    def get_admin(self):
+        admin = AdminController.__new__(AdminController)
+        admin.redis = self.redis
+        return admin
+
+    def test_indexed_on_create(self):
+        created_at = self.user.get_prop('created_at')
+
+        assert self.scores(User.INDEX_KEYS['created_at']) == {'test': created_at}
+        assert self.scores(User.INDEX_KEYS['updated_at']) == {'test': created_at}
+
+        coll_created_at = self.coll.get_prop('created_at')
+
+        assert self.scores(Collection.INDEX_KEYS['created_at']) == {self.coll.my_id: coll_created_at}
+        assert self.scores(Collection.INDEX_KEYS['size']) == {self.coll.my_id: 0}
+        assert self.scores(Collection.INDEX_KEYS['public']) == {self.coll.my_id: 0}
+
+    def test_set_prop_and_incr_key(self):
+        self.coll.set_bool_prop('public', True)
+        assert self.scores(Collection.INDEX_KEYS['public']) == {self.coll.my_id: 1}
+
+        self.coll.set_prop('updated_at', 1500000000)
+        assert self.scores(Collection.INDEX_KEYS['updated_at']) == {self.coll.my_id: 1500000000}
+
+        # older, non-timestamp date
+        self.coll.set_prop('updated_at', '2018-01-02 03:04:05.123')
+        assert self.scores(Collection.INDEX_KEYS['updated_at']) == {
+            self.coll.my_id: int(datetime(2018, 1, 2, 3, 4, 5).timestamp())}
+
+        self.user.incr_size(100)
+        self.user.incr_size(50)
+
+        assert self.scores(User.INDEX_KEYS['size']) == {'test': 150}
+        assert self.scores(User.INDEX_KEYS['updated_at']) == {'test': self.user.get_prop('updated_at')}
+
+        # not indexed property
+        self.coll.set_prop('title', 'New Title')
+        assert not self.redis.exists('z:colls:title')
+
+    def test_temp_not_indexed(self):
+        temp_user = self.create_user('temp-abc')
+        temp_coll = temp_user.create_collection('temp', title='temp')
+        temp_user.incr_size(100)
+
+        assert 'temp-abc' not in self.scores(User.INDEX_KEYS['size'])
+
+        for indexed in self.all_indexed(Collection):
+            assert indexed == {self.coll.my_id}
+
+        # moved to non-temp user, reindexed
+        temp_coll.set_prop('size', 200)
+        assert temp_user.move(temp_coll, 'moved', self.user)
+
+        assert self.scores(Collection.INDEX_KEYS['size']) == {self.coll.my_id: 0, temp_coll.my_id: 200}
+
+        for indexed in self.all_indexed(Collection):
+            assert indexed == {self.coll.my_id, temp_coll.my_id}
+
+        # owner changed to temp user, removed
+        temp_coll.set_prop('owner', 'temp-abc')
+
+        for indexed in self.all_indexed(Collection):
+            assert indexed == {self.coll.my_id}
+
+    def test_removed_on_delete(self):
+        other = self.user.create_collection('other', title='other')
+        assert self.user.remove_collection(self.coll) == {}
+        assert self.coll.delete_object()
+
+        for indexed in self.all_indexed(Collection):
+            assert indexed == {other.my_id}
+
+        assert other.delete_object()
+        assert self.user.delete_object()
+
+        for indexed in self.all_indexed(Collection) + self.all_indexed(User):
+            assert indexed == set()
+
+    def test_recorder_updates_indexes(self):
+        recording = self.coll.create_recording()
+
+        temp_user = self.create_user('temp-abc')
+        temp_coll = temp_user.create_collection('temp', title='temp')
+
+        indexer = WebRecRedisIndexer.__new__(WebRecRedisIndexer)
+        indexer.redis = self.redis
+        indexer.info_keys = ['r:{rec}:info', 'c:{coll}:info', 'u:{user}:info']
+        indexer.rec_info_key_templ = 'r:{rec}:info'
+        indexer.coll_cdxj_key = Collection.COLL_CDXJ_KEY
+        indexer.stats = Mock()
+
+        def update(user, coll, rec, cdx_list, length):
+            params = {'param.user': user, 'param.coll': coll, 'param.rec': rec}
+            indexer.update_index_info(cdx_list, params, length)
+
+        self.user.set_prop('updated_at', 1500000000, update_ts=False)
+        now = int(datetime.utcnow().timestamp())
+
+        # no CDXJ lines, only size
+        update('test', self.coll.my_id, recording.my_id, [], 100)
+        assert self.scores(User.INDEX_KEYS['size']) == {'test': 100}
+        assert self.scores(Collection.INDEX_KEYS['size']) == {self.coll.my_id: 100}
+        assert self.scores(User.INDEX_KEYS['updated_at'])['test'] == 1500000000
+
+        cdx = b'com,example)/ 20180102000000 {"url": "http://example.com/", "mime": "text/html"}'
+
+        update('test', self.coll.my_id, recording.my_id, [cdx], 50)
+        assert self.scores(User.INDEX_KEYS['size']) == {'test': 150}
+        assert self.scores(Collection.INDEX_KEYS['size']) == {self.coll.my_id: 150}
+        assert self.scores(User.INDEX_KEYS['updated_at'])['test'] >= now
+        assert self.scores(Collection.INDEX_KEYS['updated_at'])[self.coll.my_id] >= now
+
+        # temp users not indexed
+        update('temp-abc', temp_coll.my_id, 'rec', [cdx], 50)
+        assert 'temp-abc' not in self.scores(User.INDEX_KEYS['size'])
+        assert temp_coll.my_id not in self.scores(Collection.INDEX_KEYS['size'])
+
+    def test_migrate_builds_indexes(self):
+        other = self.user.create_collection('other', title='other')
+        other.set_bool_prop('public', True)
+        self.user.incr_size(100)
+
+        self.redis.sadd('s:users', 'test')
+
+        before = {index_key: self.scores(index_key)
+                  for index_key in list(User.INDEX_KEYS.values()) + list(Collection.INDEX_KEYS.values())}
+
+        for index_key in before:
+            self.redis.delete(index_key)
+
+        script = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migration_scripts', 'migrate5.1.py')
+
+        with patch.dict(os.environ, {'REDIS_BASE_URL': 'redis://localhost/2'}), \
+             patch('redis.StrictRedis.from_url', return_value=self.redis):
+            runpy.run_path(script)
+
+        for index_key, scores in before.items():
+            assert self.scores(index_key) == scores
+
+    def test_range_queries(self):
+        day = datetime(2018, 1, 2)
+        next_day = day + timedelta(days=1)
+
+        users = {'test': (day, 0), 'big': (day, 200000000), 'later': (next_day, 200000000)}
+        for name, (dt, size) in users.items():
+            user = self.create_user(name) if name != 'test' else self.user
+            user.set_prop('created_at', int(dt.timestamp()) + 60)
+            user.set_prop('updated_at', int(dt.timestamp()) + 120, update_ts=False)
+            user.set_prop('size', size)
+
+        public = self.user.create_collection('public', title='public')
+        public.set_bool_prop('public', True)
+
+        for collection in (self.coll, public):
+            collection.set_prop('created_at', int(day.timestamp()) + 60)
+            collection.set_prop('size', 1000)
+
+        self.redis.zadd(Collection.INDEX_KEYS['created_at'], int(next_day.timestamp()) + 60, 'other')
+
+        dates = [day.date().isoformat(), next_day.date().isoformat()]
+        timestamps = [day.timestamp() * 1000, next_day.timestamp() * 1000]
+
+        def counts(series):
+            return [count for count, ts in series['datapoints']]
+
+        admin = self.get_admin()
+
+        assert counts(admin.load_user_stats('created', dates, timestamps, use_updated=False)) == [2, 1]
+        assert counts(admin.load_user_stats('logins', dates, timestamps, 100000000)) == [1, 1]
+
+        # first day only
+        assert counts(admin.load_user_stats('logins', dates[:1], timestamps[:1])) == [2]
+
+        assert counts(admin.load_coll_series('colls', dates, timestamps, True)) == [2, 1]
+        assert counts(admin.load_coll_series('public', dates, timestamps, True, public_only=True)) == [1, 0]
+        assert counts(admin.load_coll_series('sizes', dates, timestamps, True, add_size=True)) == [2000, 0]
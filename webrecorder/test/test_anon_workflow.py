@@ -28,17 +28,23 @@ from webrecorder.session import Session
 class TestTempContent(FullStackTests):
     REDIS_KEYS = [
         'r:{rec}:cdxj',
+        'r:{rec}:mime',
         'r:{rec}:open',
         'r:{rec}:info',
         'r:{rec}:wk',
         'r:{rec}:_ps',
         'r:{rec}:_pc',
+        'q:commit',
         'c:{coll}:warc',
         'c:{coll}:p',
+        'c:{coll}:p:ts',
+        'c:{coll}:p:r:{rec}',
+        'c:{coll}:p:terms',
         'c:{coll}:info',
         'c:{coll}:recs',
         'u:{user}:info',
         'u:{user}:colls',
+        'z:temp-users',
         'h:defaults',
         'h:roles',
         Stats.ALL_CAPTURE_TEMP_KEY,
@@ -78,6 +84,7 @@ class TestTempContent(FullStackTests):
         cls.dyn_stats = []
         cls.downloaded = False
         cls.deleted = False
+        cls.searched = False
 
         cls.temp_coll = None
 
@@ -97,6 +104,10 @@ class TestTempContent(FullStackTests):
     def set_deleted(cls):
         cls.deleted = True
 
+    @classmethod
+    def set_searched(cls):
+        cls.searched = True
+
     def _get_redis_keys(self, keylist, user, coll, rec):
         keylist = [key.format(user=user, coll=coll, rec=rec) for key in keylist]
         return keylist
@@ -133,6 +144,9 @@ class TestTempContent(FullStackTests):
         if self.deleted:
             exp_keys.append(Stats.DELETE_TEMP_KEY)
 
+        if self.searched:
+            exp_keys.append('c:{coll}:p:_v'.format(coll=coll))
+
         if check_stats:
             self._check_dyn_stats(exp_keys)
 
@@ -461,6 +475,110 @@ class TestTempContent(FullStackTests):
         assert '/http://httpbin.org/get?food=bar' in res.text
         assert '/http://httpbin.org/get?bood=far' in res.text
 
+    def test_anon_url_search(self):
+        url = '/api/v1/url_search?user={user}&coll=temp&'.format(user=self.anon_user)
+
+        # page index version set on first search
+        self.set_searched()
+
+        res = self.testapp.get(url + 'search=' + quote('вэбрек'))
+        assert [page['title'] for page in res.json['results']] == ['вэбрекордэр!']
+
+        res = self.testapp.get(url + 'url=bood')
+        assert sorted(page['rec'] for page in res.json['results']) == ['my-rec2', 'unicode-title-test']
+
+        # within word
+        res = self.testapp.get(url + 'url=ood=fa')
+        assert sorted(page['rec'] for page in res.json['results']) == ['my-rec2', 'my-recording-2', 'unicode-title-test']
+
+        # too short to look up n-grams, still substring match
+        res = self.testapp.get(url + 'search=' + quote('эр'))
+        assert [page['title'] for page in res.json['results']] == ['вэбрекордэр!']
+
+        res = self.testapp.get(url + 'search=example&session=my-rec2')
+        assert [page['url'] for page in res.json['results']] == ['http://httpbin.org/get?bood=far']
+
+        res = self.testapp.get(url + 'search=example&from=2015010100000000&to=2015123100000000')
+        assert res.json['results'] == []
+
+        res = self.testapp.get(url + 'search=missing')
+        assert res.json['results'] == []
+
+    def test_anon_url_search_paged(self):
+        url = '/api/v1/url_search?user={user}&coll=temp&mime=text/html,*&'.format(user=self.anon_user)
+
+        res = self.testapp.get(url)
+        all_results = res.json['results']
+        assert 'cursor' not in res.json
+
+        # all pages, then all cdx entries
+        assert len(all_results) > 6
+        assert all('id' in page for page in all_results[:6])
+        assert all('mime' in cdx for cdx in all_results[6:])
+
+        paged = []
+        res = self.testapp.get(url + 'limit=4')
+        while True:
+            paged.extend(res.json['results'])
+            cursor = res.json.get('cursor')
+            if not cursor:
+                break
+
+            # position of last result, not offset
+            assert isinstance(cursor, str)
+            res = self.testapp.get(url + 'limit=4&cursor={0}'.format(cursor))
+
+        assert paged == all_results
+
+        res = self.testapp.get(url + 'limit=x', status=400)
+        assert res.json['error'] == 'invalid_limit_or_cursor'
+
+        res = self.testapp.get(url + 'limit=4&cursor=4', status=400)
+        assert res.json['error'] == 'invalid_limit_or_cursor'
+
+    def test_anon_list_pages_paged(self):
+        url = '/api/v1/collection/temp/pages?user={user}&'.format(user=self.anon_user)
+
+        res = self.testapp.get(url)
+        all_pages = res.json['pages']
+        assert len(all_pages) == 6
+        assert 'cursor' not in res.json
+
+        res = self.testapp.get(url + 'limit=4')
+        assert res.json['pages'] == all_pages[:4]
+        assert res.json['cursor'] == 4
+
+        res = self.testapp.get(url + 'limit=4&cursor=4')
+        assert res.json['pages'] == all_pages[4:]
+        assert 'cursor' not in res.json
+
+        res = self.testapp.get(url + 'since=2016')
+        assert res.json['pages'] == all_pages
+
+        res = self.testapp.get(url + 'since=2017')
+        assert res.json['pages'] == []
+
+        res = self.testapp.get(url + 'rec=my-rec2')
+        assert [page['url'] for page in res.json['pages']] == ['http://httpbin.org/get?bood=far']
+
+        res = self.testapp.get(url + 'cursor=-1', status=400)
+        assert res.json['error'] == 'invalid_limit_or_cursor'
+
+    def test_anon_rec_pages_paged(self):
+        url = '/api/v1/recording/my-rec2/{0}?user={user}&coll=temp'
+
+        res = self.testapp.get(url.format('pages', user=self.anon_user) + '&limit=1')
+        assert [page['url'] for page in res.json['pages']] == ['http://httpbin.org/get?bood=far']
+        assert 'cursor' not in res.json
+
+        res = self.testapp.get(url.format('num_pages', user=self.anon_user))
+        assert res.json['count'] == 1
+
+    def test_anon_coll_pages_limit(self):
+        res = self.testapp.get('/api/v1/collection/temp?user={user}&pages_limit=2'.format(user=self.anon_user))
+        assert len(res.json['collection']['pages']) == 2
+        assert res.json['collection']['pages_cursor'] == 2
+
     def test_anon_replay_top_frame(self):
         res = self._get_anon('/temp/my-rec2/replay/http://httpbin.org/get?food=bar')
         res.charset = 'utf-8'
@@ -3,6 +3,7 @@ import os
 import re
 import json
 
+from mock import patch
 from urllib.parse import urlencode
 from webrecorder.models.usermanager import CLIUserManager
 
@@ -494,3 +495,18 @@ class TestAppContentDomain(FullStackTests):
         assert 'Set-Cookie' in res.headers
         assert '"food": "bar"' in res.text
 
+
+    def test_public_replay_skip_session(self):
+        url = '/test/default-collection/2018mp_/http://httpbin.org/get?food=bar'
+        refer_url = 'http://app-host' + url.replace('mp_/', '/')
+
+        # public collection already checked, only session id from cookie is used
+        with patch('webrecorder.session.RedisSessionMiddleware._load_session') as load_session:
+            res = self.testapp.get(url,
+                                   headers={'Host': 'content-host',
+                                            'Referer': refer_url}, status=200)
+
+            assert not load_session.called
+
+        assert 'Set-Cookie' not in res.headers
+        assert '"food": "bar"' in res.text
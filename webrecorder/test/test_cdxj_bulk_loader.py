@@ -0,0 +1,107 @@
+from webrecorder.utils import CDXJBulkLoader
+
+from fakeredis import FakeStrictRedis
+from io import BytesIO
+from mock import patch, Mock
+
+
+# ============================================================================
+class PipelineSpy(object):
+    def __init__(self, pi, pipelines):
+        self.pi = pi
+        self.zadds = []
+        self.executed = False
+        pipelines.append(self)
+
+    def zadd(self, key, *args):
+        self.zadds.append(len(args) // 2)
+        return self.pi.zadd(key, *args)
+
+    def execute(self):
+        self.executed = True
+        return self.pi.execute()
+
+
+# ============================================================================
+class TestCDXJBulkLoader(object):
+    KEY = 'c:coll:cdxj'
+
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.pipelines = []
+
+    def get_loader(self, batch_size=None):
+        loader = CDXJBulkLoader(self.redis, self.KEY, batch_size=batch_size)
+
+        pipeline = self.redis.pipeline
+        loader.redis = Mock(pipeline=lambda transaction=True: PipelineSpy(pipeline(transaction=transaction),
+                                                                          self.pipelines))
+
+        return loader
+
+    def lines(self, count):
+        return ['com,example)/{0:03d} 20180102000000 {{"url": "http://example.com/{0:03d}"}}'.format(i)
+                for i in range(count)]
+
+    @patch('webrecorder.utils.CDXJBulkLoader.PIPELINE_DEPTH', 2)
+    def test_batches_and_pipeline_depth(self):
+        loader = self.get_loader(batch_size=3)
+        lines = self.lines(14)
+
+        loader.add_lines(lines[:3])
+
+        # one ZADD queued, not yet sent
+        assert [pi.zadds for pi in self.pipelines] == [[3]]
+        assert self.redis.zcard(self.KEY) == 0
+
+        loader.add_lines(lines[3:6])
+
+        # pipeline full, sent
+        assert self.pipelines[0].executed
+        assert self.redis.zcard(self.KEY) == 6
+
+        loader.add_lines(lines[6:])
+        assert self.redis.zcard(self.KEY) == 12
+
+        assert loader.close() == 14
+
+        assert [pi.zadds for pi in self.pipelines] == [[3, 3], [3, 3], [2]]
+        assert all(pi.executed for pi in self.pipelines)
+
+        assert self.redis.zrange(self.KEY, 0, -1) == lines
+
+    def test_empty_lines_skipped(self):
+        loader = self.get_loader()
+        loader.add_lines(['', b'', None])
+
+        assert loader.close() == 0
+        assert self.pipelines == []
+        assert not self.redis.exists(self.KEY)
+
+    @patch('webrecorder.utils.CDXJBulkLoader.READ_SIZE', 7)
+    def test_load_stream_partial_lines(self):
+        lines = self.lines(10)
+
+        # lines split across chunks, mixed line endings, no final newline
+        data = '\r\n'.join(lines[:5]) + '\n\n' + '\n'.join(lines[5:])
+
+        loader = self.get_loader(batch_size=4)
+        loader.load_stream(BytesIO(data.encode('utf-8')))
+
+        assert loader.close() == 10
+        assert self.redis.zrange(self.KEY, 0, -1) == lines
+
+    @patch('webrecorder.utils.CDXJBulkLoader.READ_SIZE', 16)
+    def test_load_stream_chunk_at_line_end(self):
+        lines = ['a' * 15, 'b' * 15, 'c' * 31]
+
+        # each chunk ends exactly at a newline
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        loader = self.get_loader()
+        loader.load_stream(BytesIO(data))
+
+        assert loader.close() == 3
+        assert self.redis.zrange(self.KEY, 0, -1) == lines
@@ -0,0 +1,218 @@
+from webrecorder.models import User, Collection, Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.models.stats import Stats
+from webrecorder.utils import today_str
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+CDXJ_LINE = 'com,example)/{0} 2018010100000{1} {{"url": "http://example.com/{0}", "mime": "text/html"}}'
+
+
+# ============================================================================
+@patch('webrecorder.models.collection.Collection.COLL_CDXJ_ENTRY_SIZE', 100)
+@patch('webrecorder.models.collection.Collection.COLL_CDXJ_MAX_SIZE', 500)
+class TestCDXJLRU(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        self.user.create_new()
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_coll(self, name, num_entries, committed=False):
+        collection = self.user.create_collection(name, title=name)
+        recording = collection.create_recording()
+
+        lines = [CDXJ_LINE.format(name, i) for i in range(num_entries)]
+
+        if committed:
+            index_file = os.path.join(self.temp_dir, name + '.cdxj')
+            with open(index_file, 'wt') as fh:
+                fh.write('\n'.join(lines) + '\n')
+
+            recording.set_prop(Recording.INDEX_FILE_KEY, index_file)
+        else:
+            for line in lines:
+                self.redis.zadd(Recording.CDXJ_KEY.format(rec=recording.my_id), 0, line)
+
+        return collection
+
+    def coll_cdxj_key(self, collection):
+        return Collection.COLL_CDXJ_KEY.format(coll=collection.my_id)
+
+    def get_stat(self, key):
+        return int(self.redis.hget(key, today_str()) or 0)
+
+    def test_track_size(self):
+        coll = self.create_coll('a', 2)
+        coll.sync_coll_index()
+
+        assert self.redis.zcard(self.coll_cdxj_key(coll)) == 2
+        assert self.redis.hget(Collection.COLL_CDXJ_SIZE_KEY, coll.my_id) == '200'
+        assert self.redis.zrange(Collection.COLL_CDXJ_LRU_KEY, 0, -1) == [coll.my_id]
+
+        assert self.get_stat(Stats.CDXJ_CACHE_MISS_KEY) == 1
+
+        coll.sync_coll_index()
+        assert self.get_stat(Stats.CDXJ_CACHE_HIT_KEY) == 1
+
+    def test_evict_least_recent(self):
+        coll_a = self.create_coll('a', 2)
+        coll_b = self.create_coll('b', 2)
+        coll_c = self.create_coll('c', 2)
+
+        coll_a.sync_coll_index()
+        coll_b.sync_coll_index()
+
+        # a replayed again, now most recent
+        coll_a.sync_coll_index()
+
+        # over budget of 5 entries, b evicted
+        coll_c.sync_coll_index()
+
+        assert self.redis.exists(self.coll_cdxj_key(coll_a))
+        assert not self.redis.exists(self.coll_cdxj_key(coll_b))
+        assert self.redis.exists(self.coll_cdxj_key(coll_c))
+
+        assert self.redis.zrange(Collection.COLL_CDXJ_LRU_KEY, 0, -1) == [coll_a.my_id, coll_c.my_id]
+        assert self.redis.hget(Collection.COLL_CDXJ_SIZE_KEY, coll_b.my_id) is None
+
+        assert self.get_stat(Stats.CDXJ_CACHE_EVICT_KEY) == 1
+
+    def test_expired_removed(self):
+        coll_a = self.create_coll('a', 1)
+        coll_a.sync_coll_index()
+
+        self.redis.delete(self.coll_cdxj_key(coll_a))
+
+        assert coll_a.evict_cdxj(0) == 0
+        assert self.redis.zcard(Collection.COLL_CDXJ_LRU_KEY) == 0
+        assert self.redis.hlen(Collection.COLL_CDXJ_SIZE_KEY) == 0
+
+    def test_no_evict_while_rebuilding(self):
+        coll_a = self.create_coll('a', 3)
+        coll_b = self.create_coll('b', 3)
+
+        coll_a.sync_coll_index()
+
+        # download of committed index for a still in progress
+        build_key = Collection.COLL_CDXJ_BUILD_KEY.format(coll=coll_a.my_id)
+        self.redis.set(build_key, 1)
+
+        coll_b.sync_coll_index()
+
+        assert self.redis.exists(self.coll_cdxj_key(coll_a))
+
+        # download done
+        self.redis.delete(build_key)
+        coll_b.evict_cdxj(Collection.COLL_CDXJ_MAX_SIZE)
+
+        assert not self.redis.exists(self.coll_cdxj_key(coll_a))
+
+    def test_download_committed(self):
+        coll = self.create_coll('a', 3, committed=True)
+
+        coll.sync_coll_index(do_async=False)
+
+        assert self.redis.zcard(self.coll_cdxj_key(coll)) == 3
+        assert self.redis.hget(Collection.COLL_CDXJ_SIZE_KEY, coll.my_id) == '300'
+
+        # rebuild marker removed once all downloads are done
+        assert not self.redis.exists(Collection.COLL_CDXJ_BUILD_KEY.format(coll=coll.my_id))
+
+    def test_no_accounting_without_budget(self):
+        coll = self.create_coll('a', 2)
+
+        with patch('webrecorder.models.collection.Collection.COLL_CDXJ_MAX_SIZE', 0):
+            coll.sync_coll_index()
+
+        assert self.redis.exists(self.coll_cdxj_key(coll))
+        assert not self.redis.exists(Collection.COLL_CDXJ_LRU_KEY)
+        assert not self.redis.exists(Collection.COLL_CDXJ_SIZE_KEY)
+
+    def test_running_total(self):
+        coll_a = self.create_coll('a', 2)
+        coll_b = self.create_coll('b', 1)
+
+        coll_a.sync_coll_index()
+        coll_b.sync_coll_index()
+
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '300'
+
+        # expired and rebuilt with more entries, only change added
+        self.redis.delete(self.coll_cdxj_key(coll_a))
+        recording = coll_a.get_recordings()[0]
+        self.redis.zadd(Recording.CDXJ_KEY.format(rec=recording.my_id), 0, CDXJ_LINE.format('a', 5))
+
+        coll_a.sync_coll_index()
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '400'
+
+        coll_a.evict_cdxj(0)
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '300'
+
+    def test_total_from_existing_sizes(self):
+        # sizes tracked before running total
+        self.redis.hset(Collection.COLL_CDXJ_SIZE_KEY, 'old', 200)
+
+        coll = self.create_coll('a', 1)
+        coll.sync_coll_index()
+
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '300'
+
+    @patch('webrecorder.models.collection.Collection.COLL_CDXJ_EVICT_BATCH', 2)
+    def test_evict_reads_lru_head_only(self):
+        colls = [self.create_coll(name, 1) for name in 'abcde']
+        for coll in colls:
+            coll.sync_coll_index()
+
+        ranges = []
+        zrange = self.redis.zrange
+
+        def track_zrange(key, start, end, *args, **kwargs):
+            ranges.append((start, end))
+            return zrange(key, start, end, *args, **kwargs)
+
+        with patch.object(self.redis, 'zrange', side_effect=track_zrange):
+            # within budget, LRU not read
+            colls[0].sync_coll_index()
+            assert ranges == []
+
+            # over budget by 1, only first batch read
+            coll_f = self.create_coll('f', 1)
+            coll_f.sync_coll_index()
+
+            assert ranges == [(0, 1)]
+
+        assert not self.redis.exists(self.coll_cdxj_key(colls[1]))
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '500'
+
+    @patch('webrecorder.models.collection.Collection.COLL_CDXJ_EVICT_BATCH', 2)
+    def test_evict_past_rebuilding(self):
+        colls = [self.create_coll(name, 1) for name in 'abcde']
+        for coll in colls:
+            coll.sync_coll_index()
+
+        # first batch still rebuilding, kept
+        for coll in colls[:2]:
+            self.redis.set(Collection.COLL_CDXJ_BUILD_KEY.format(coll=coll.my_id), 1)
+
+        assert colls[4].evict_cdxj(300) == 2
+
+        assert [self.redis.exists(self.coll_cdxj_key(coll)) for coll in colls] == [True, True, False, False, True]
+        assert self.redis.zrange(Collection.COLL_CDXJ_LRU_KEY, 0, -1) == [colls[0].my_id, colls[1].my_id, colls[4].my_id]
+        assert self.redis.get(Collection.COLL_CDXJ_TOTAL_KEY) == '300'
@@ -0,0 +1,237 @@
+from webrecorder.models import User, Collection, Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.rec.storagecommitter import StorageCommitter
+from webrecorder.rec.tempchecker import TempChecker
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+import os
+import shutil
+import tempfile
+import time
+
+
+# ============================================================================
+class BaseQueueTest(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.env = patch.dict(os.environ, {'REDIS_BASE_URL': 'redis://localhost/2',
+                                           'REDIS_SESSION_URL': 'redis://localhost/0',
+                                           'STORAGE_ROOT': self.temp_dir,
+                                           'RECORD_ROOT': os.path.join(self.temp_dir, 'record')})
+        self.env.start()
+
+        self.from_url = patch('redis.StrictRedis.from_url', return_value=self.redis)
+        self.from_url.start()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        self.user.create_new()
+
+        self.coll = self.user.create_collection('coll', title='coll')
+
+    def teardown_method(self):
+        self.from_url.stop()
+        self.env.stop()
+
+        shutil.rmtree(self.temp_dir)
+
+    def get_due(self, recording):
+        return self.redis.zscore(Recording.COMMIT_QUEUE_KEY, recording.my_id)
+
+
+# ============================================================================
+class TestCommitQueue(BaseQueueTest):
+    def get_committer(self, **config):
+        config.setdefault('storage_commit_concurrency', 1)
+        return StorageCommitter(config)
+
+    def add_closed_rec(self, delay=0):
+        recording = self.coll.create_recording()
+        recording.set_closed()
+        recording.queue_commit(delay)
+
+        self.redis.zadd(Recording.CDXJ_KEY.format(rec=recording.my_id), 0, 'com,example)/ 2018')
+        return recording
+
+    def test_queued_when_idle_and_on_close(self):
+        now = time.time()
+        recording = self.coll.create_recording()
+
+        # due once recording would go idle
+        assert now + Recording.OPEN_REC_TTL <= self.get_due(recording) <= time.time() + Recording.OPEN_REC_TTL
+
+        recording.set_closed()
+
+        # due now
+        assert now <= self.get_due(recording) <= time.time()
+
+    def test_open_requeued_until_idle(self):
+        committer = self.get_committer()
+        recording = self.coll.create_recording()
+        self.redis.expire(Recording.OPEN_REC_KEY.format(rec=recording.my_id), 20)
+
+        # still open, checked again once idle
+        now = time.time()
+        assert committer.process_rec(recording.my_id) == 0
+        assert now + 19 <= self.get_due(recording) <= time.time() + 20
+
+        # idle, nothing to commit
+        self.redis.delete(Recording.OPEN_REC_KEY.format(rec=recording.my_id))
+
+        committer.process_rec(recording.my_id)
+        assert self.get_due(recording) is None
+
+    def test_due_order(self):
+        committer = self.get_committer()
+
+        later = self.add_closed_rec(delay=1000)
+        second = self.add_closed_rec(delay=-10)
+        first = self.add_closed_rec(delay=-20)
+
+        processed = []
+
+        with patch.object(committer, 'process_rec', side_effect=processed.append):
+            committer()
+
+        # only due recordings, earliest first
+        assert processed == [first.my_id, second.my_id]
+
+    def test_requeue_on_failure(self):
+        committer = self.get_committer(storage_commit_retry_secs=30)
+        recording = self.add_closed_rec()
+
+        # not fully committed, CDX index remains, checked again after retry delay
+        with patch('webrecorder.models.recording.Recording.commit_to_storage', return_value=100):
+            now = time.time()
+            assert committer.process_rec(recording.my_id) == 100
+
+        assert now + 30 <= self.get_due(recording) <= time.time() + 30
+
+        # error, left queued and claim released
+        recording.queue_commit(0)
+        due = self.get_due(recording)
+
+        with patch('webrecorder.models.recording.Recording.commit_to_storage', side_effect=IOError('failed')):
+            committer()
+
+        assert self.get_due(recording) == due
+        assert not self.redis.exists(StorageCommitter.CLAIM_KEY.format(rec=recording.my_id))
+
+        # committed, CDX index removed, dequeued
+        def commit_to_storage(self):
+            self.redis.delete(Recording.CDXJ_KEY.format(rec=self.my_id))
+            return 50
+
+        with patch('webrecorder.models.recording.Recording.commit_to_storage', commit_to_storage):
+            committer()
+
+        assert self.get_due(recording) is None
+
+    def test_claim_blocks_second_worker(self):
+        first = self.get_committer()
+        second = self.get_committer()
+
+        recording = self.add_closed_rec()
+        other = self.add_closed_rec()
+
+        assert first.claim_rec(recording.my_id)
+        assert not second.claim_rec(recording.my_id)
+
+        claim_key = StorageCommitter.CLAIM_KEY.format(rec=recording.my_id)
+        assert 0 < self.redis.ttl(claim_key) <= StorageCommitter.CLAIM_SECS
+
+        processed = []
+
+        with patch.object(second, 'process_rec', side_effect=processed.append):
+            second()
+
+        # claimed recording skipped, still queued
+        assert processed == [other.my_id]
+        assert self.get_due(recording) is not None
+        assert self.redis.exists(claim_key)
+
+    def test_queue_existing(self):
+        recording = self.add_closed_rec()
+        self.redis.zrem(Recording.COMMIT_QUEUE_KEY, recording.my_id)
+
+        queued = self.add_closed_rec(delay=1000)
+        due = self.get_due(queued)
+
+        self.get_committer()
+
+        # added if not queued, existing due time kept
+        assert self.get_due(recording) <= time.time()
+        assert self.get_due(queued) == due
+
+
+# ============================================================================
+class TestTempCleanupQueue(BaseQueueTest):
+    def get_checker(self):
+        config = {'coll_cdxj_ttl': 0,
+                  'temp_prefix': 'temp-',
+                  'session.key_template': 'sesh:{0}'}
+
+        return TempChecker(config)
+
+    def test_temp_users_indexed(self):
+        temp_user = User(my_id='temp-abc',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        temp_user.create_new()
+
+        # created before index, added
+        assert self.redis.zscore(User.TEMP_USERS_KEY, 'temp-abc') is None
+
+        self.get_checker()
+        assert self.redis.zscore(User.TEMP_USERS_KEY, 'temp-abc') is not None
+
+        temp_user.delete_me()
+        assert self.redis.zscore(User.TEMP_USERS_KEY, 'temp-abc') is None
+
+    def test_temp_user_without_dir_removed(self):
+        checker = self.get_checker()
+
+        # no dir in record root, only in index, and no longer exists
+        self.redis.zadd(User.TEMP_USERS_KEY, time.time(), 'temp-gone')
+
+        with patch.object(checker, 'delete_if_expired', wraps=checker.delete_if_expired) as delete:
+            checker()
+
+        delete.assert_called_once_with('temp-gone', os.path.join(os.environ['RECORD_ROOT'], 'temp-gone'))
+        assert not self.redis.exists(User.TEMP_USERS_KEY)
+
+    def test_external_colls(self):
+        ext = self.user.create_collection('ext', title='ext')
+
+        # created before index, added
+        self.redis.set(Collection.EXTERNAL_KEY.format(coll=ext.my_id), '1')
+
+        checker = self.get_checker()
+        assert self.redis.smembers(Collection.EXTERNAL_REMOVE_KEY) == {ext.my_id}
+
+        # still has CDXJ, kept
+        self.redis.zadd(Collection.COLL_CDXJ_KEY.format(coll=ext.my_id), 0, 'com,example)/ 2018')
+        checker()
+        assert self.user.get_collection_by_name('ext')
+
+        # CDXJ expired, removed
+        self.redis.delete(Collection.COLL_CDXJ_KEY.format(coll=ext.my_id))
+        checker()
+
+        assert not self.user.get_collection_by_name('ext')
+        assert not self.redis.exists(Collection.EXTERNAL_REMOVE_KEY)
+
+        # already deleted, dropped from index
+        self.redis.sadd(Collection.EXTERNAL_REMOVE_KEY, 'deleted')
+        checker()
+
+        assert not self.redis.exists(Collection.EXTERNAL_REMOVE_KEY)
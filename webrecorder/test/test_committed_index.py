@@ -0,0 +1,120 @@
+from webrecorder.load.main import CommittedIndexSource
+from webrecorder.models import Collection, Recording
+
+from fakeredis import FakeStrictRedis
+
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+CDXJ_1 = """\
+com,example)/ 20180102000000 {"url": "http://example.com/", "mime": "text/html", "filename": "rec-1.warc.gz"}
+com,example)/page 20180102000000 {"url": "http://example.com/page", "mime": "text/html", "filename": "rec-1.warc.gz"}
+org,example)/ 20180102000000 {"url": "http://example.org/", "mime": "text/html", "filename": "rec-1.warc.gz"}
+"""
+
+CDXJ_2 = """\
+com,example)/ 20180101000000 {"url": "http://example.com/", "mime": "text/html", "filename": "rec-2.warc.gz"}
+"""
+
+OPEN_CDXJ = 'com,example)/ 20180103000000 {"url": "http://example.com/", "mime": "text/html", "filename": "rec-3.warc.gz"}'
+
+
+# ============================================================================
+class TestCommittedIndexSource(object):
+    @classmethod
+    def setup_class(cls):
+        cls.root_dir = tempfile.mkdtemp()
+
+        cls.index_1 = cls.write_index('storage-a', CDXJ_1)
+        cls.index_2 = cls.write_index('storage-b', CDXJ_2)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.root_dir)
+
+    @classmethod
+    def write_index(cls, dirname, text):
+        os.makedirs(os.path.join(cls.root_dir, dirname))
+
+        # same file name in different storage paths
+        filename = os.path.join(cls.root_dir, dirname, 'index.cdxj')
+        with open(filename, 'wt') as fh:
+            fh.write(text)
+
+        return filename
+
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.source = CommittedIndexSource(redis=self.redis,
+                                           cache_dir=os.path.join(self.root_dir, 'cache'))
+
+    def add_rec(self, rec, index_file=None, open_cdxj=None):
+        self.redis.sadd(Collection.RECS_KEY.format(coll='100'), rec)
+
+        if index_file:
+            self.redis.hset(Recording.INFO_KEY.format(rec=rec), Recording.INDEX_FILE_KEY, index_file)
+
+        if open_cdxj:
+            self.redis.zadd(Recording.CDXJ_KEY.format(rec=rec), 0, open_cdxj)
+
+    def query(self, key=b'com,example)/', end_key=b'com,example)0'):
+        params = {'coll': '100', 'key': key, 'end_key': end_key}
+        return [(cdx['urlkey'], cdx['timestamp'], cdx['filename'])
+                for cdx in self.source.load_index(params)]
+
+    def test_committed_and_open_recs(self):
+        self.add_rec('1', index_file=self.index_1)
+        self.add_rec('2', index_file=self.index_2)
+        self.add_rec('3', open_cdxj=OPEN_CDXJ)
+
+        assert self.query() == [
+            ('com,example)/', '20180101000000', 'rec-2.warc.gz'),
+            ('com,example)/', '20180102000000', 'rec-1.warc.gz'),
+            ('com,example)/', '20180103000000', 'rec-3.warc.gz'),
+            ('com,example)/page', '20180102000000', 'rec-1.warc.gz'),
+        ]
+
+    def test_missing_index_file(self):
+        self.add_rec('1', index_file=self.index_1)
+        self.add_rec('2', index_file=os.path.join(self.root_dir, 'missing', 'index.cdxj'))
+
+        assert len(self.query()) == 2
+
+    def test_external_coll(self):
+        self.redis.set(Collection.EXTERNAL_KEY.format(coll='100'), '1')
+        self.redis.zadd(Collection.COLL_CDXJ_KEY.format(coll='100'), 0, OPEN_CDXJ)
+
+        assert self.query() == [('com,example)/', '20180103000000', 'rec-3.warc.gz')]
+
+    def test_file_not_opened_until_read(self):
+        self.add_rec('1', index_file=self.index_1)
+
+        params = {'coll': '100', 'key': b'com,example)/', 'end_key': b'com,example)0'}
+        cdx_iter = self.source.load_file_index(self.index_1, params)
+
+        # removing file before first read: nothing opened, no results
+        shutil.move(self.index_1, self.index_1 + '.bak')
+        try:
+            assert list(cdx_iter) == []
+        finally:
+            shutil.move(self.index_1 + '.bak', self.index_1)
+
+    def test_remote_cache_keyed_by_path(self):
+        cached_1 = self.source.get_cached_file('file://' + self.index_1)
+        cached_2 = self.source.get_cached_file('file://' + self.index_2)
+
+        assert cached_1 != cached_2
+
+        with open(cached_1, 'rt') as fh:
+            assert fh.read() == CDXJ_1
+
+        with open(cached_2, 'rt') as fh:
+            assert fh.read() == CDXJ_2
+
+        # cached copy reused
+        assert self.source.get_cached_file('file://' + self.index_1) == cached_1
@@ -0,0 +1,188 @@
+from webrecorder.models import User, Collection, Recording
+from webrecorder.models.base import BaseAccess, ComponentCache
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+
+# ============================================================================
+class CachedAccess(BaseAccess):
+    def __init__(self):
+        self.comp_cache = ComponentCache()
+
+
+# ============================================================================
+class TestComponentCache(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.access = CachedAccess()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=self.access)
+
+        self.user.create_new()
+
+        self.collection = self.user.create_collection('coll', title='Coll')
+        self.recording = self.collection.create_recording()
+
+    def make_recording(self):
+        return Recording(my_id=self.recording.my_id,
+                         redis=self.redis,
+                         access=self.access)
+
+    def test_cached_get_prop(self):
+        assert self.make_recording().get_prop('owner') == self.collection.my_id
+
+        # not re-read within request
+        self.redis.hset(self.recording.info_key, 'owner', 'other')
+        assert self.make_recording().get_prop('owner') == self.collection.my_id
+
+    def test_force_update_reads_redis(self):
+        assert self.make_recording().size == 0
+
+        # write bypassing set_prop, eg. from recorder
+        self.redis.hincrby(self.recording.info_key, 'size', 100)
+
+        assert self.make_recording().size == 100
+
+        # cached entry refreshed
+        assert self.access.comp_cache.get_data(self.recording)['size'] == 100
+
+        recording = self.make_recording()
+        recording.load()
+        assert recording['size'] == 100
+
+    def test_commit_invalidates_info_key(self):
+        self.recording.set_prop(Recording.INDEX_FILE_KEY, 'local:///tmp/index.cdxj')
+
+        assert self.make_recording().get_prop(Recording.INDEX_FILE_KEY) == 'local:///tmp/index.cdxj'
+
+        def commit_file(collection, filename, full_filename, obj_type,
+                        update_key=None, update_prop=None, direct_delete=False):
+            if update_key:
+                collection.redis.hset(update_key, update_prop or filename, 's3://bucket/index.cdxj')
+
+            return True
+
+        class MockStorage(object):
+            bytes_uploaded = 0
+
+        with patch('webrecorder.models.collection.Collection.commit_file', commit_file):
+            self.make_recording().commit_to_storage(MockStorage())
+
+        assert self.make_recording().get_prop(Recording.INDEX_FILE_KEY) == 's3://bucket/index.cdxj'
+
+
+
+# ============================================================================
+class TestLoadMany(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.access = CachedAccess()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=self.access)
+
+        self.user.create_new()
+
+        self.collection = self.user.create_collection('coll', title='Coll')
+
+    def load_recordings(self):
+        with patch.object(self.redis, 'pipeline', wraps=self.redis.pipeline) as pipeline, \
+             patch.object(self.redis, 'hgetall', wraps=self.redis.hgetall) as hgetall:
+            recordings = self.collection.get_recordings()
+
+        return recordings, pipeline.call_count, [args[0][0] for args in hgetall.call_args_list]
+
+    @patch('webrecorder.models.base.RedisUniqueComponent.LOAD_BATCH_SIZE', 2)
+    def test_load_in_batches(self):
+        rec_ids = [self.collection.create_recording(title='Rec {0}'.format(i)).my_id for i in range(5)]
+
+        self.access.comp_cache = ComponentCache()
+
+        recordings, num_pipelines, loaded = self.load_recordings()
+
+        # 2 + 2 + 1
+        assert num_pipelines == 3
+        assert sorted(loaded) == sorted(Recording.INFO_KEY.format(rec=rec_id) for rec_id in rec_ids)
+
+        assert sorted(recording['title'] for recording in recordings) == ['Rec {0}'.format(i) for i in range(5)]
+        assert all(recording.loaded and recording.owner is self.collection for recording in recordings)
+
+        # all cached
+        assert all(Recording.INFO_KEY.format(rec=rec_id) in self.access.comp_cache for rec_id in rec_ids)
+
+    def test_skip_cached(self):
+        recordings = [self.collection.create_recording(title='Rec {0}'.format(i)) for i in range(3)]
+
+        self.access.comp_cache = ComponentCache()
+
+        # loaded earlier in request
+        cached = Recording(my_id=recordings[0].my_id,
+                           redis=self.redis,
+                           access=self.access)
+        cached.load()
+
+        self.redis.hset(cached.info_key, 'title', 'Changed')
+
+        loaded_recordings, num_pipelines, loaded = self.load_recordings()
+
+        assert num_pipelines == 1
+        assert sorted(loaded) == sorted(recording.info_key for recording in recordings[1:])
+
+        titles = {recording.my_id: recording['title'] for recording in loaded_recordings}
+        assert titles[cached.my_id] == 'Rec 0'
+
+        # all cached, nothing loaded
+        loaded_recordings, num_pipelines, loaded = self.load_recordings()
+        assert num_pipelines == 0
+        assert loaded == []
+
+    def test_load_many_no_cache(self):
+        self.access.comp_cache = None
+
+        recordings = [self.collection.create_recording(title='Rec {0}'.format(i)) for i in range(3)]
+        rec_ids = [recording.my_id for recording in recordings]
+
+        loaded = Recording.load_many(rec_ids, self.redis, self.access, owner=self.collection)
+
+        assert [recording.my_id for recording in loaded] == rec_ids
+        assert [recording['title'] for recording in loaded] == ['Rec 0', 'Rec 1', 'Rec 2']
+
+        # missing entries loaded as empty
+        missing, = Recording.load_many(['missing'], self.redis, self.access)
+        assert missing.loaded
+        assert missing.data == {}
+
+    def test_user_collections_loaded_once(self):
+        self.user.create_collection('other', title='Other')
+
+        self.access.comp_cache = ComponentCache()
+
+        with patch.object(self.redis, 'pipeline', wraps=self.redis.pipeline) as pipeline:
+            collections = self.user.get_collections()
+
+        assert pipeline.call_count == 1
+        assert sorted(collection['title'] for collection in collections) == ['Coll', 'Other']
+
+    def test_get_autos_owned_only(self):
+        aids = [self.collection.create_auto() for i in range(2)]
+
+        other = self.user.create_collection('other', title='Other')
+        other_aid = other.create_auto()
+
+        # listed in collection, but owned by other collection
+        self.redis.sadd(Collection.AUTO_KEY.format(coll=self.collection.my_id), other_aid)
+
+        autos = self.collection.get_autos()
+
+        assert sorted(auto.my_id for auto in autos) == sorted(aids)
+        assert all(auto.owner is self.collection for auto in autos)
+
+        assert [auto.my_id for auto in other.get_autos()] == [other_aid]
@@ -0,0 +1,203 @@
+from webrecorder.downloadcontroller import DownloadController, PrefetchReader
+
+from bottle import request
+from io import BytesIO
+from mock import patch
+
+import gevent
+import os
+import pytest
+import tempfile
+
+
+# ============================================================================
+class FakeStream(BytesIO):
+    def __init__(self, loader, data):
+        super(FakeStream, self).__init__(data)
+        self.loader = loader
+        loader.streams.append(self)
+
+
+# ============================================================================
+class FakeLoader(object):
+    def __init__(self, files, fail=None, delays=None):
+        self.files = files
+        # (path, offset) -> number of failed attempts left
+        self.fail = fail or {}
+        # path -> delay before data is available
+        self.delays = delays or {}
+        self.streams = []
+        self.loads = []
+
+    def load(self, url, offset=0, length=-1):
+        self.loads.append((url, offset))
+
+        gevent.sleep(self.delays.get(url, 0))
+
+        if url not in self.files:
+            raise IOError('Not Found: ' + url)
+
+        if self.fail.get((url, offset)):
+            self.fail[(url, offset)] -= 1
+            raise IOError('Range Failed: ' + url)
+
+        data = self.files[url]
+        if length is None or length < 0:
+            return FakeStream(self, data[offset:])
+
+        return FakeStream(self, data[offset:offset + length])
+
+
+# ============================================================================
+class TestPrefetchReader(object):
+    FILES = {'a.warc.gz': b'a' * 25,
+             'b.warc.gz': b'b' * 12,
+             'c.warc.gz': b'c' * 7}
+
+    def get_reader(self, **kwargs):
+        reader = PrefetchReader(block_size=4, range_size=10, max_ranges=3)
+        reader.loader = FakeLoader(dict(self.FILES), **kwargs)
+        return reader
+
+    def get_parts(self, reader, stream=('c.warc.gz',)):
+        yield b'HEAD'
+        for path in sorted(self.FILES):
+            if path in stream:
+                yield (path, 0, None)
+            else:
+                yield from reader.split_ranges(path, len(self.FILES[path]))
+        yield b'TAIL'
+
+    def test_split_ranges(self):
+        reader = self.get_reader()
+
+        assert list(reader.split_ranges('a.warc.gz', 25)) == [('a.warc.gz', 0, 10),
+                                                              ('a.warc.gz', 10, 10),
+                                                              ('a.warc.gz', 20, 5)]
+
+        assert list(reader.split_ranges('b.warc.gz', 20)) == [('b.warc.gz', 0, 10),
+                                                              ('b.warc.gz', 10, 10)]
+
+        assert list(reader.split_ranges('c.warc.gz', 0)) == []
+
+    def test_in_order(self):
+        # earlier parts complete last
+        reader = self.get_reader(delays={'a.warc.gz': 0.05, 'b.warc.gz': 0.02})
+
+        data = b''.join(reader(self.get_parts(reader)))
+
+        assert data == b'HEAD' + b'a' * 25 + b'b' * 12 + b'c' * 7 + b'TAIL'
+
+        # all streams closed
+        assert all(stream.closed for stream in reader.loader.streams)
+
+    def test_stream_closed_when_sent(self):
+        reader = self.get_reader()
+
+        parts = [(path, 0, None) for path in sorted(self.FILES)] + [b'TAIL']
+
+        gen = reader(iter(parts))
+        streams = reader.loader.streams
+
+        data = b''
+        while not data.endswith(b'b'):
+            data += next(gen)
+
+        # a fully sent before b started, closed right away
+        assert data == b'a' * 25 + b'b' * 4
+        assert streams[0].closed
+        assert not any(stream.closed for stream in streams[1:])
+
+        assert b''.join(gen) == b'b' * 8 + b'c' * 7 + b'TAIL'
+        assert all(stream.closed for stream in streams)
+
+    def test_range_retried(self):
+        reader = self.get_reader(fail={('a.warc.gz', 10): 2})
+
+        data = b''.join(reader(self.get_parts(reader)))
+
+        assert data == b'HEAD' + b'a' * 25 + b'b' * 12 + b'c' * 7 + b'TAIL'
+        assert reader.loader.loads.count(('a.warc.gz', 10)) == 3
+
+    def test_skip_unread_warc(self):
+        reader = self.get_reader(fail={('a.warc.gz', 0): 3})
+
+        data = b''.join(reader(self.get_parts(reader)))
+
+        # none of a sent, a skipped
+        assert data == b'HEAD' + b'b' * 12 + b'c' * 7 + b'TAIL'
+
+    def test_skip_missing_streamed_warc(self):
+        reader = self.get_reader()
+        del reader.loader.files['c.warc.gz']
+
+        data = b''.join(reader(self.get_parts(reader)))
+
+        assert data == b'HEAD' + b'a' * 25 + b'b' * 12 + b'TAIL'
+
+    def test_abort_partly_sent_warc(self):
+        reader = self.get_reader(fail={('a.warc.gz', 20): 3})
+
+        res = []
+        with pytest.raises(IOError):
+            for buff in reader(self.get_parts(reader)):
+                res.append(buff)
+
+        # no gap: nothing sent after failed range
+        assert b''.join(res) == b'HEAD' + b'a' * 20
+
+    def test_close_on_disconnect(self):
+        reader = self.get_reader()
+
+        # all streamed, so opened ahead
+        parts = [b'HEAD'] + [(path, 0, None) for path in sorted(self.FILES)]
+
+        gen = reader(iter(parts))
+        assert next(gen) == b'HEAD'
+        assert next(gen) == b'a' * 4
+
+        gevent.sleep(0.05)
+
+        # opened, some buffered and not yet reached
+        assert len(reader.loader.streams) == 3
+
+        gen.close()
+
+        assert all(stream.closed for stream in reader.loader.streams)
+
+
+# ============================================================================
+class TestServeLocalFile(object):
+    def setup_method(self):
+        self.controller = DownloadController.__new__(DownloadController)
+        self.controller.accel_location = None
+        self.controller.accel_root = None
+
+        request.bind({'REQUEST_METHOD': 'GET'})
+
+    def serve(self, data):
+        with tempfile.NamedTemporaryFile(suffix='.warc.gz') as fh:
+            fh.write(data)
+            fh.flush()
+
+            res = self.controller.serve_local_file(fh.name, 'rec.warc.gz')
+            assert res.status_code == 200
+            assert res.headers['Content-Disposition'] == "attachment; filename*=UTF-8''rec.warc.gz"
+
+            # file grows after request started
+            fh.write(b'more')
+            fh.flush()
+
+            try:
+                return res.body.read()
+            finally:
+                res.body.close()
+
+    def test_record_root_limited(self):
+        with patch.dict(os.environ, {'RECORD_ROOT': tempfile.gettempdir()}):
+            assert self.serve(b'data') == b'data'
+
+    def test_no_record_root(self):
+        with patch.dict(os.environ):
+            os.environ.pop('RECORD_ROOT', None)
+            assert self.serve(b'data') == b'datamore'
@@ -78,6 +78,18 @@ com,example)/fake 20180306181354 http://example.com/fake text/html 200 A6DESOVDZ
 
         assert 'Example Domain' in res.text
 
+    def test_external_url_search(self):
+        res = self.testapp.get('/api/v1/url_search?user={user}&coll=external&mime=text/'.format(user=self.anon_user),
+                               headers={'Host': 'app-host'})
+
+        assert [cdx['url'] for cdx in res.json['results']] == ['http://example.com/', 'http://example.com/fake']
+        assert all(cdx['mime'] == 'text/html' for cdx in res.json['results'])
+
+        res = self.testapp.get('/api/v1/url_search?user={user}&coll=external&mime=text/&url=fake'.format(user=self.anon_user),
+                               headers={'Host': 'app-host'})
+
+        assert [cdx['url'] for cdx in res.json['results']] == ['http://example.com/fake']
+
     def test_external_new_coll(self):
         params = {'external': True,
                   'title': 'external-upload-test'
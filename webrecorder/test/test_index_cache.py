@@ -0,0 +1,112 @@
+from webrecorder.models.importer import InplaceImporter
+
+from fakeredis import FakeStrictRedis
+from mock import patch, Mock
+
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+class TestIndexCache(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.temp_dir, 'cache', 'index')
+
+        self.importer = InplaceImporter.__new__(InplaceImporter)
+        self.importer.redis = self.redis
+        self.importer.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.importer.index_workers = 1
+        self.importer.indexer = Mock()
+        self.importer.indexer._get_rel_or_base_name = lambda filename, params: os.path.basename(filename)
+
+        self.user = Mock()
+        self.user.name = 'local'
+
+        self.files = []
+        for name in ('a.warc.gz', 'b.warc.gz'):
+            filename = os.path.join(self.temp_dir, name)
+            with open(filename, 'wb') as fh:
+                fh.write(name.encode('utf-8'))
+
+            self.files.append(filename)
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def index_inplace(self, filename, base_name, upload_key=None):
+        return [{'warc_path': filename,
+                 'ra': {'Chrome'},
+                 'cdx_list': [('com,example)/ ' + base_name).encode('utf-8')]}]
+
+    def index_files(self):
+        with patch.object(self.importer, 'index_inplace', side_effect=self.index_inplace) as index:
+            results = self.importer.index_files(self.user, self.files, 'up:key')
+
+        return results, sorted(os.path.basename(args[0][0]) for args in index.call_args_list)
+
+    def test_cache_not_loaded_until_imported(self):
+        results, indexed = self.index_files()
+        assert indexed == ['a.warc.gz', 'b.warc.gz']
+        assert results[self.files[0]] == self.index_inplace(self.files[0], 'a.warc.gz')
+
+        assert len(os.listdir(self.index_dir)) == 2
+
+        # cached, not loaded yet
+        with patch.object(self.importer, 'load_cached_index') as load:
+            results, indexed = self.index_files()
+
+        assert indexed == []
+        assert results == {self.files[0]: None, self.files[1]: None}
+        assert not load.called
+
+        infos = self.importer.load_cached_index(self.files[1])
+        assert infos == self.index_inplace(self.files[1], 'b.warc.gz')
+
+    def test_changed_archive_indexed_again(self):
+        self.index_files()
+        cache_files = set(os.listdir(self.index_dir))
+
+        mod = os.path.getmtime(self.files[0]) + 10
+        os.utime(self.files[0], (mod, mod))
+
+        results, indexed = self.index_files()
+        assert indexed == ['a.warc.gz']
+        assert results[self.files[1]] is None
+
+        # previous cache file of changed archive removed
+        new_cache_files = set(os.listdir(self.index_dir))
+        assert len(new_cache_files) == 2
+        assert len(new_cache_files & cache_files) == 1
+
+    def test_multifile_upload_loads_each_when_imported(self):
+        self.index_files()
+
+        loaded = []
+        imported = []
+
+        def handle_upload(stream, upload_id, upload_key, infos, filename, *args):
+            imported.append((filename, list(loaded), infos))
+            return {}
+
+        load_cached_index = self.importer.load_cached_index
+
+        def load(filename):
+            loaded.append(filename)
+            return load_cached_index(filename)
+
+        with patch.object(self.importer, '_init_upload_status', return_value=('id', 'up:key')), \
+             patch.object(self.importer, 'handle_upload', side_effect=handle_upload), \
+             patch.object(self.importer, 'load_cached_index', side_effect=load):
+            self.importer.upload_exp = 0
+            self.importer.multifile_upload(self.user, self.files)
+
+        # each loaded just before imported, next not yet loaded
+        assert imported == [(self.files[0], self.files[:1], self.index_inplace(self.files[0], 'a.warc.gz')),
+                            (self.files[1], self.files, self.index_inplace(self.files[1], 'b.warc.gz'))]
+
+        assert self.redis.hget('up:key', 'size') == str(sum(os.path.getsize(name) for name in self.files))
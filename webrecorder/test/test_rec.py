@@ -70,6 +70,7 @@ class TestWebRecRecorder(FullStackTests):
         assert set(keys) == set([
             'r:REC:wk',
             'r:REC:cdxj',
+            'r:REC:mime',
             'r:REC:info',
             'r:REC:open',
             'r:REC:_ps',
@@ -97,12 +98,14 @@ class TestWebRecRecorder(FullStackTests):
         assert set(keys) == set([
             'r:REC:wk',
             'r:REC:cdxj',
+            'r:REC:mime',
             'r:REC:info',
             'r:REC:open',
             'r:REC:_ps',
             'r:REC:_pc',
             'r:REC2:wk',
             'r:REC2:cdxj',
+            'r:REC2:mime',
             'r:REC2:info',
             'r:REC2:open',
             'r:REC2:_ps',
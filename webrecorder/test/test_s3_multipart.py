@@ -0,0 +1,135 @@
+from webrecorder.rec.storage.s3 import S3Storage
+from webrecorder.rec.storage.base import HashingReader
+
+from mock import patch
+
+import hashlib
+import os
+import tempfile
+
+
+# ============================================================================
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+# ============================================================================
+class FakeS3(object):
+    def __init__(self, upload_pages, part_pages):
+        self.paginators = {'list_multipart_uploads': FakePaginator(upload_pages),
+                           'list_parts': FakePaginator(part_pages)}
+        self.parts = {}
+        self.completed = None
+
+    def get_paginator(self, name):
+        return self.paginators[name]
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'NEW'}
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        self.parts[PartNumber] = Body
+        return {'ETag': '"' + hashlib.md5(Body).hexdigest() + '"'}
+
+    def complete_multipart_upload(self, UploadId, MultipartUpload, **kwargs):
+        self.completed = (UploadId, MultipartUpload['Parts'])
+
+
+# ============================================================================
+class TestS3Multipart(object):
+    @classmethod
+    def setup_class(cls):
+        cls.data = b'a' * 10 + b'b' * 10 + b'c' * 5
+
+        with tempfile.NamedTemporaryFile(delete=False) as fh:
+            fh.write(cls.data)
+            cls.filename = fh.name
+
+    @classmethod
+    def teardown_class(cls):
+        os.remove(cls.filename)
+
+    def get_storage(self, upload_pages, part_pages):
+        with patch.dict(os.environ, {'S3_ROOT': 's3://bucket/root/'}):
+            with patch('boto3.client', lambda name: None):
+                storage = S3Storage()
+
+        storage.chunk_size = 10
+        storage.s3 = FakeS3(upload_pages, part_pages)
+        return storage
+
+    def etag(self, data):
+        return '"' + hashlib.md5(data).hexdigest() + '"'
+
+    def test_reuse_matching_parts(self):
+        upload_pages = [{'Uploads': [{'Key': 'warcs/other.warc.gz', 'UploadId': 'X', 'Initiated': 3}],
+                         'IsTruncated': True},
+                        {'Uploads': [{'Key': 'warcs/a.warc.gz', 'UploadId': 'A', 'Initiated': 1},
+                                     {'Key': 'warcs/a.warc.gz', 'UploadId': 'B', 'Initiated': 2}]}]
+
+        part_pages = [{'Parts': [
+            # matches
+            {'PartNumber': 1, 'Size': 10, 'ETag': self.etag(b'a' * 10)},
+            # same size, other data
+            {'PartNumber': 2, 'Size': 10, 'ETag': self.etag(b'x' * 10)},
+            # other chunk size
+            {'PartNumber': 3, 'Size': 10, 'ETag': self.etag(b'c' * 5)},
+        ]}]
+
+        storage = self.get_storage(upload_pages, part_pages)
+
+        upload_id, etags = storage._find_multipart_upload('warcs/a.warc.gz', self.filename, len(self.data))
+
+        # most recent upload, found on second page
+        assert upload_id == 'B'
+        assert etags == {1: self.etag(b'a' * 10)}
+
+    def test_no_upload(self):
+        storage = self.get_storage([{'Uploads': []}], [])
+
+        assert storage._find_multipart_upload('warcs/a.warc.gz', self.filename, len(self.data)) == (None, {})
+
+    def test_multipart_upload_in_order(self):
+        part_pages = [{'Parts': [{'PartNumber': 2, 'Size': 10, 'ETag': self.etag(b'b' * 10)}]}]
+        upload_pages = [{'Uploads': [{'Key': 'warcs/a.warc.gz', 'UploadId': 'A', 'Initiated': 1}]}]
+
+        storage = self.get_storage(upload_pages, part_pages)
+        storage.concurrency = 1
+
+        with open(self.filename, 'rb') as fh:
+            storage.do_multipart_upload('warcs/a.warc.gz', self.filename, len(self.data), fh)
+
+            # whole file read once
+            assert fh.tell() == len(self.data)
+
+        # only parts not already uploaded
+        assert storage.s3.parts == {1: b'a' * 10, 3: b'c' * 5}
+
+        assert storage.s3.completed == ('A', [{'PartNumber': 1, 'ETag': self.etag(b'a' * 10)},
+                                              {'PartNumber': 2, 'ETag': self.etag(b'b' * 10)},
+                                              {'PartNumber': 3, 'ETag': self.etag(b'c' * 5)}])
+
+    def test_multipart_upload_checksum(self):
+        part_pages = [{'Parts': [{'PartNumber': 2, 'Size': 10, 'ETag': self.etag(b'b' * 10)}]}]
+        upload_pages = [{'Uploads': [{'Key': 'warcs/a.warc.gz', 'UploadId': 'A', 'Initiated': 1}]}]
+
+        storage = self.get_storage(upload_pages, part_pages)
+        storage.concurrency = 1
+
+        with open(self.filename, 'rb') as fh:
+            reader = HashingReader(fh)
+            storage.do_multipart_upload('warcs/a.warc.gz', self.filename, len(self.data), reader)
+
+        # only parts not already uploaded
+        assert storage.s3.parts == {1: b'a' * 10, 3: b'c' * 5}
+
+        assert storage.s3.completed == ('A', [{'PartNumber': 1, 'ETag': self.etag(b'a' * 10)},
+                                              {'PartNumber': 2, 'ETag': self.etag(b'b' * 10)},
+                                              {'PartNumber': 3, 'ETag': self.etag(b'c' * 5)}])
+
+        # whole file read once, in order
+        assert reader.get_checksum_and_size() == ('md5', hashlib.md5(self.data).hexdigest(), len(self.data))
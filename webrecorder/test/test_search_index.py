@@ -0,0 +1,268 @@
+from webrecorder.models import User, Collection, Recording
+from webrecorder.models.base import BaseAccess
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+import gevent
+import json
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+CDXJ = """\
+com,example)/ 20180102000000 {"url": "http://example.com/", "mime": "text/html", "filename": "rec.warc.gz"}
+com,example)/img.png 20180102000001 {"url": "http://example.com/img.png", "mime": "image/png", "filename": "rec.warc.gz"}
+com,example)/style.css 20180102000002 {"url": "http://example.com/style.css", "mime": "text/css", "filename": "rec.warc.gz"}
+"""
+
+
+# ============================================================================
+class TestSearchIndex(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        self.user.create_new()
+
+        self.coll = self.user.create_collection('coll', title='coll')
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def search_pos(self, mimes, url='', after=None):
+        return list(self.coll.search_cdxj(mimes, url=url, after=after))
+
+    def search(self, mimes, url=''):
+        return [cdx['url'] for pos, cdx in self.search_pos(mimes, url=url)]
+
+    def add_rec_with_warc(self):
+        recording = self.coll.create_recording()
+        self.redis.sadd(Recording.REC_WARC_KEY.format(rec=recording.my_id), 'rec.warc.gz')
+        return recording
+
+    def add_coll_cdxj(self):
+        coll_cdxj_key = Collection.COLL_CDXJ_KEY.format(coll=self.coll.my_id)
+        for line in CDXJ.splitlines():
+            self.redis.zadd(coll_cdxj_key, 0, line)
+
+    def add_committed_rec(self):
+        recording = self.add_rec_with_warc()
+
+        index_file = os.path.join(self.temp_dir, 'index.cdxj')
+        with open(index_file, 'wt') as fh:
+            fh.write(CDXJ)
+
+        recording.set_prop(Recording.INDEX_FILE_KEY, index_file)
+        return recording
+
+    def add_pages(self, recording, pages):
+        return [self.coll.add_page(page, recording) for page in pages]
+
+    def test_external_coll(self):
+        self.coll.set_external(True)
+        self.add_coll_cdxj()
+
+        assert self.search(['image/', 'text/css']) == ['http://example.com/img.png',
+                                                       'http://example.com/style.css']
+
+        assert self.search(['text/'], url='style') == ['http://example.com/style.css']
+
+    def test_committed_rec_loaded_async(self):
+        recording = self.add_committed_rec()
+        self.add_coll_cdxj()
+
+        mime_key = Recording.MIME_KEY.format(rec=recording.my_id)
+        assert not self.redis.exists(mime_key)
+
+        with patch.object(self.coll, 'load_mime_index', wraps=self.coll.load_mime_index) as load:
+            # scanned, while MIME type index loaded in background
+            assert self.search(['image/']) == ['http://example.com/img.png']
+            assert not load.called
+
+            gevent.sleep(0.1)
+            assert load.call_count == 1
+
+        # loaded from committed index, expiring
+        assert self.redis.zcard(mime_key) == 3
+        assert self.redis.ttl(mime_key) > 0
+        assert not self.redis.exists(mime_key + ':_')
+        assert not self.redis.exists(mime_key + ':_lock')
+
+        results = self.search_pos(['image/'])
+        assert results == [(['m', 'image/', recording.my_id, 'image/png 20180102000001 http://example.com/img.png'],
+                            {'url': 'http://example.com/img.png',
+                             'timestamp': '20180102000001',
+                             'mime': 'image/png'})]
+
+    def test_load_once(self):
+        recording = self.add_committed_rec()
+
+        greenlet = self.coll.load_mime_index_async(recording.my_id, recording.get_prop(Recording.INDEX_FILE_KEY))
+        assert greenlet
+
+        # already loading
+        assert self.coll.load_mime_index_async(recording.my_id, recording.get_prop(Recording.INDEX_FILE_KEY)) is None
+
+        greenlet.join()
+        assert self.redis.zcard(Recording.MIME_KEY.format(rec=recording.my_id)) == 3
+
+    def test_resume_expired_index(self):
+        recording = self.add_committed_rec()
+        self.coll.load_mime_index(recording.my_id, recording.get_prop(Recording.INDEX_FILE_KEY))
+
+        first = self.search_pos([''])[0][0]
+
+        # expired while paging, loaded again to resume from same position
+        self.redis.delete(Recording.MIME_KEY.format(rec=recording.my_id))
+
+        assert [cdx['url'] for pos, cdx in self.search_pos([''], after=first)] == ['http://example.com/style.css',
+                                                                                   'http://example.com/']
+
+    def test_not_indexed_scan(self):
+        self.add_rec_with_warc()
+        self.add_coll_cdxj()
+
+        # open recording with no MIME type index
+        assert self.search(['text/css']) == ['http://example.com/style.css']
+
+    @patch('webrecorder.models.collection.Collection.SEARCH_BATCH_SIZE', 2)
+    def test_resume_scan(self):
+        self.add_rec_with_warc()
+        self.add_coll_cdxj()
+
+        results = self.search_pos(['image/', 'text/'])
+        assert [pos[0] for pos, cdx in results] == ['s', 's', 's']
+
+        resumed = self.search_pos(['image/', 'text/'], after=results[0][0])
+        assert resumed == results[1:]
+
+        assert self.search_pos(['image/', 'text/'], after=results[-1][0]) == []
+
+    @patch('webrecorder.models.collection.Collection.SEARCH_BATCH_SIZE', 2)
+    def test_resume_mime_index(self):
+        recs = []
+        for i in range(2):
+            recording = self.coll.create_recording()
+            mime_key = Recording.MIME_KEY.format(rec=recording.my_id)
+            for j in range(3):
+                self.redis.zadd(mime_key, 0, 'image/png 2018010200000{0} http://example.com/{1}-{0}.png'.format(j, i))
+                self.redis.zadd(mime_key, 0, 'text/css 2018010200000{0} http://example.com/{1}-{0}.css'.format(j, i))
+
+        results = self.search_pos(['text/', 'image/'])
+        assert len(results) == 12
+
+        # by prefix, then recording
+        assert [pos[1] for pos, cdx in results] == ['image/'] * 6 + ['text/'] * 6
+
+        for i in range(len(results)):
+            assert self.search_pos(['text/', 'image/'], after=results[i][0]) == results[i + 1:]
+
+    def test_page_substring_search(self):
+        recording = self.coll.create_recording()
+        self.add_pages(recording, [{'url': 'http://example.com/', 'timestamp': '20180102000000', 'title': 'Example Domain'},
+                                   {'url': 'http://other.com/', 'timestamp': '20180102000001', 'title': 'Other Page'}])
+
+        def titles(**kwargs):
+            return [page['title'] for page in self.coll.search_pages(**kwargs)]
+
+        # within word
+        assert titles(search='ample') == ['Example Domain']
+        assert titles(search='le do') == ['Example Domain']
+        assert titles(url='her.c') == ['Other Page']
+
+        # too short for n-grams, checked directly
+        assert titles(search='ex') == ['Example Domain']
+        assert titles(search='e') == ['Example Domain', 'Other Page']
+
+        assert titles(search='xyz') == []
+        assert titles(search='example', url='other') == []
+
+    @patch('webrecorder.models.pages.PagesMixin.MAX_INDEX_LEN', 20)
+    def test_long_page_search(self):
+        recording = self.coll.create_recording()
+        long_url = 'http://example.com/' + 'a' * 50 + '/needle'
+        pid, = self.add_pages(recording, [{'url': long_url, 'timestamp': '20180102000000', 'title': 'Long'}])
+
+        long_key = Collection.PAGES_LONG_KEY.format(coll=self.coll.my_id)
+        assert self.redis.smembers(long_key) == {pid}
+
+        # past indexed part of URL
+        assert [page['id'] for page in self.coll.search_pages(url='needle')] == [pid]
+
+        self.coll.delete_page(pid, {})
+        assert not self.redis.exists(long_key)
+
+    @patch('webrecorder.models.pages.PagesMixin.PAGE_BATCH_SIZE', 2)
+    def test_resume_page_search(self):
+        recording = self.coll.create_recording()
+        pages = [{'url': 'http://example.com/{0}'.format(i),
+                  'timestamp': '2018010200000{0}'.format(i // 2),
+                  'title': 'Page {0}'.format(i)} for i in range(6)]
+
+        self.add_pages(recording, pages)
+
+        def position(page):
+            return (self.coll.get_page_ts_score(page['timestamp']), page['id'])
+
+        for kwargs in ({}, {'search': 'page'}, {'rec': recording.my_id}):
+            results = list(self.coll.search_pages(**kwargs))
+            assert len(results) == 6
+            assert [position(page) for page in results] == sorted(position(page) for page in results)
+
+            for i in range(len(results)):
+                resumed = list(self.coll.search_pages(after=position(results[i]), **kwargs))
+                assert resumed == results[i + 1:]
+
+        # last page removed, resume after its position
+        results = list(self.coll.search_pages())
+        self.coll.delete_page(results[2]['id'], {}, results[2])
+
+        resumed = list(self.coll.search_pages(after=position(results[2])))
+        assert resumed == results[3:]
+
+    def test_page_date_range(self):
+        recording = self.coll.create_recording()
+        self.add_pages(recording, [{'url': 'http://example.com/{0}'.format(i),
+                                    'timestamp': '201801020{0}0000'.format(i),
+                                    'title': 'Page'} for i in range(5)])
+
+        results = list(self.coll.search_pages(ts_from=201801020100, ts_to=201801020300))
+        assert [page['timestamp'] for page in results] == ['20180102010000', '20180102020000', '20180102030000']
+
+        after = (self.coll.get_page_ts_score(results[0]['timestamp']), results[0]['id'])
+        assert list(self.coll.search_pages(ts_from=201801020100, ts_to=201801020300, after=after)) == results[1:]
+
+    def test_page_index_rebuilt_once(self):
+        pages_key = self.coll.pages_key
+        ts_key = Collection.PAGES_TS_KEY.format(coll=self.coll.my_id)
+
+        # added before page indexes were maintained
+        self.redis.hset(pages_key, 'p1', json.dumps({'url': 'http://example.com/',
+                                                     'timestamp': '20180102000000',
+                                                     'title': 'Example',
+                                                     'rec': 'r1'}))
+
+        # stale index entries
+        self.redis.zadd(ts_key, 0, 'removed')
+        self.redis.zadd(Collection.PAGES_REC_KEY.format(coll=self.coll.my_id, rec='r2'), 0, 'removed')
+
+        assert [page['id'] for page in self.coll.search_pages(search='example')] == ['p1']
+
+        assert self.redis.zrange(ts_key, 0, -1) == ['p1']
+        assert not self.redis.exists(Collection.PAGES_REC_KEY.format(coll=self.coll.my_id, rec='r2'))
+        assert self.redis.get(Collection.PAGES_INDEX_VERSION_KEY.format(coll=self.coll.my_id)) == '2'
+
+        # not rebuilt again, even if sizes differ
+        self.redis.zadd(ts_key, 0, 'other')
+        list(self.coll.search_pages())
+
+        assert self.redis.zrange(ts_key, 0, -1) == ['other', 'p1']
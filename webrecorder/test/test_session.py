@@ -0,0 +1,115 @@
+from webrecorder.session import RedisSessionMiddleware, Session
+from webrecorder.utils import today_str
+
+from fakeredis import FakeStrictRedis
+
+import base64
+import json
+import pickle
+
+
+# ============================================================================
+SESSION_OPTS = {'session.key': '__test_sesh',
+                'session.secret': 'secret',
+                'session.key_template': 'sesh:{0}',
+                'session.long_sessions_key': 'ls:{0}',
+                'session.cookie_cache_size': 2,
+                'session.durations': {'short': {'total': 5400, 'extend': 3600},
+                                      'long': {'total': 15724800, 'extend': 604800},
+                                      'restricted': {'total': 5400, 'extend': 3600}}}
+
+
+# ============================================================================
+class TestSessionMiddleware(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.sesh_manager = RedisSessionMiddleware(None, None, self.redis, SESSION_OPTS)
+
+    def make_environ(self, sesh_id):
+        cookie = self.sesh_manager.id_to_signed_cookie(sesh_id, False)
+        return {'HTTP_COOKIE': '__test_sesh=' + cookie}
+
+    def load_session(self, sesh_id):
+        environ = self.make_environ(sesh_id)
+        self.sesh_manager.init_session(environ)
+        return environ, environ['webrec.session']
+
+    def test_pickle_session_saved_as_json(self):
+        data = {'id': 'ABC', 'anon': 'temp-ABC'}
+
+        # session saved in older format
+        self.redis.setex('sesh:ABC', 600, base64.b64encode(pickle.dumps(data)).decode('utf-8'))
+
+        environ, session = self.load_session('ABC')
+
+        assert session.is_anon()
+        assert session.anon_user == 'temp-ABC'
+        assert session.ttl > 0
+
+        session['foo'] = 'bar'
+        self.sesh_manager.prepare_response(environ, [])
+
+        assert json.loads(self.redis.get('sesh:ABC')) == {'id': 'ABC', 'anon': 'temp-ABC', 'foo': 'bar'}
+
+        # loaded from json
+        environ, session = self.load_session('ABC')
+        assert session['foo'] == 'bar'
+        assert session.anon_user == 'temp-ABC'
+
+    def test_pickle_session_not_saved_unchanged(self):
+        value = base64.b64encode(pickle.dumps({'id': 'ABC', 'anon': 'temp-ABC'})).decode('utf-8')
+        self.redis.setex('sesh:ABC', 600, value)
+
+        environ, session = self.load_session('ABC')
+        self.sesh_manager.prepare_response(environ, [])
+
+        # rewritten only on next save
+        assert self.redis.get('sesh:ABC') == value
+
+    def test_unique_and_active_sessions(self):
+        uniq_key = Session.UNIQUE_SESSIONS_KEY.format(today_str())
+
+        # not found, not counted
+        environ, session = self.load_session('ABC')
+        self.sesh_manager.prepare_response(environ, [])
+
+        assert not self.redis.exists(uniq_key)
+        assert not self.redis.exists(Session.ACTIVE_SESSIONS_KEY)
+
+        self.redis.setex('sesh:ABC', 5000, json.dumps({'id': 'ABC'}))
+
+        # loaded only, not extended yet, not counted
+        environ, session = self.load_session('ABC')
+        self.sesh_manager.prepare_response(environ, [])
+
+        assert not self.redis.exists(uniq_key)
+
+        # saved, counted once
+        for i in range(2):
+            environ, session = self.load_session('ABC')
+            session['foo'] = i
+            self.sesh_manager.prepare_response(environ, [])
+
+        assert self.redis.pfcount(uniq_key) == 1
+        assert self.redis.zrange(Session.ACTIVE_SESSIONS_KEY, 0, -1) == ['sesh:ABC']
+
+    def test_cookie_cache_lru(self):
+        cookies = [self.sesh_manager.id_to_signed_cookie(sesh_id, False)
+                   for sesh_id in ('A', 'B', 'C')]
+
+        assert self.sesh_manager.signed_cookie_to_id(cookies[0]) == ('A', False)
+        assert self.sesh_manager.signed_cookie_to_id(cookies[1]) == ('B', False)
+
+        # A now most recently used
+        assert self.sesh_manager.signed_cookie_to_id(cookies[0]) == ('A', False)
+
+        # B evicted
+        assert self.sesh_manager.signed_cookie_to_id(cookies[2]) == ('C', False)
+
+        assert list(self.sesh_manager.cookie_cache.keys()) == [cookies[0], cookies[2]]
+
+        # invalid signature not cached
+        assert self.sesh_manager.signed_cookie_to_id(cookies[1] + 'x') is None
+        assert list(self.sesh_manager.cookie_cache.values()) == [('A', False), ('C', False)]
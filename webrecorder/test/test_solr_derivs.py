@@ -0,0 +1,211 @@
+from webrecorder.models import User, Collection
+from webrecorder.models.base import BaseAccess
+
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from fakeredis import FakeStrictRedis
+from io import BytesIO
+from mock import patch, Mock
+
+import json
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+PAGES = [{'url': 'http://example.com/', 'timestamp': '20180102000000', 'title': 'Example'},
+         {'url': 'http://example.com/page?id=1', 'timestamp': '20180102000001', 'title': 'Page'},
+         {'url': 'http://other.com/', 'timestamp': '20180102000002', 'title': 'Other'}]
+
+
+# ============================================================================
+class NonSeekable(BytesIO):
+    def seekable(self):
+        return False
+
+
+# ============================================================================
+class FileLoader(object):
+    def __init__(self, stream_cls=None):
+        self.stream_cls = stream_cls
+        self.loads = []
+
+    def load(self, url, offset=0, length=-1):
+        self.loads.append(offset)
+
+        fh = open(url, 'rb')
+        fh.seek(offset)
+
+        if self.stream_cls:
+            with fh:
+                return self.stream_cls(fh.read())
+
+        return fh
+
+
+# ============================================================================
+class TestSolrDerivs(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        self.user.create_new()
+
+        self.coll = self.user.create_collection('coll', title='coll')
+        self.recording = self.coll.create_recording()
+
+        self.pids = [self.coll.add_page(page, self.recording) for page in PAGES]
+
+        self.warc_path = os.path.join(self.temp_dir, 'text.warc.gz')
+        self.offsets = {}
+
+        self.write_warc()
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_warc(self):
+        def text_record(url, text):
+            return writer.create_warc_record(url, 'resource',
+                                             payload=BytesIO(text.encode('utf-8')),
+                                             warc_content_type='text/plain')
+
+        def image_record(url):
+            http_headers = StatusAndHeaders('200 OK', [('Content-Type', 'image/png')], protocol='HTTP/1.0')
+            return writer.create_warc_record(url, 'response',
+                                             payload=BytesIO(b'PNG'),
+                                             http_headers=http_headers)
+
+        with open(self.warc_path, 'wb') as fh:
+            writer = WARCWriter(fh, gzip=True)
+
+            # in different order than text keys
+            for name, record in (('text-2', text_record('urn:text:20180102000002/http://other.com/', 'Other Text')),
+                                 ('image', image_record('http://example.com/img.png')),
+                                 ('text-0', text_record('urn:text:20180102000000/http://example.com/', 'Example Text')),
+                                 ('text-1', text_record('urn:text:20180102000001/http://example.com/page', 'Page Text'))):
+                offset = fh.tell()
+                writer.write_record(record)
+                self.offsets[name] = (offset, fh.tell() - offset)
+
+        self.redis.hset(self.coll.get_warc_key(), 'text.warc.gz', self.warc_path)
+
+    def cdxj_line(self, urlkey, timestamp, url, mime, name, offset=None, length=None):
+        offset = offset if offset is not None else self.offsets[name][0]
+        length = length if length is not None else self.offsets[name][1]
+
+        return '{0} {1} {2}'.format(urlkey, timestamp, json.dumps({'url': url,
+                                                                   'mime': mime,
+                                                                   'offset': str(offset),
+                                                                   'length': str(length),
+                                                                   'filename': 'text.warc.gz'}))
+
+    def get_cdxj(self, bad=False):
+        lines = [self.cdxj_line('com,example)/img.png', '20180102000000', 'http://example.com/img.png', 'image/png', 'image'),
+                 self.cdxj_line('urn:text:20180102000000/http://example.com/', '20180102000000',
+                                'urn:text:20180102000000/http://example.com/', 'text/plain', 'text-0'),
+
+                 # truncated text key
+                 self.cdxj_line('urn:text:20180102000001/http://example.com/page', '20180102000001',
+                                'urn:text:20180102000001/http://example.com/page', 'text/plain', 'text-1'),
+                 self.cdxj_line('urn:text:20180102000002/http://other.com/', '20180102000002',
+                                'urn:text:20180102000002/http://other.com/', 'text/plain', 'text-2'),
+
+                 # no page
+                 self.cdxj_line('urn:text:20180102000003/http://missing.com/', '20180102000003',
+                                'urn:text:20180102000003/http://missing.com/', 'text/plain', 'text-2')]
+
+        if bad:
+            # not at start of a record
+            offset, length = self.offsets['image']
+            lines.append(self.cdxj_line('urn:text:20180102000000/http://example.com/', '20180102000004',
+                                        'urn:text:20180102000000/http://example.com/', 'text/plain', 'image',
+                                        offset=offset + 5, length=length - 5))
+
+        return [(line, None) for line in sorted(lines)]
+
+    def ingest(self, loader, cdxj):
+        solr_mgr = Mock()
+        solr_mgr.prepare_doc.side_effect = lambda params, text=None: (params, text)
+
+        with patch('webrecorder.models.collection.SolrManager', return_value=solr_mgr), \
+             patch('webrecorder.models.collection.load_wr_config', return_value={}), \
+             patch('webrecorder.models.collection.BlockLoader', return_value=loader), \
+             patch.object(self.coll, 'get_cdxj_iter', return_value=cdxj):
+            self.coll._ingest_stored_derivs()
+
+        return [doc for args in solr_mgr.batch_ingest.call_args_list for doc in args[0][0]]
+
+    def test_find_text_page(self):
+        pages = {'urn:text:{timestamp}/{url}'.format(**page): page for page in PAGES}
+        page_keys = sorted(pages.keys())
+
+        def find(urlkey):
+            page = self.coll._find_text_page(pages, page_keys, urlkey)
+            return page['title'] if page else None
+
+        assert find('urn:text:20180102000000/http://example.com/') == 'Example'
+
+        # by prefix
+        assert find('urn:text:20180102000001/http://example.com/page') == 'Page'
+        assert find('urn:text:20180102000002/http://other') == 'Other'
+
+        assert find('urn:text:20180102000001/http://example.com/other') is None
+        assert find('urn:text:20180102000003/http://other.com/') is None
+        assert find('urn:text:2') == 'Example'
+
+    def test_ingest_text_in_offset_order(self):
+        loader = FileLoader()
+
+        docs = self.ingest(loader, self.get_cdxj())
+
+        text_docs = [(params['pid'], params['title'], text) for params, text in docs if text is not None]
+
+        assert text_docs == [(self.pids[2], 'Other', b'Other Text'),
+                             (self.pids[0], 'Example', b'Example Text'),
+                             (self.pids[1], 'Page', b'Page Text')]
+
+        # all read from one stream
+        assert loader.loads == [self.offsets['text-2'][0]]
+
+        other_docs = [params['url'] for params, text in docs if text is None]
+        assert 'http://example.com/img.png' in other_docs
+
+        assert self.coll.get_bool_prop('indexing') is False
+
+    def test_skip_bad_record(self):
+        loader = FileLoader()
+
+        docs = self.ingest(loader, self.get_cdxj(bad=True))
+
+        text_docs = [params['title'] for params, text in docs if text is not None]
+        assert text_docs == ['Other', 'Example', 'Page']
+
+        # reopened after bad record
+        assert loader.loads == [self.offsets['text-2'][0], self.offsets['text-0'][0]]
+
+    def test_skip_or_reopen_unseekable(self):
+        entries = [(self.offsets[name][0], self.offsets[name][1], {'title': name})
+                   for name in ('text-2', 'text-0', 'text-1')]
+
+        def read_all(max_skip):
+            loader = FileLoader(NonSeekable)
+            with patch.object(Collection, 'SOLR_MAX_SKIP', max_skip):
+                res = [(page['title'], data) for page, data in self.coll._iter_text_records(loader, self.warc_path, entries)]
+
+            assert res == [('text-2', b'Other Text'), ('text-0', b'Example Text'), ('text-1', b'Page Text')]
+            return loader.loads
+
+        # read past image record
+        assert read_all(1024) == [self.offsets['text-2'][0]]
+
+        # gap too large, reopened
+        assert read_all(0) == [self.offsets['text-2'][0], self.offsets['text-0'][0]]
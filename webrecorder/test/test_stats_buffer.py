@@ -0,0 +1,107 @@
+from webrecorder.models.stats import Stats, StatsBuffer
+from webrecorder.utils import today_str
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+import gevent
+
+
+# ============================================================================
+@patch('webrecorder.models.stats.Stats.RATE_LIMIT_TTL', 3600)
+@patch('webrecorder.models.stats.Stats.BUFFER_FLUSH_MAX', 5)
+@patch('webrecorder.models.stats.Stats.BUFFER_FLUSH_MS', 50)
+@patch('webrecorder.models.stats.Stats.BUFFER_MODE', 'buffered')
+class TestStatsBuffer(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        Stats._buffer = None
+        self.stats = Stats(self.redis)
+
+    def teardown_method(self):
+        if Stats._buffer and Stats._buffer.flusher:
+            Stats._buffer.flusher.kill()
+
+        Stats._buffer = None
+
+    def get_stat(self, key):
+        return int(self.redis.hget(key, today_str()) or 0)
+
+    def record(self, size, user='user'):
+        params = {'param.user': user, 'param.ip': '127.0.0.1'}
+        self.stats.incr_record(params, size, [])
+
+    def test_merged_until_flush(self):
+        self.record(100)
+        self.record(50)
+        self.record(10, user='temp-abc')
+        self.stats.incr_replay(20, 'user')
+
+        # nothing written yet
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 0
+
+        buff = Stats._buffer
+        assert buff.hincrs[(Stats.ALL_CAPTURE_USER_KEY, today_str())] == 150
+
+        buff.flush()
+
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 150
+        assert self.get_stat(Stats.ALL_CAPTURE_TEMP_KEY) == 10
+        assert self.get_stat(Stats.REPLAY_USER_KEY) == 20
+
+        assert buff.num_events == 0
+        assert not buff.hincrs
+
+    def test_rate_limit_not_buffered(self):
+        self.record(100)
+        self.record(50)
+
+        rate_limit_key = self.stats.get_rate_limit_key({'param.ip': '127.0.0.1'})
+
+        # read back for rate limiting right away
+        assert self.redis.get(rate_limit_key) == '150'
+        assert 0 < self.redis.ttl(rate_limit_key) <= 3600
+
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 0
+
+    def test_flush_max(self):
+        for i in range(4):
+            self.record(1)
+
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 0
+
+        # fifth event reaches BUFFER_FLUSH_MAX
+        self.record(1)
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 5
+
+        assert Stats._buffer.flusher is None
+
+    def test_flush_timer(self):
+        self.record(100)
+
+        assert Stats._buffer.flusher
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 0
+
+        gevent.sleep(0.2)
+
+        assert self.get_stat(Stats.ALL_CAPTURE_USER_KEY) == 100
+        assert Stats._buffer.flusher is None
+
+    def test_delete_then_incr(self):
+        buff = StatsBuffer(self.redis, 10, 100)
+
+        self.redis.hset('dyn', 'a', 5)
+
+        buff.hincrby('dyn', 'a', 2)
+        buff.delete('dyn')
+        buff.hincrby('dyn', 'b', 1)
+        buff.expire('dyn', 60)
+        buff.add_event()
+
+        buff.flush()
+
+        # increments before delete dropped, after delete kept
+        assert self.redis.hgetall('dyn') == {'b': '1'}
+        assert 0 < self.redis.ttl('dyn') <= 60
@@ -3,7 +3,9 @@ from webrecorder.models.usermanager import CLIUserManager
 from webrecorder.utils import today_str
 
 import os
+import json
 import boto3
+import hashlib
 import pytest
 import base64
 import requests
@@ -12,6 +14,7 @@ from urllib.parse import urlsplit
 from itertools import count
 
 REC_CDXJ = 'r:500:cdxj'
+REC_MIME = 'r:500:mime'
 REC_WARC = 'r:500:warc'
 REC_INFO = 'r:500:info'
 COLL_ID = '100'
@@ -57,6 +60,7 @@ class BaseStorageCommit(FullStackTests):
         assert '"food": "bar"' in res.text, res.text
 
         self.sleep_try(0.3, 10.0, self.assert_exists(REC_CDXJ, True))
+        self.sleep_try(0.3, 10.0, self.assert_exists(REC_MIME, True))
 
     def test_record_2_temp(self):
         res = self.testapp.get('/_new/default-collection/rec/record/mp_/http://httpbin.org/get?food=bar')
@@ -94,6 +98,10 @@ class BaseStorageCommit(FullStackTests):
 
         self.sleep_try(0.1, 10.0, assert_user_dir_empty)
 
+        # open recording indexes removed once committed
+        self.sleep_try(0.2, 10.0, self.assert_exists(REC_CDXJ, False))
+        self.sleep_try(0.2, 10.0, self.assert_exists(REC_MIME, False))
+
         #coll, rec = self.get_coll_rec('test', 'test-migrate', '500')
         coll = '100'
         rec = '500'
@@ -137,6 +145,51 @@ class BaseStorageCommit(FullStackTests):
 
         self.assert_wasapi_locations(res.json['files'][0], verify_only=False)
 
+    def test_warc_checksum_stored(self):
+        warcs = self.redis.hgetall('c:{coll}:warc'.format(coll=COLL_ID))
+        checksums = self.redis.hgetall('c:{coll}:wsum'.format(coll=COLL_ID))
+
+        assert set(checksums.keys()) == set(warcs.keys())
+
+        params = {'user': 'test'}
+        res = self.testapp.get('/api/v1/download/webdata', params=params)
+        file_entry = res.json['files'][0]
+
+        downloaded = self.testapp.get(file_entry['locations'][-1])
+
+        value = json.loads(checksums[file_entry['filename']])
+
+        # computed when closed, before commit
+        assert value == {'kind': 'md5',
+                         'checksum': hashlib.md5(downloaded.body).hexdigest(),
+                         'size': len(downloaded.body)}
+
+        assert file_entry['checksums'] == {'md5': value['checksum']}
+        assert file_entry['size'] == value['size']
+
+    def test_wasapi_list_no_stored_checksum(self):
+        warc_sum_key = 'c:{coll}:wsum'.format(coll=COLL_ID)
+        checksums = self.redis.hgetall(warc_sum_key)
+
+        # committed before checksums were stored
+        self.redis.delete(warc_sum_key)
+
+        params = {'user': 'test'}
+        res = self.testapp.get('/api/v1/download/webdata', params=params)
+
+        file_entry = res.json['files'][0]
+        kind, check_sum = list(file_entry['checksums'].items())[0]
+
+        assert check_sum
+        assert file_entry['size'] == json.loads(checksums[file_entry['filename']])['size']
+
+        # stored on first listing
+        value = json.loads(self.redis.hget(warc_sum_key, file_entry['filename']))
+        assert (value['kind'], value['checksum'], value['size']) == (kind, check_sum, file_entry['size'])
+
+        self.redis.delete(warc_sum_key)
+        self.redis.hmset(warc_sum_key, checksums)
+
     def test_create_new_coll(self):
         # Collection
         params = {'title': 'Another Coll'}
@@ -174,6 +227,37 @@ class BaseStorageCommit(FullStackTests):
 
         self.sleep_try(0.1, 10.0, assert_user_dir_empty)
 
+    def test_wasapi_list_pages(self):
+        params = {'user': 'test', 'page_size': 1}
+        res = self.testapp.get('/api/v1/download/webdata', params=params)
+
+        assert res.json['count'] == 2
+        assert len(res.json['files']) == 1
+        assert res.json['previous'] is None
+        assert 'page=2' in res.json['next']
+        assert 'page_size=1' in res.json['next']
+
+        first = res.json['files'][0]['collection']
+
+        next_url = urlsplit(res.json['next'])
+        res = self.testapp.get(next_url.path + '?' + next_url.query)
+
+        assert res.json['count'] == 2
+        assert len(res.json['files']) == 1
+        assert res.json['next'] is None
+        assert 'page=1' in res.json['previous']
+
+        assert res.json['files'][0]['collection'] != first
+
+        params = {'user': 'test', 'page': 3, 'page_size': 1}
+        res = self.testapp.get('/api/v1/download/webdata', params=params)
+        assert res.json['files'] == []
+        assert res.json['count'] == 2
+
+        params = {'user': 'test', 'page': 0}
+        res = self.testapp.get('/api/v1/download/webdata', params=params, status=400)
+        assert res.json['error'] == 'invalid_page'
+
     def test_replay_2_copy(self):
         def assert_replay():
             res = self.testapp.get('/test/another-coll/mp_/http://httpbin.org/get?food=bar')
@@ -234,6 +318,11 @@ class TestLocalStorageCommit(BaseStorageCommit):
         result = self.redis.hgetall('c:{coll}:warc'.format(coll=COLL_ID))
         assert downloaded.headers['Content-Disposition'].startswith("attachment; filename*=UTF-8''" + list(result.keys())[0])
 
+        # resume partial download
+        partial = self.testapp.get(locations[0], headers={'Range': 'bytes=10-109'}, status=206)
+        assert partial.body == downloaded.body[10:110]
+        assert partial.headers['Content-Range'] == 'bytes 10-109/{0}'.format(len(downloaded.body))
+
 
 # ============================================================================
 class TestS3Storage(BaseStorageCommit):
@@ -563,6 +563,79 @@ class TestPlayerUpload(BaseWRTests):
         assert len(collection['pages']) == 2
         assert len(collection['lists']) == 2
 
+    def test_player_upload_dir_workers(self):
+        player_dir = os.path.join(self.warcs_dir, 'player_dir')
+        os.makedirs(player_dir, exist_ok=True)
+
+        with open(os.path.join(player_dir, 'sample.warc.gz'), 'wb') as fh:
+            TestUpload.warc.seek(0)
+            fh.write(TestUpload.warc.read())
+
+        with open(os.path.join(self.get_curr_dir(), 'warcs', 'example.com.gz.warc'), 'rb') as fh_in:
+            with open(os.path.join(player_dir, 'example.com.gz.warc'), 'wb') as fh:
+                fh.write(fh_in.read())
+
+        # index each file in its own worker process
+        with patch('os.cpu_count', lambda: 2):
+            with self.run_player(player_dir) as port:
+                self.sleep_try(0.5, 10.0, self.assert_finished(port))
+
+                res = requests.get('http://localhost:{0}/api/v1/collection/collection?user=local'.format(port))
+                data = res.json()
+
+                res = requests.get('http://localhost:{0}/local/collection/mp_/http://example.com/'.format(port))
+                assert 'Example Domain' in res.text, res.text
+
+        collection = data['collection']
+        assert len(collection['pages']) == 3
+
+    def test_player_upload_dir_index_cache(self):
+        player_dir = os.path.join(self.warcs_dir, 'player_cache_dir')
+        os.makedirs(player_dir, exist_ok=True)
+
+        cache_dir = os.path.join(self.warcs_dir, 'player_cache')
+        index_dir = os.path.join(cache_dir, 'index')
+
+        with open(os.path.join(player_dir, 'sample.warc.gz'), 'wb') as fh:
+            TestUpload.warc.seek(0)
+            fh.write(TestUpload.warc.read())
+
+        with self.run_player(player_dir, cache_dir=cache_dir) as port:
+            self.sleep_try(0.5, 10.0, self.assert_finished(port))
+
+        assert len(os.listdir(index_dir)) == 1
+        cache_file = os.path.join(index_dir, os.listdir(index_dir)[0])
+        cache_mod = os.path.getmtime(cache_file)
+
+        # add new archive, only new archive indexed, existing loaded from index cache
+        with open(os.path.join(self.get_curr_dir(), 'warcs', 'example.com.gz.warc'), 'rb') as fh_in:
+            with open(os.path.join(player_dir, 'example.com.gz.warc'), 'wb') as fh:
+                fh.write(fh_in.read())
+
+        with self.run_player(player_dir, cache_dir=cache_dir) as port:
+            self.sleep_try(0.5, 10.0, self.assert_finished(port))
+
+            res = requests.get('http://localhost:{0}/api/v1/collection/collection?user=local'.format(port))
+            data = res.json()
+
+            res = requests.get('http://localhost:{0}/local/collection/mp_/http://example.com/'.format(port))
+            assert 'Example Domain' in res.text, res.text
+
+        assert len(os.listdir(index_dir)) == 2
+        assert os.path.getmtime(cache_file) == cache_mod
+
+        assert len(data['collection']['pages']) == 3
+
+        # archive changed, indexed again, replacing its cache file
+        sample_path = os.path.join(player_dir, 'sample.warc.gz')
+        os.utime(sample_path, (cache_mod + 10, cache_mod + 10))
+
+        with self.run_player(player_dir, cache_dir=cache_dir) as port:
+            self.sleep_try(0.5, 10.0, self.assert_finished(port))
+
+        assert len(os.listdir(index_dir)) == 2
+        assert not os.path.isfile(cache_file)
+
     def test_player_upload_wget_warc(self, cache_dir):
         player_filename = os.path.join(self.get_curr_dir(), 'warcs', 'example.com.gz.warc')
 
@@ -0,0 +1,234 @@
+from webrecorder.models.importer import UploadImporter
+from webrecorder.rec.webrecrecorder import CDXJIndexer, WebRecRedisIndexer
+
+from pywb.indexer.cdxindexer import write_cdx_index
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from fakeredis import FakeStrictRedis
+from io import BytesIO
+from mock import patch, Mock
+
+import json
+import os
+import pytest
+import shutil
+import tempfile
+
+
+# ============================================================================
+def make_warc(recs):
+    buff = BytesIO()
+    writer = WARCWriter(buff, gzip=True)
+
+    def write_warcinfo(info):
+        warcinfo = writer.create_warcinfo_record('upload.warc.gz',
+                                                 {'software': 'Webrecorder Test',
+                                                  'json-metadata': json.dumps(info)})
+        writer.write_record(warcinfo)
+
+    write_warcinfo({'type': 'collection', 'title': 'Upload'})
+
+    for title, urls in recs:
+        write_warcinfo({'type': 'recording', 'title': title})
+
+        for url in urls:
+            payload = ('Content of ' + url).encode('utf-8')
+            http_headers = StatusAndHeaders('200 OK', [('Content-Type', 'text/html'),
+                                                       ('Content-Length', str(len(payload)))],
+                                            protocol='HTTP/1.0')
+
+            writer.write_record(writer.create_warc_record(url, 'response',
+                                                          payload=BytesIO(payload),
+                                                          http_headers=http_headers))
+
+    return buff.getvalue()
+
+
+# ============================================================================
+class FailingReader(BytesIO):
+    def __init__(self, data, fail_at, block_size=256):
+        super(FailingReader, self).__init__(data)
+        self.fail_at = fail_at
+        self.block_size = block_size
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_at:
+            raise IOError('Connection Lost')
+
+        return super(FailingReader, self).read(self.block_size)
+
+
+# ============================================================================
+class TestUploadSplit(object):
+    RECS = [('Rec 1', ['http://example.com/', 'http://example.com/a']),
+            ('Rec 2', ['http://example.com/b']),
+            ('Rec 3', ['http://example.com/c', 'http://example.com/d', 'http://example.com/e'])]
+
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.user = Mock()
+        self.user.name = 'test'
+
+        self.handled = []
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_importer(self, warc_path_templ='{user}/'):
+        importer = UploadImporter.__new__(UploadImporter)
+        importer.redis = self.redis
+        importer.wam_loader = None
+        importer.indexer = Mock()
+        importer.upload_exp = 0
+
+        importer.warc_dir_templ = self.temp_dir + '/' + warc_path_templ
+        importer.warc_name_templ = 'rec-{timestamp}-{hostname}-{random}.warc.gz'
+        return importer
+
+    def handle_upload(self, stream, upload_id, upload_key, infos, filename, *args):
+        self.handled.append(infos)
+        return {'upload_id': upload_id}
+
+    def upload(self, importer, stream, size, filename='upload.warc.gz', res=None):
+        with patch.object(importer, 'handle_upload', side_effect=self.handle_upload):
+            if res:
+                importer.handle_upload.side_effect = None
+                importer.handle_upload.return_value = res
+
+            return importer.upload_file_single_pass(self.user, stream, size, filename, '')
+
+    def written(self):
+        user_dir = os.path.join(self.temp_dir, 'test')
+        if not os.path.isdir(user_dir):
+            return []
+
+        return os.listdir(user_dir)
+
+    def urls(self, warc_path):
+        with open(warc_path, 'rb') as fh:
+            return [record.rec_headers.get_header('WARC-Target-URI')
+                    for record in ArchiveIterator(fh)]
+
+    def recorder_index(self, warc_path):
+        cdxout = BytesIO()
+        with open(warc_path, 'rb') as fh:
+            write_cdx_index(cdxout, fh, os.path.basename(warc_path),
+                            cdxj=True, append_post=True,
+                            writer_cls=CDXJIndexer)
+
+        return cdxout.getvalue().rstrip().split(b'\n')
+
+    def test_split_by_recording(self):
+        data = make_warc(self.RECS)
+
+        res = self.upload(self.get_importer(), BytesIO(data), len(data))
+        assert res['upload_id']
+
+        infos, = self.handled
+        assert [info['title'] for info in infos] == ['Upload', 'Rec 1', 'Rec 2', 'Rec 3']
+
+        recs = infos[1:]
+
+        # one file per recording, collection warcinfo not kept
+        assert 'warc_path' not in infos[0]
+        assert sorted(self.written()) == sorted(os.path.basename(info['warc_path']) for info in recs)
+
+        for info, (title, urls) in zip(recs, self.RECS):
+            assert self.urls(info['warc_path']) == urls
+            assert os.path.getsize(info['warc_path']) == info['length']
+
+        assert sum(info['length'] for info in recs) < len(data)
+
+    def test_cdxj_matches_recorder_index(self):
+        data = make_warc(self.RECS)
+
+        self.upload(self.get_importer(), BytesIO(data), len(data))
+
+        for info in self.handled[0][1:]:
+            # same lines, offsets relative to the recording WARC
+            assert info['cdx_list'] == self.recorder_index(info['warc_path'])
+
+    def test_upload_dir_with_coll_rec(self):
+        data = make_warc(self.RECS)
+
+        importer = self.get_importer('{user}/{coll}/{rec}/')
+        assert importer.get_upload_warc_dir(self.user) == self.temp_dir + '/test/'
+
+        self.upload(importer, BytesIO(data), len(data))
+
+        assert len(self.written()) == 3
+
+    def test_removed_on_error(self):
+        data = make_warc(self.RECS)
+
+        with patch('os.remove', wraps=os.remove) as remove:
+            with pytest.raises(IOError):
+                self.upload(self.get_importer(), FailingReader(data, len(data) // 2), len(data))
+
+        # recording files written before the error, then removed
+        removed = [args[0][0] for args in remove.call_args_list]
+        assert len([path for path in removed if os.path.dirname(path) == os.path.join(self.temp_dir, 'test')]) >= 2
+
+        assert self.written() == []
+        assert self.handled == []
+
+    def test_removed_on_incomplete_upload(self):
+        data = make_warc(self.RECS)
+
+        res = self.upload(self.get_importer(), BytesIO(data), len(data) + 100)
+        assert res == {'error': 'incomplete_upload', 'expected': len(data) + 100, 'actual': len(data)}
+
+        assert self.written() == []
+        assert self.handled == []
+
+    def test_removed_on_import_error(self):
+        data = make_warc(self.RECS)
+
+        res = self.upload(self.get_importer(), BytesIO(data), len(data), res={'error': 'too_large'})
+        assert res == {'error': 'too_large'}
+
+        assert self.written() == []
+
+    def test_har_upload(self):
+        har_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'warcs', 'example.com.har')
+
+        importer = self.get_importer()
+        importer._har2warc_temp_file = lambda filename: tempfile.SpooledTemporaryFile()
+
+        with open(har_file, 'rb') as fh:
+            self.upload(importer, fh, os.path.getsize(har_file), filename='example.com.har')
+
+        infos, = self.handled
+        assert [info['title'] for info in infos] == ['HAR Recording']
+
+        warc_path = infos[0]['warc_path']
+        assert self.written() == [os.path.basename(warc_path)]
+        assert self.urls(warc_path) == ['https://example.com/', 'https://example.com/',
+                                        'https://example.com/favicon.ico', 'https://example.com/favicon.ico']
+        assert infos[0]['cdx_list'] == self.recorder_index(warc_path)
+
+    def test_add_cdx_to_index(self):
+        indexer = WebRecRedisIndexer.__new__(WebRecRedisIndexer)
+        indexer.redis = self.redis
+        indexer.redis_key_template = 'r:{rec}:cdxj'
+        indexer.coll_cdxj_key = 'c:{coll}:cdxj'
+        indexer.info_keys = ['r:{rec}:info']
+        indexer.rec_info_key_templ = 'r:{rec}:info'
+        indexer.stats = Mock()
+
+        cdx_list = [b'com,example)/ 20180102000000 {"url": "http://example.com/"}',
+                    b'com,example)/a 20180102000001 {"url": "http://example.com/a"}']
+
+        indexer.add_cdx_to_index(cdx_list, {'param.coll': 'coll', 'param.rec': 'rec'}, 100)
+
+        assert self.redis.zrange('r:rec:cdxj', 0, -1) == [line.decode('utf-8') for line in cdx_list]
+
+        # size of recording WARC, not read again
+        assert self.redis.hget('r:rec:info', 'size') == '100'
+        assert not self.redis.exists('c:coll:cdxj')
@@ -0,0 +1,54 @@
+from webrecorder.load.wamloader import WAMLoader
+
+from mock import patch
+
+
+# ============================================================================
+class TestWAMLoader(object):
+    @classmethod
+    def setup_class(cls):
+        with patch('webrecorder.load.wamloader.WAMLoader.load_all', lambda self, path: None):
+            cls.wam_loader = WAMLoader()
+
+        cls.add_archive('ia', 'https://web.archive.org/web/{timestamp}id_/{url}')
+        cls.add_archive('ia-short', 'https://web.archive.org/{timestamp}id_/{url}')
+        cls.add_archive('ait', 'https://wayback.archive-it.org/{collection}/{timestamp}id_/{url}', collections=True)
+        cls.add_archive('ia-long', 'https://web.archive.org/web/2019/{url}')
+
+    @classmethod
+    def add_archive(cls, pk, replay_url, collections=None):
+        webarchive = {'name': pk,
+                      'apis': {'wayback': {'replay': {'raw': replay_url}}},
+                      'collections': collections}
+
+        assert cls.wam_loader.load_archive(pk, webarchive)
+
+    def test_find_archive(self):
+        res = self.wam_loader.find_archive_for_url('https://web.archive.org/web/2010id_/http://example.com/')
+        assert res == ('ia', '2010id_/example.com/', 'ia')
+
+    def test_find_archive_first_loaded_prefix(self):
+        # both 'ia' and longer 'ia-long' prefix match, first loaded is used
+        res = self.wam_loader.find_archive_for_url('http://web.archive.org/web/2019/http://example.com/')
+        assert res == ('ia', '2019/example.com/', 'ia')
+
+    def test_find_archive_collection(self):
+        res = self.wam_loader.find_archive_for_url('https://wayback.archive-it.org/123/2010id_/https://example.com/')
+        assert res == ('ait', '2010id_/example.com/', 'ait:123')
+
+    def test_no_archive(self):
+        assert self.wam_loader.find_archive_for_url('https://example.com/') is None
+        assert self.wam_loader.find_archive_for_url('https://web.archive.org') is None
+
+    def test_cached_and_reloaded(self):
+        url = 'https://example.com/archive/2010/http://example.com/'
+
+        assert self.wam_loader.find_archive_for_url(url) is None
+
+        # new archive clears cached lookups
+        self.add_archive('ex', 'https://example.com/archive/{timestamp}/{url}')
+
+        res = self.wam_loader.find_archive_for_url(url)
+        assert res == ('ex', '2010/example.com/', 'ex')
+
+        assert self.wam_loader.find_archive_for_url(url) is res
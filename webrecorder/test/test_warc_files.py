@@ -0,0 +1,139 @@
+from webrecorder.models import User, Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.rec.webrecrecorder import SkipCheckingMultiFileWARCWriter
+
+from fakeredis import FakeStrictRedis
+from pywb.utils.format import ParamFormatter
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+# ============================================================================
+class FakeIndexer(object):
+    def __init__(self, redis):
+        self.redis = redis
+
+    def add_warc_file(self, full_filename, params):
+        self.redis.hset(Recording.COLL_WARC_KEY.format(coll=params['param.recorder.coll']),
+                        os.path.basename(full_filename), full_filename)
+
+    def _get_rel_or_base_name(self, filename, params):
+        return os.path.basename(filename)
+
+
+# ============================================================================
+class TestWarcFiles(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        self.user = User(my_id='test',
+                         redis=self.redis,
+                         access=BaseAccess())
+
+        self.user.create_new()
+
+        self.coll = self.user.create_collection('coll', title='coll')
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def add_warc(self, recording, name):
+        self.redis.sadd(Recording.REC_WARC_KEY.format(rec=recording.my_id), name)
+        self.redis.hset(self.coll.get_warc_key(), name, '/warcs/' + name)
+
+    def get_params(self):
+        params = {'param.recorder.coll': self.coll.my_id}
+        params['_formatter'] = ParamFormatter(params, name='recorder')
+        return params
+
+    def get_writer(self):
+        return SkipCheckingMultiFileWARCWriter(dir_template=self.temp_dir,
+                                               dedup_index=FakeIndexer(self.redis),
+                                               redis=self.redis,
+                                               key_template='r:{rec}:info',
+                                               config={'warc_name_templ': 'rec-{timestamp}.warc.gz',
+                                                       'max_warc_size': 10000,
+                                                       'open_rec_ttl': 60,
+                                                       'skip_key_templ': 'us:{user}:s:{url}',
+                                                       'open_rec_key_templ': 'r:{rec}:open',
+                                                       'info_key_templ': {'user': 'u:{user}:info'}})
+
+    def test_get_warc_files(self):
+        committed = self.coll.create_recording()
+        ongoing = self.coll.create_recording()
+        closed = self.coll.create_recording()
+
+        self.add_warc(committed, 'b.warc.gz')
+        self.add_warc(committed, 'a.warc.gz')
+        self.add_warc(ongoing, 'c.warc.gz')
+        self.add_warc(closed, 'd.warc.gz')
+
+        # no path, not listed
+        self.redis.sadd(Recording.REC_WARC_KEY.format(rec=committed.my_id), 'missing.warc.gz')
+
+        self.redis.set(Recording.PENDING_COUNT_KEY.format(rec=ongoing.my_id), 2)
+        self.redis.zadd(Recording.CDXJ_KEY.format(rec=ongoing.my_id), 0, 'line')
+        self.redis.zadd(Recording.CDXJ_KEY.format(rec=closed.my_id), 0, 'line')
+
+        files = [(recording.my_id, is_committed, is_open, name, path)
+                 for recording, is_committed, is_open, name, path in self.coll.get_warc_files()]
+
+        expected = [(committed.my_id, True, False, 'a.warc.gz', '/warcs/a.warc.gz'),
+                    (committed.my_id, True, False, 'b.warc.gz', '/warcs/b.warc.gz'),
+                    (ongoing.my_id, False, True, 'c.warc.gz', '/warcs/c.warc.gz'),
+                    (closed.my_id, False, False, 'd.warc.gz', '/warcs/d.warc.gz')]
+
+        # ordered by recording, then name
+        assert files == sorted(expected)
+
+        # same state as read per recording
+        for recording, is_committed, is_open, name, path in self.coll.get_warc_files():
+            assert is_committed == recording.is_fully_committed()
+            assert is_open == (recording.get_pending_count() > 0)
+
+    def test_checksum_stored_on_close(self):
+        writer = self.get_writer()
+        params = self.get_params()
+
+        filename = os.path.join(self.temp_dir, 'rec.warc.gz')
+        fh = writer._open_file(filename, params)
+        fh.write(b'some data')
+        fh.flush()
+
+        warc_sum_key = Recording.COLL_WARC_SUM_KEY.format(coll=self.coll.my_id)
+        assert not self.redis.exists(warc_sum_key)
+
+        writer._close_file(fh)
+
+        assert json.loads(self.redis.hget(warc_sum_key, 'rec.warc.gz')) == {
+            'kind': 'md5',
+            'checksum': hashlib.md5(b'some data').hexdigest(),
+            'size': 9
+        }
+
+        assert self.coll.get_warc_checksums(['rec.warc.gz']) == {
+            'rec.warc.gz': ('md5', hashlib.md5(b'some data').hexdigest(), 9)
+        }
+
+    def test_no_checksum_for_removed_warc(self):
+        writer = self.get_writer()
+        params = self.get_params()
+
+        filename = os.path.join(self.temp_dir, 'rec.warc.gz')
+        fh = writer._open_file(filename, params)
+        fh.write(b'some data')
+
+        # removed with its recording before closed
+        self.redis.hdel(self.coll.get_warc_key(), 'rec.warc.gz')
+
+        writer._close_file(fh)
+
+        assert not self.redis.exists(Recording.COLL_WARC_SUM_KEY.format(coll=self.coll.my_id))
+        assert writer.open_warcs == {}
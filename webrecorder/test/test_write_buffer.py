@@ -0,0 +1,163 @@
+from webrecorder.models import Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.rec.webrecrecorder import TempWriteBuffer
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+
+# ============================================================================
+class TestTempWriteBuffer(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.recording = Recording(my_id='rec',
+                                   redis=self.redis,
+                                   access=BaseAccess())
+
+        self.redis.hset(self.recording.info_key, 'size', 0)
+        self.set_open(True)
+
+        self.now = 1000.0
+
+    def set_open(self, is_open):
+        open_rec_key = Recording.OPEN_REC_KEY.format(rec='rec')
+        if is_open:
+            self.redis.setex(open_rec_key, Recording.OPEN_REC_TTL, 1)
+        else:
+            self.redis.delete(open_rec_key)
+
+    def pending(self):
+        return (int(self.redis.get(Recording.PENDING_COUNT_KEY.format(rec='rec')) or 0),
+                int(self.redis.get(Recording.PENDING_SIZE_KEY.format(rec='rec')) or 0))
+
+    def get_buffer(self, flush_size=100, flush_secs=10):
+        return TempWriteBuffer(self.recording, 'response', 'http://example.com/',
+                               flush_size=flush_size, flush_secs=flush_secs)
+
+    def write(self, buff, data, secs=0):
+        self.now += secs
+        with patch('webrecorder.rec.webrecrecorder.time.time', return_value=self.now):
+            buff.write(data)
+
+    def test_first_write_flushed(self):
+        buff = self.get_buffer()
+        assert self.pending() == (1, 0)
+
+        self.write(buff, b'a' * 10)
+        assert self.pending() == (1, 10)
+
+        # coalesced
+        self.write(buff, b'a' * 10)
+        assert self.pending() == (1, 10)
+
+        buff.close()
+        assert self.pending() == (0, 0)
+
+    def test_flush_on_size(self):
+        buff = self.get_buffer(flush_size=50)
+
+        self.write(buff, b'a')
+        self.write(buff, b'a' * 30)
+        assert self.pending() == (1, 1)
+
+        self.write(buff, b'a' * 20)
+        assert self.pending() == (1, 51)
+
+        self.write(buff, b'a' * 49)
+        assert self.pending() == (1, 51)
+
+        buff.close()
+        assert self.pending() == (0, 0)
+
+    def test_flush_on_time(self):
+        buff = self.get_buffer(flush_secs=5)
+
+        self.write(buff, b'a')
+        self.write(buff, b'a', secs=4)
+        assert self.pending() == (1, 1)
+
+        self.write(buff, b'a', secs=1)
+        assert self.pending() == (1, 3)
+
+        buff.close()
+        assert self.pending() == (0, 0)
+
+    def test_open_checked_once(self):
+        open_rec_key = Recording.OPEN_REC_KEY.format(rec='rec')
+
+        with patch.object(self.redis, 'exists', wraps=self.redis.exists) as exists:
+            def num_checks():
+                return len([args for args in exists.call_args_list if args[0][0] == open_rec_key])
+
+            buff = self.get_buffer(flush_size=0)
+            assert num_checks() == 1
+
+            for i in range(5):
+                self.write(buff, b'a' * 10)
+
+            assert self.pending() == (1, 50)
+            assert num_checks() == 1
+
+            buff.close()
+
+        assert self.pending() == (0, 0)
+
+    def test_not_open(self):
+        self.set_open(False)
+
+        buff = self.get_buffer(flush_size=0)
+        self.write(buff, b'a' * 10)
+
+        buff.close()
+
+        # nothing added, nothing removed
+        assert not self.redis.exists(Recording.PENDING_COUNT_KEY.format(rec='rec'))
+        assert not self.redis.exists(Recording.PENDING_SIZE_KEY.format(rec='rec'))
+
+    def test_closed_while_writing(self):
+        buffs = [self.get_buffer(flush_size=25) for i in range(3)]
+        assert self.pending() == (3, 0)
+
+        for buff in buffs:
+            self.write(buff, b'a' * 10)
+            self.write(buff, b'a' * 10)
+
+        assert self.pending() == (3, 30)
+
+        # still removed on close
+        self.set_open(False)
+
+        for buff in buffs:
+            self.write(buff, b'a' * 20)
+
+        assert self.pending() == (3, 120)
+
+        # no later buffers counted
+        late = self.get_buffer()
+        self.write(late, b'a' * 10)
+        late.close()
+
+        for buff in buffs:
+            buff.close()
+
+        assert self.pending() == (0, 0)
+
+    def test_deleted_while_writing(self):
+        buff = self.get_buffer(flush_size=0)
+        self.write(buff, b'a' * 10)
+
+        # recording and its keys removed
+        self.redis.delete(self.recording.info_key,
+                          Recording.PENDING_COUNT_KEY.format(rec='rec'),
+                          Recording.PENDING_SIZE_KEY.format(rec='rec'))
+
+        self.write(buff, b'a' * 10)
+        assert self.pending() == (0, 10)
+
+        buff.close()
+
+        # not left behind for a recording with same id
+        assert not self.redis.exists(Recording.PENDING_COUNT_KEY.format(rec='rec'))
+        assert not self.redis.exists(Recording.PENDING_SIZE_KEY.format(rec='rec'))
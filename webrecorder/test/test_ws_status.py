@@ -0,0 +1,213 @@
+from webrecorder.websockcontroller import StatusBroadcaster, PubSubHub
+from webrecorder.models import Collection, Recording
+
+from fakeredis import FakeStrictRedis
+
+import gevent
+import gevent.event
+import gevent.queue
+import json
+
+
+# ============================================================================
+class FakeHandler(object):
+    def __init__(self, coll, rec=None, extract=False):
+        self.status_key = (coll, rec, extract, ())
+        self.statuses = []
+
+    def get_status_key(self):
+        return self.status_key
+
+    def push_status(self, status):
+        self.statuses.append(json.loads(status))
+
+
+# ============================================================================
+class FakePubSub(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.connection = object()
+        self.messages = gevent.queue.Queue()
+
+    def psubscribe(self, *patterns):
+        # confirmations arrive later, as with a real connection
+        def confirm():
+            for pattern in patterns:
+                self.messages.put({'type': 'psubscribe', 'pattern': None,
+                                   'channel': pattern, 'data': 1})
+
+            self.redis.subscribed.set()
+
+        gevent.spawn_later(0.1, confirm)
+
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+    def close(self):
+        pass
+
+
+# ============================================================================
+class FakePubSubRedis(object):
+    def __init__(self):
+        self.pubsubs = []
+        self.subscribed = gevent.event.Event()
+        self.published = []
+
+    def pubsub(self, **kwargs):
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    def publish(self, channel, data):
+        self.published.append((channel, data))
+
+        # only delivered once subscribed
+        if not self.subscribed.is_set():
+            return
+
+        for pubsub in self.pubsubs:
+            pubsub.messages.put({'type': 'pmessage', 'pattern': 'to_cbr_ps:*',
+                                 'channel': channel, 'data': data})
+
+
+# ============================================================================
+class TestStatusBroadcaster(object):
+    def setup_method(self):
+        self.redis = FakeStrictRedis(decode_responses=True)
+        self.redis.flushdb()
+
+        self.broadcaster = StatusBroadcaster(self.redis, None, 1)
+
+    def test_rec_size(self):
+        self.redis.hset(Recording.INFO_KEY.format(rec='r1'), 'size', '100')
+        self.redis.set(Recording.PENDING_SIZE_KEY.format(rec='r1'), '20')
+
+        handlers = [FakeHandler('c1', 'r1'), FakeHandler('c1', 'r1')]
+        self.broadcaster.broadcast(handlers)
+
+        for handler in handlers:
+            assert handler.statuses == [{'ws_type': 'status', 'size': 100, 'pending_size': 20}]
+
+    def test_extract_with_patch(self):
+        self.redis.hmset(Recording.INFO_KEY.format(rec='r1'), {'size': '100', 'patch_rec': 'p1'})
+        self.redis.hset(Recording.INFO_KEY.format(rec='p1'), 'size', '30')
+        self.redis.set(Recording.PENDING_SIZE_KEY.format(rec='p1'), '5')
+
+        handler = FakeHandler('c1', 'r1', extract=True)
+        self.broadcaster.broadcast([handler])
+
+        assert handler.statuses == [{'ws_type': 'status', 'size': 130, 'pending_size': 5}]
+
+    def test_coll_size(self):
+        self.redis.hset(Collection.INFO_KEY.format(coll='c1'), 'size', '500')
+
+        handler = FakeHandler('c1')
+        self.broadcaster.broadcast([handler])
+
+        assert handler.statuses == [{'ws_type': 'status', 'size': 500}]
+
+    def test_not_found(self):
+        self.redis.hset(Recording.INFO_KEY.format(rec='r1'), 'size', '100')
+
+        found = FakeHandler('c1', 'r1')
+        missing_rec = FakeHandler('c1', 'r2')
+        missing_coll = FakeHandler('c2')
+
+        self.broadcaster.broadcast([found, missing_rec, missing_coll])
+
+        assert found.statuses == [{'ws_type': 'status', 'size': 100, 'pending_size': 0}]
+        assert missing_rec.statuses == [{'ws_type': 'error', 'error': 'not_found'}]
+        assert missing_coll.statuses == [{'ws_type': 'error', 'error': 'not_found'}]
+
+
+# ============================================================================
+class TestPubSubHub(object):
+    def setup_method(self):
+        self.redis = FakePubSubRedis()
+        self.hub = PubSubHub(self.redis, ['to_cbr_ps:*', 'from_cbr_ps:*'])
+
+    def teardown_method(self):
+        if self.hub.greenlet:
+            self.hub.greenlet.kill()
+
+    def test_subscribe_does_not_wait(self):
+        queue = gevent.queue.Queue()
+
+        # returns before subscription is confirmed
+        assert self.hub.subscribe('to_cbr_ps:A', queue) is None
+        assert not self.redis.subscribed.is_set()
+
+        # published once confirmed, reply delivered
+        self.hub.publish('from_cbr_ps:A', 'cmd')
+        assert self.redis.published == []
+
+        self.redis.subscribed.wait(timeout=1)
+        assert self.redis.published == [('from_cbr_ps:A', 'cmd')]
+
+        self.redis.publish('to_cbr_ps:A', 'reply')
+        assert queue.get(timeout=1) == ('ps', 'reply')
+
+        # published right away once subscribed
+        self.hub.publish('from_cbr_ps:A', 'next')
+        assert self.redis.published[-1] == ('from_cbr_ps:A', 'next')
+
+        # single connection
+        assert len(self.redis.pubsubs) == 1
+
+    def test_fan_out(self):
+        queue_a_1 = gevent.queue.Queue()
+        queue_a_2 = gevent.queue.Queue()
+        queue_b = gevent.queue.Queue()
+
+        self.hub.subscribe('to_cbr_ps:A', queue_a_1)
+        self.hub.subscribe('to_cbr_ps:A', queue_a_2)
+        self.hub.subscribe('to_cbr_ps:B', queue_b)
+
+        assert self.hub.ready.wait(timeout=1)
+
+        self.redis.publish('to_cbr_ps:A', 'to-a')
+        self.redis.publish('to_cbr_ps:B', 'to-b')
+        self.redis.publish('to_cbr_ps:C', 'to-c')
+
+        assert queue_a_1.get(timeout=1) == ('ps', 'to-a')
+        assert queue_a_2.get(timeout=1) == ('ps', 'to-a')
+        assert queue_b.get(timeout=1) == ('ps', 'to-b')
+
+        gevent.sleep(0.1)
+        assert queue_a_1.empty()
+        assert queue_b.empty()
+
+        assert len(self.redis.pubsubs) == 1
+
+    def test_unsubscribe(self):
+        queue_1 = gevent.queue.Queue()
+        queue_2 = gevent.queue.Queue()
+
+        self.hub.subscribe('to_cbr_ps:A', queue_1)
+        self.hub.subscribe('to_cbr_ps:A', queue_2)
+
+        self.hub.unsubscribe('to_cbr_ps:A', queue_1)
+
+        assert self.hub.ready.wait(timeout=1)
+
+        self.redis.publish('to_cbr_ps:A', 'msg')
+
+        assert queue_2.get(timeout=1) == ('ps', 'msg')
+
+        gevent.sleep(0.1)
+        assert queue_1.empty()
+
+        self.hub.unsubscribe('to_cbr_ps:A', queue_2)
+        assert 'to_cbr_ps:A' not in self.hub.queues
+
+    def test_no_pubsub_support(self):
+        hub = PubSubHub(FakeStrictRedis(), ['to_cbr_ps:*'])
+
+        hub.subscribe('to_cbr_ps:A', gevent.queue.Queue())
+        hub.publish('from_cbr_ps:A', 'cmd')
+
+        # not subscribed, messages published right away
+        assert hub.ready.wait(timeout=1)
+        assert hub.pending == []
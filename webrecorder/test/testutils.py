@@ -67,6 +67,9 @@ class BaseWRTests(FakeRedisTests, TempDirTests, BaseTestClass):
 
         cls.set_nx_env('NO_REMOTE_BROWSERS', '1')
 
+        # tests check stats right after each request
+        cls.set_nx_env('STATS_BUFFER_MODE', 'exact')
+
         def load_wr_config():
             config = load_overlay_config('WR_CONFIG', 'pkg://webrecorder/config/wr.yaml', 'WR_USER_CONFIG', '')
             config['dyn_stats_key_templ'] = {
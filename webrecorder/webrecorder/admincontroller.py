@@ -13,7 +13,8 @@ from datetime import datetime
 from re import sub
 
 from webrecorder.basecontroller import BaseController, wr_api_spec
-from webrecorder.models import Stats, User
+from webrecorder.models import Stats, User, Collection
+from webrecorder.session import Session
 
 from datetime import datetime, timedelta
 
@@ -24,7 +25,9 @@ COLL_TABLE = 'Collections Public'
 TEMP_TABLE = 'Temp Table'
 
 ACTIVE_SESSIONS = 'Active Sessions'
+UNIQUE_SESSIONS = 'Unique Sessions'
 TOTAL_USERS = 'Total Users'
+TOTAL_TEMP_USERS = 'Total Temp Users'
 
 USER_CREATED =  'User-Created'
 USER_LOGINS = 'User-Logins-Any'
@@ -73,11 +76,15 @@ class AdminController(BaseController):
 
         'Num Temp Collections Added': Stats.TEMP_MOVE_COUNT_KEY,
         'Temp Collection Size Added': Stats.TEMP_MOVE_SIZE_KEY,
+
+        'Coll Index Cache Hits': Stats.CDXJ_CACHE_HIT_KEY,
+        'Coll Index Cache Misses': Stats.CDXJ_CACHE_MISS_KEY,
+        'Coll Index Cache Evictions': Stats.CDXJ_CACHE_EVICT_KEY,
     }
 
     CUSTOM_STATS = [
                     USER_TABLE, COLL_TABLE, TEMP_TABLE,
-                    ACTIVE_SESSIONS, TOTAL_USERS,
+                    ACTIVE_SESSIONS, UNIQUE_SESSIONS, TOTAL_USERS, TOTAL_TEMP_USERS,
                     USER_CREATED, USER_LOGINS, USER_LOGINS_100, USER_LOGINS_1000, USER_LOGINS_4000,
                     COLL_SIZES_CREATED, COLL_SIZES_UPDATED, COLL_SIZES_PUBLIC, COLL_SIZES_PUBLIC_W_LISTS,
                     COLL_COUNT, COLL_COUNT_PUBLIC, COLL_COUNT_PUBLIC_W_LISTS,
@@ -85,7 +92,8 @@ class AdminController(BaseController):
 
     CACHE_TTL = 600
     CACHE_USER_TABLE = 'stc:users'
-    CACHE_COLL_TABLE = 'stc:colls'
+
+    TABLE_BATCH_SIZE = 500
 
     def __init__(self, *args, **kwargs):
         super(AdminController, self).__init__(*args, **kwargs)
@@ -94,12 +102,8 @@ class AdminController(BaseController):
         self.default_user_desc = config['user_desc']
         self.user_usage_key = config['user_usage_key']
         self.temp_usage_key = config['temp_usage_key']
-        #self.temp_user_key = config['temp_prefix']
         self.tags_key = config['tags_key']
 
-        self.temp_user_key = 'u:{0}'.format(User.TEMP_PREFIX)
-        self.temp_user_search = 'u:{0}*:info'.format(User.TEMP_PREFIX)
-
         self.announce_list = os.environ.get('ANNOUNCE_MAILING_LIST_ENDPOINT', False)
 
         self.session_redis = kwargs.get('session_redis')
@@ -167,9 +171,15 @@ class AdminController(BaseController):
             if name == ACTIVE_SESSIONS:
                 return self.load_active_sessions(name)
 
+            elif name == UNIQUE_SESSIONS:
+                return self.load_unique_sessions(name, dates, timestamps)
+
             elif name == TOTAL_USERS:
                 return self.load_total_users(name)
 
+            elif name == TOTAL_TEMP_USERS:
+                return self.load_total_temp_users(name)
+
             elif name == USER_CREATED:
                 return self.load_user_stats(name, dates, timestamps, use_updated=False)
 
@@ -187,33 +197,32 @@ class AdminController(BaseController):
 
             elif name in COLL_COUNT:
                 # add 1 per collection
-                return self.load_coll_series(name, dates, timestamps, False,
-                                             lambda coll_data: 1)
+                return self.load_coll_series(name, dates, timestamps, False)
 
             elif name == COLL_COUNT_PUBLIC:
                 # add 1 per collection if public
                 return self.load_coll_series(name, dates, timestamps, False,
-                                             lambda coll_data: 1 if coll_data[6] == '1' else 0)
+                                             public_only=True)
 
             elif name == COLL_COUNT_PUBLIC_W_LISTS:
                 # add 1 per collection if public and has lists
                 return self.load_coll_series(name, dates, timestamps, False,
-                                             lambda coll_data: 1 if coll_data[6] == '1' and coll_data[7] > 0 else 0)
+                                             public_only=True, with_lists=True)
 
             elif name in (COLL_SIZES_CREATED, COLL_SIZES_UPDATED):
                 # add collection size
                 return self.load_coll_series(name, dates, timestamps, (name == COLL_SIZES_CREATED),
-                                             lambda coll_data: coll_data[2])
+                                             add_size=True)
 
             elif name == COLL_SIZES_PUBLIC:
                 # add collection size if public
                 return self.load_coll_series(name, dates, timestamps, False,
-                                             lambda coll_data: coll_data[2] if coll_data[6] == '1' else 0)
+                                             add_size=True, public_only=True)
 
             elif name == COLL_SIZES_PUBLIC_W_LISTS:
                 # add collection size if public and has lists
                 return self.load_coll_series(name, dates, timestamps, False,
-                                             lambda coll_data: coll_data[2] if coll_data[6] == '1' and coll_data[7] > 0 else 0)
+                                             add_size=True, public_only=True, with_lists=True)
 
             return self.load_time_series(name, dates, timestamps)
 
@@ -257,10 +266,10 @@ class AdminController(BaseController):
 
         users = []
 
-        for user_key in self.redis.scan_iter(self.temp_user_search, count=100):
-            user_data = self.redis.hmget(user_key, column_keys)
-            user_data.insert(0, user_key.split(':')[1])
-            user_data[1] = int(user_data[1])
+        temp_user_ids = self.redis.zrange(User.TEMP_USERS_KEY, 0, -1)
+
+        for user_data in self.fetch_rows(User, temp_user_ids, column_keys):
+            user_data[1] = int(user_data[1] or 0)
             user_data[2] = self.parse_iso_or_ts(user_data[2])
             user_data[3] = self.parse_iso_or_ts(user_data[3])
 
@@ -282,10 +291,23 @@ class AdminController(BaseController):
                 'datapoints': datapoints
                }
 
-    def load_active_sessions(self, key):
+    def load_total_temp_users(self, key):
         ts = int(datetime.utcnow().timestamp()) * 1000
 
-        num_sessions = sum(1 for i in self.session_redis.scan_iter('sesh:*', count=10))
+        num_users = self.redis.zcard(User.TEMP_USERS_KEY)
+
+        datapoints = [[num_users, ts]]
+
+        return {'target': key,
+                'datapoints': datapoints
+               }
+
+    def load_active_sessions(self, key):
+        now = datetime.utcnow().timestamp()
+        ts = int(now) * 1000
+
+        # sessions not yet expired
+        num_sessions = self.session_redis.zcount(Session.ACTIVE_SESSIONS_KEY, now, '+inf')
 
         datapoints = [[num_sessions, ts]]
 
@@ -293,6 +315,84 @@ class AdminController(BaseController):
                 'datapoints': datapoints
                }
 
+    def load_unique_sessions(self, key, dates, timestamps):
+        pi = self.session_redis.pipeline(transaction=False)
+        for dt in dates:
+            pi.pfcount(Session.UNIQUE_SESSIONS_KEY.format(dt))
+
+        date_bucket = dict(zip(dates, pi.execute()))
+
+        return self.get_series(key, date_bucket, dates, timestamps)
+
+    def fetch_rows(self, comp_cls, ids, column_keys, count_key_templ=None):
+        """Read columns of each component info, in pipelined batches.
+
+        :param type comp_cls: component class
+        :param list ids: component ids
+        :param list column_keys: info fields to read
+        :param count_key_templ: sorted set to also add size of, if any
+        :type: str or None
+
+        :returns: id and column values per component
+        :rtype: list
+        """
+        rows = []
+
+        for i in range(0, len(ids), self.TABLE_BATCH_SIZE):
+            batch = ids[i:i + self.TABLE_BATCH_SIZE]
+
+            pi = self.redis.pipeline(transaction=False)
+            for my_id in batch:
+                params = {comp_cls.MY_TYPE: my_id}
+                pi.hmget(comp_cls.INFO_KEY.format_map(params), column_keys)
+                if count_key_templ:
+                    pi.zcard(count_key_templ.format_map(params))
+
+            results = pi.execute()
+            step = 2 if count_key_templ else 1
+
+            for j, my_id in enumerate(batch):
+                row = [my_id] + results[j * step]
+                if count_key_templ:
+                    row.append(results[j * step + 1])
+
+                rows.append(row)
+
+        return rows
+
+    def range_by_dates(self, index_key, timestamps):
+        """Return members of index with timestamp in the range
+        of the given days.
+
+        :param str index_key: sorted set by timestamp
+        :param list timestamps: start of each day, in ms
+
+        :returns: member and day for each member in range
+        :rtype: list
+        """
+        if not timestamps:
+            return []
+
+        min_ts = timestamps[0] / 1000
+        max_ts = timestamps[-1] / 1000 + 24 * 60 * 60
+
+        results = self.redis.zrangebyscore(index_key, min_ts, '(' + str(max_ts),
+                                           withscores=True)
+
+        # note: ts should already be utc!
+        return [(member, datetime.fromtimestamp(score).date().isoformat())
+                for member, score in results]
+
+    def get_series(self, key, date_bucket, dates, timestamps):
+        datapoints = []
+        for dt, ts in zip(dates, timestamps):
+            count = date_bucket.get(dt, 0)
+            datapoints.append((count, ts))
+
+        return {'target': key,
+                'datapoints': datapoints
+               }
+
     # USER TABLE
     def fetch_user_table(self):
         users = self.redis.get(self.CACHE_USER_TABLE)
@@ -301,18 +401,14 @@ class AdminController(BaseController):
 
         column_keys = ['size', 'max_size', 'last_login', 'created_at', 'updated_at', 'role', 'email_addr']
 
-        users = []
-
-        for user_key in self.redis.scan_iter(User.INFO_KEY.format(user='*'), count=100):
-            if user_key.startswith(self.temp_user_key):
-                continue
+        user_ids = self.redis.zrange(User.INDEX_KEYS['created_at'], 0, -1)
 
-            user_data = self.redis.hmget(user_key, column_keys)
+        users = []
 
-            user_data.insert(0, user_key.split(':')[1])
-            user_data[1] = int(user_data[1])
-            user_data[2] = int(user_data[2])
-            user_data.insert(3, 100.0 * user_data[1] / user_data[2])
+        for user_data in self.fetch_rows(User, user_ids, column_keys):
+            user_data[1] = int(user_data[1] or 0)
+            user_data[2] = int(user_data[2] or 0)
+            user_data.insert(3, 100.0 * user_data[1] / user_data[2] if user_data[2] else 0.0)
             user_data[4] = self.parse_iso_or_ts(user_data[4])
             user_data[5] = self.parse_iso_or_ts(user_data[5])
             user_data[6] = self.parse_iso_or_ts(user_data[6])
@@ -342,63 +438,44 @@ class AdminController(BaseController):
                }
 
     def load_user_stats(self, key, dates, timestamps, size_threshold=None, use_updated=True):
-        date_bucket = {}
+        # updated date vs created date
+        if use_updated:
+            index_key = User.INDEX_KEYS['updated_at']
+        else:
+            index_key = User.INDEX_KEYS['created_at']
 
-        for user_data in self.fetch_user_table():
-            if size_threshold is not None and user_data[1] < size_threshold:
-                continue
+        users = self.range_by_dates(index_key, timestamps)
 
-            # updated date vs created date
-            if use_updated:
-                value = user_data[6]
-            else:
-                value = user_data[5]
+        if size_threshold is not None:
+            min_size_users = set(self.redis.zrangebyscore(User.INDEX_KEYS['size'],
+                                                          size_threshold, '+inf'))
 
-            # note: ts should already be utc!
-            dt = datetime.fromtimestamp(value / 1000)
-            dt = dt.date().isoformat()
+            users = [(user, dt) for user, dt in users if user in min_size_users]
 
-            date_bucket[dt] = date_bucket.get(dt, 0) + 1
+        date_bucket = {}
 
-        datapoints = []
-        for dt, ts in zip(dates, timestamps):
-            count = date_bucket.get(dt, 0)
-            datapoints.append((count, ts))
+        for user, dt in users:
+            date_bucket[dt] = date_bucket.get(dt, 0) + 1
 
-        return {'target': key,
-                'datapoints': datapoints
-               }
+        return self.get_series(key, date_bucket, dates, timestamps)
 
     # COLL TABLE
-    def fetch_coll_table(self):
-        colls = self.redis.get(self.CACHE_COLL_TABLE)
-        if colls:
-            return json.loads(colls)
-
+    def fetch_coll_table(self, coll_ids):
         column_keys = ['slug', 'title', 'size', 'owner', 'created_at', 'updated_at', 'public']
 
         colls = []
 
-        for coll_key in self.redis.scan_iter('c:*:info', count=100):
-            coll_data = self.redis.hmget(coll_key, column_keys)
+        for coll_data in self.fetch_rows(Collection, coll_ids, column_keys,
+                                         Collection.LISTS_KEY):
+            # id not included in table
+            coll_data.pop(0)
 
-            # exclude temp user collections
-            try:
-                user = self.user_manager.all_users[coll_data[3]]
-                if user.is_anon():
-                    continue
-            except:
-                continue
-
-            coll_data[2] = int(coll_data[2])
+            coll_data[2] = int(coll_data[2] or 0)
             coll_data[4] = self.parse_iso_or_ts(coll_data[4])
             coll_data[5] = self.parse_iso_or_ts(coll_data[5])
-            coll_data.append(self.redis.zcard(coll_key.replace(':info', ':lists')))
 
             colls.append(coll_data)
 
-        self.redis.setex(self.CACHE_COLL_TABLE, self.CACHE_TTL, json.dumps(colls))
-
         return colls
 
     def load_coll_table(self):
@@ -413,37 +490,50 @@ class AdminController(BaseController):
             {'text': 'Num Lists', 'type': 'number'},
         ]
 
-        public_colls = [row for row in self.fetch_coll_table() if row[6] == '1']
+        public_coll_ids = self.redis.zrangebyscore(Collection.INDEX_KEYS['public'], 1, 1)
 
         return {'columns': columns,
-                'rows': public_colls,
+                'rows': self.fetch_coll_table(public_coll_ids),
                 'type': 'table'
                }
 
-    def load_coll_series(self, key, dates, timestamps, use_created_date, incr_func):
-        date_bucket = {}
-
+    def load_coll_series(self, key, dates, timestamps, use_created_date,
+                         add_size=False, public_only=False, with_lists=False):
         if use_created_date:
-            index = 4
+            index_key = Collection.INDEX_KEYS['created_at']
         else:
-            index = 5
+            index_key = Collection.INDEX_KEYS['updated_at']
 
-        for coll_data in self.fetch_coll_table():
-            # note: ts should already be utc!
-            dt = datetime.fromtimestamp(coll_data[index] / 1000)
-            dt = dt.date().isoformat()
+        colls = self.range_by_dates(index_key, timestamps)
 
-            #date_bucket[dt] = date_bucket.get(dt, 0) + (coll_data[2] if not count_only else 1)
-            date_bucket[dt] = date_bucket.get(dt, 0) + incr_func(coll_data)
+        if public_only:
+            public_colls = set(self.redis.zrangebyscore(Collection.INDEX_KEYS['public'], 1, 1))
 
-        datapoints = []
-        for dt, ts in zip(dates, timestamps):
-            count = date_bucket.get(dt, 0)
-            datapoints.append((count, ts))
+            colls = [(coll, dt) for coll, dt in colls if coll in public_colls]
 
-        return {'target': key,
-                'datapoints': datapoints
-               }
+        if with_lists:
+            pi = self.redis.pipeline(transaction=False)
+            for coll, dt in colls:
+                pi.exists(Collection.LISTS_KEY.format(coll=coll))
+
+            colls = [coll_dt for coll_dt, has_lists in zip(colls, pi.execute()) if has_lists]
+
+        if add_size:
+            pi = self.redis.pipeline(transaction=False)
+            for coll, dt in colls:
+                pi.zscore(Collection.INDEX_KEYS['size'], coll)
+
+            values = [int(size or 0) for size in pi.execute()]
+        else:
+            # add 1 per collection
+            values = [1] * len(colls)
+
+        date_bucket = {}
+
+        for (coll, dt), value in zip(colls, values):
+            date_bucket[dt] = date_bucket.get(dt, 0) + value
+
+        return self.get_series(key, date_bucket, dates, timestamps)
 
     @classmethod
     def parse_iso_or_ts(self, value):
@@ -571,13 +661,9 @@ class AdminController(BaseController):
         def temp_users():
             """ Resource returning active temp users
             """
-            temp_user_keys = list(self.redis.scan_iter(self.temp_user_search))
-
             temp_user_data = []
 
-            for user_key in temp_user_keys:
-                username = user_key.split(':')[1]
-
+            for username in self.redis.zrange(User.TEMP_USERS_KEY, 0, -1):
                 user = self.user_manager.all_users[username]
                 if not user or not user.get_prop('created_at'):
                     continue
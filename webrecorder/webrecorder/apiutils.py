@@ -93,6 +93,7 @@ class WRAPISpec(object):
         'page_id': 'Page Id',
         'upload_id': 'Upload Id',
         'filename': 'File Name',
+        'since': 'Min Timestamp (inclusive), or timestamp prefix',
     }
 
     opt_bool_params = {
@@ -115,7 +116,27 @@ class WRAPISpec(object):
         'order': {'type': 'array',
                   'items': {'type': 'string'},
                   'description': 'an array of existing ids in new order'
-                  }
+                  },
+
+        'page': {'type': 'integer',
+                 'description': 'Page number, starting at 1'
+                 },
+
+        'page_size': {'type': 'integer',
+                      'description': 'Max number of results per page'
+                      },
+
+        'cursor': {'type': 'integer',
+                   'description': 'Offset of first result, cursor from previous response'
+                   },
+
+        'limit': {'type': 'integer',
+                  'description': 'Max number of results, all if not set'
+                  },
+
+        'pages_limit': {'type': 'integer',
+                        'description': 'Max number of pages in response, all if not set'
+                        },
     }
 
     all_responses = {
@@ -144,6 +165,9 @@ class WRAPISpec(object):
                                     }
                                 }
                             },
+                            'count': {'type': 'integer'},
+                            'next': {'type': 'string', 'nullable': True},
+                            'previous': {'type': 'string', 'nullable': True},
                             'include-extra': {'type': 'boolean'}
                         }
                     }
@@ -1,3 +1,5 @@
+import base64
+import json
 import os
 
 from bottle import request, HTTPError, redirect as bottle_redirect, response
@@ -279,6 +281,40 @@ class BaseController(object):
             res = default
         return res
 
+    def get_cursor_limit(self):
+        """Return optional paging params, cursor (offset of next result)
+        and limit (0 if unlimited)"""
+        try:
+            cursor = int(request.query.get('cursor', 0))
+            limit = int(request.query.get('limit', 0))
+            assert cursor >= 0 and limit >= 0
+        except (ValueError, AssertionError):
+            self._raise_error(400, 'invalid_limit_or_cursor')
+
+        return cursor, limit
+
+    def get_pos_cursor_limit(self):
+        """Return optional paging params, cursor (position of last result,
+        as encoded by encode_pos_cursor, None if first page)
+        and limit (0 if unlimited)"""
+        try:
+            pos = None
+            cursor = request.query.get('cursor')
+            if cursor:
+                pos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+                assert isinstance(pos, list) and pos
+
+            limit = int(request.query.get('limit', 0))
+            assert limit >= 0
+        except (ValueError, TypeError, AssertionError):
+            self._raise_error(400, 'invalid_limit_or_cursor')
+
+        return pos, limit
+
+    def encode_pos_cursor(self, pos):
+        """Return opaque cursor for position of last result"""
+        return base64.urlsafe_b64encode(json.dumps(pos).encode('utf-8')).decode('ascii')
+
     def get_host(self):
         return request.urlparts.scheme + '://' + request.urlparts.netloc
 
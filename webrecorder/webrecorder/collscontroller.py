@@ -3,6 +3,7 @@ from bottle import request, response
 from six.moves.urllib.parse import quote
 import os
 import datetime
+import itertools
 
 from warcio.timeutils import iso_date_to_datetime
 
@@ -12,7 +13,6 @@ from webrecorder.webreccork import ValidationException
 from webrecorder.models.base import DupeNameException
 from webrecorder.models.datshare import DatShare
 from webrecorder.utils import get_bool
-from pywb.warcserver.index.cdxobject import CDXObject
 
 
 # ============================================================================
@@ -109,12 +109,18 @@ class CollsController(BaseController):
             return {'collections': [coll.serialize(**kwargs) for coll in collections]}
 
         @self.app.get('/api/v1/collection/<coll_name>')
-        @self.api(query=['user', 'shallow'],
+        @self.api(query=['user', 'shallow', 'pages_limit'],
                   resp='collection')
         def get_collection(coll_name):
             user = self.get_user(api=True, redir_check=False)
             shallow = get_bool(request.query.get('shallow'))
 
+            try:
+                pages_limit = int(request.query.get('pages_limit', 0))
+                assert pages_limit >= 0
+            except (ValueError, AssertionError):
+                self._raise_error(400, 'invalid_limit_or_cursor')
+
             if shallow:
                 user, coll = self.load_user_coll(user=user, coll_name=coll_name)
                 return {
@@ -127,7 +133,7 @@ class CollsController(BaseController):
                     )
                 }
             else:
-                return self.get_collection_info(coll_name, user=user)
+                return self.get_collection_info(coll_name, user=user, pages_limit=pages_limit)
 
 
         @self.app.delete('/api/v1/collection/<coll_name>')
@@ -238,6 +244,31 @@ class CollsController(BaseController):
 
             return {'page_bookmarks': collection.get_all_page_bookmarks(rec_pages)}
 
+        @self.app.get('/api/v1/collection/<coll_name>/pages')
+        @self.api(query=['user', '?rec', '?since', 'cursor', 'limit'],
+                  resp='pages')
+        def list_pages(coll_name):
+            user, collection = self.load_user_coll(coll_name=coll_name)
+
+            self.access.assert_can_read_coll(collection)
+
+            # same as collection serialize, pages only listed for owner or public index
+            if not self.access.is_coll_owner(collection) and not collection.get_bool_prop('public_index', False):
+                self._raise_error(404, 'no_such_collection')
+
+            cursor, limit = self.get_cursor_limit()
+
+            pages, next_cursor = collection.list_pages_range(rec=request.query.get('rec'),
+                                                             since=request.query.get('since'),
+                                                             cursor=cursor,
+                                                             limit=limit)
+
+            data = {'pages': pages}
+            if next_cursor is not None:
+                data['cursor'] = next_cursor
+
+            return data
+
         @self.app.get('/api/v1/url_search')
         def do_url_search():
             user, collection = self.load_user_coll()
@@ -245,11 +276,8 @@ class CollsController(BaseController):
             if not self.access.check_read_access_public(collection):
                 self._raise_error(404, 'no_such_collection')
 
-            results = []
-
             search = request.query.getunicode('search', '').lower()
             url_query = request.query.getunicode('url', '').lower()
-            has_query = search or url_query
             ts_from = request.query.getunicode('from')
             ts_to = request.query.getunicode('to')
             date_filter = ts_from and ts_to
@@ -261,8 +289,16 @@ class CollsController(BaseController):
                 except ValueError:
                     date_filter = False
 
+            if not date_filter:
+                ts_from = None
+                ts_to = None
+
             session = request.query.getunicode('session')
 
+            after, limit = self.get_pos_cursor_limit()
+            if after and len(after) != {'p': 3, 'm': 4, 's': 2}.get(str(after[0])):
+                self._raise_error(400, 'invalid_limit_or_cursor')
+
             # remove trailing comma,
             mimes = request.query.getunicode('mime', '').rstrip(',')
             mimes = mimes.split(',') if mimes else []
@@ -270,69 +306,39 @@ class CollsController(BaseController):
             mimes = [mime.strip('*') for mime in mimes]
 
             # search pages or default to page search if no mime supplied
-            if 'text/html' in mimes or len(mimes) == 0:
-                try:
-                    mimes.remove('text/html')
-                except ValueError:
-                    pass
-
-                # shortcut empty search
-                if not has_query and not date_filter and not session:
-                    results = collection.list_pages()
-                else:
-                    for page in collection.list_pages():
-                        # check for legacy hidden flag
-                        if page.get('hidden', False):
-                            continue
-
-                        if date_filter:
-                            try:
-                                # trim seconds
-                                ts = int(page['timestamp'][:12])
-                            except ValueError:
-                                continue
-                            if ts < ts_from or ts > ts_to:
-                                continue
-
-                        if session and page['rec'] != session:
-                            continue
-
-                        if search and search not in page.get('title', '').lower():
-                            continue
-
-                        if url_query and url_query not in page['url'].lower():
-                            continue
-
-                        results.append(page)
-
-            # search non-page cdx
-            if len(mimes):
-                for line, _ in collection.get_cdxj_iter():
-                    cdxj = CDXObject(line.encode('utf-8'))
-
-                    if date_filter:
-                        try:
-                            # trim seconds
-                            ts = int(cdxj['timestamp'][:12])
-                        except ValueError:
-                            continue
-                        if ts < ts_from or ts > ts_to:
-                            continue
-
-                    if search and search not in cdxj['url'].lower():
-                        continue
-
-                    if url_query and url_query not in cdxj['url'].lower():
-                        continue
-
-                    if mimes and not any(cdxj['mime'].startswith(mime) for mime in mimes):
-                        continue
-
-                    results.append({'url': cdxj['url'],
-                                    'timestamp': cdxj['timestamp'],
-                                    'mime': cdxj['mime']})
-
-            return {'results': results}
+            search_pages = 'text/html' in mimes or len(mimes) == 0
+            if search_pages:
+                mimes = [mime for mime in mimes if mime != 'text/html']
+
+            def iter_results():
+                """ yield position and result, pages first, resuming
+                after position of last result on previous page
+                """
+                if search_pages and (not after or after[0] == 'p'):
+                    for page in collection.search_pages(search, url_query,
+                                                        ts_from, ts_to,
+                                                        session,
+                                                        after=after[1:] if after else None):
+
+                        pos = ['p', collection.get_page_ts_score(page.get('timestamp', '')), page['id']]
+                        yield pos, page
+
+                # search non-page cdx
+                if len(mimes):
+                    yield from collection.search_cdxj(mimes, search, url_query,
+                                                      ts_from, ts_to,
+                                                      after=after if after and after[0] != 'p' else None)
+
+            if not limit:
+                return {'results': [result for pos, result in iter_results()]}
+
+            results = list(itertools.islice(iter_results(), limit + 1))
+
+            data = {'results': [result for pos, result in results[:limit]]}
+            if len(results) > limit:
+                data['cursor'] = self.encode_pos_cursor(results[limit - 1][0])
+
+            return data
 
         @self.app.get('/api/v1/text_search')
         def do_text_search():
@@ -429,13 +435,14 @@ class CollsController(BaseController):
 
         return result
 
-    def get_collection_info(self, coll_name, user=None, include_pages=False):
+    def get_collection_info(self, coll_name, user=None, include_pages=False, pages_limit=0):
         user, coll = self.load_user_coll(user=user, coll_name=coll_name)
 
         result = {'collection': coll.serialize(include_rec_pages=include_pages,
                                                      include_lists=True,
                                                      include_recordings=True,
                                                      include_pages=True,
+                                                     pages_limit=pages_limit,
                                                      check_slug=coll_name)}
 
         result['user'] = user.my_id
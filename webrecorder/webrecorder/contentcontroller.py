@@ -1,6 +1,9 @@
 import re
 import os
 import json
+import time
+
+from collections import OrderedDict
 
 from six.moves.urllib.parse import quote, unquote, urlencode
 
@@ -20,6 +23,7 @@ from webrecorder.basecontroller import BaseController, wr_api_spec
 from webrecorder.load.wamloader import WAMLoader
 from webrecorder.utils import get_bool
 
+from webrecorder.models import User, Collection
 from webrecorder.models.dynstats import DynStats
 from webrecorder.models.stats import Stats
 
@@ -34,6 +38,8 @@ class ContentController(BaseController, RewriterApp):
 
     BUNDLE_PREFIX = '/static/bundle/'
 
+    PUBLIC_COLLS_MAX = 1000
+
     def __init__(self, *args, **kwargs):
         BaseController.__init__(self, *args, **kwargs)
 
@@ -70,6 +76,11 @@ class ContentController(BaseController, RewriterApp):
 
         self.dyn_stats = DynStats(self.redis, config)
 
+        # (user, coll name) -> (coll id, expire time) of public collections
+        # recently replayed on content host, least recently used first
+        self.public_colls = OrderedDict()
+        self.public_colls_secs = int(config.get('public_replay_cache_secs', 0))
+
     def _init_client_archive_info(self):
         self.client_archives = {}
         for pk, archive in self.wam_loader.replay_info.items():
@@ -484,7 +495,7 @@ class ContentController(BaseController, RewriterApp):
             recording = info['recording']
 
             if kwargs['type'] == 'replay-coll':
-                collection.sync_coll_index(exists=False, do_async=False)
+                collection.sync_replay_index()
 
             url = self.add_query(url)
 
@@ -715,7 +726,26 @@ class ContentController(BaseController, RewriterApp):
         frontend_cache_header = None
         patch_recording = None
 
-        the_user, collection, recording = self.user_manager.get_user_coll_rec(user, coll_name, rec_name)
+        public_coll = None
+        if sesh.replay_only and type in ('replay-coll', 'replay'):
+            public_coll = self._get_public_coll(user, coll_name)
+
+        if public_coll:
+            # recently checked public collection, skip lookups and access check
+            the_user = User(my_id=user,
+                            redis=self.redis,
+                            access=self.access)
+
+            collection = Collection(my_id=public_coll,
+                                    name=coll_name,
+                                    redis=self.redis,
+                                    access=self.access)
+            collection.owner = the_user
+
+            recording = collection.get_recording(rec_name) if type == 'replay' else None
+
+        else:
+            the_user, collection, recording = self.user_manager.get_user_coll_rec(user, coll_name, rec_name)
 
         if not the_user:
             msg = 'not_found' if user == 'api' else 'no_such_user'
@@ -765,7 +795,13 @@ class ContentController(BaseController, RewriterApp):
                 else:
                     self._raise_error(404, 'no_such_collection')
 
-            access = self.access.check_read_access_public(collection)
+            if public_coll:
+                access = 'public'
+            else:
+                access = self.access.check_read_access_public(collection)
+
+                if access == 'public' and self.is_content_request():
+                    self._set_public_coll(user, coll_name, collection.my_id)
 
             if not access:
                 if sesh.is_new() and self.is_content_request():
@@ -800,7 +836,7 @@ class ContentController(BaseController, RewriterApp):
                 return self.redirect(new_url)
 
         elif type == 'replay-coll' and not is_top_frame:
-            collection.sync_coll_index(exists=False, do_async=False)
+            collection.sync_replay_index()
 
         kwargs = dict(user=user,
                       id=sesh.get_id(),
@@ -869,6 +905,56 @@ class ContentController(BaseController, RewriterApp):
             else:
                 return handle_error(err_context)
 
+    def is_public_replay_request(self, environ):
+        """Return whether request is a replay of a public collection on
+        the content host, which has been checked recently. Such requests
+        only need the session id, not the full session.
+
+        :param dict environ: WSGI environment
+
+        :returns: whether request is public collection replay
+        :rtype: bool
+        """
+        if not self.public_colls_secs or not self.content_host:
+            return False
+
+        if environ.get('HTTP_HOST') != self.content_host:
+            return False
+
+        # /<user>/<coll>/<rec>/<mode>/...
+        parts = environ.get('PATH_INFO', '').split('/', 5)
+        if len(parts) < 4:
+            return False
+
+        if len(parts) > 4 and parts[4].startswith(self.MODIFY_MODES):
+            return False
+
+        return self._get_public_coll(parts[1], parts[2]) is not None
+
+    def _get_public_coll(self, user, coll_name):
+        key = (user, coll_name)
+        result = self.public_colls.get(key)
+        if not result:
+            return None
+
+        coll, expires = result
+        if expires < time.time():
+            self.public_colls.pop(key, None)
+            return None
+
+        self.public_colls.move_to_end(key)
+        return coll
+
+    def _set_public_coll(self, user, coll_name, coll):
+        if not self.public_colls_secs:
+            return
+
+        self.public_colls[(user, coll_name)] = (coll, time.time() + self.public_colls_secs)
+        self.public_colls.move_to_end((user, coll_name))
+
+        if len(self.public_colls) > self.PUBLIC_COLLS_MAX:
+            self.public_colls.popitem(last=False)
+
     def check_if_content(self, wb_url, environ, is_top_frame):
         if not wb_url.is_replay():
             return
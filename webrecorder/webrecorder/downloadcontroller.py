@@ -1,8 +1,9 @@
 from warcio.timeutils import timestamp_now
 from warcio.warcwriter import BufferWARCWriter
+from warcio.limitreader import LimitReader
 
 from pywb.utils.loaders import BlockLoader
-from pywb.utils.io import StreamIter, chunk_encode_iter
+from pywb.utils.io import StreamIter, chunk_encode_iter, no_except_close
 
 from webrecorder.basecontroller import BaseController
 from webrecorder import __version__
@@ -10,13 +11,16 @@ from webrecorder.apiutils import wr_api_spec
 from webrecorder.models.stats import Stats
 from webrecorder.utils import get_bool
 from webrecorder.rec.storage import LocalFileStorage
+from webrecorder.rec.storage.storagepaths import strip_prefix
 
-from bottle import response, request
-from six.moves.urllib.parse import quote
+from bottle import response, request, static_file
+from six.moves.urllib.parse import quote, urlencode
 from six import iteritems
 from collections import OrderedDict
+from gevent.pool import Pool
 import gevent
 import json
+import os
 
 
 # ============================================================================
@@ -26,6 +30,8 @@ class DownloadController(BaseController):
 
     DEFAULT_REC_TITLE = 'Session from {0}'
 
+    WASAPI_PAGE_SIZE = 1000
+
     def __init__(self, *args, **kwargs):
         super(DownloadController, self).__init__(*args, **kwargs)
         config = kwargs['config']
@@ -33,6 +39,12 @@ class DownloadController(BaseController):
         self.download_filename = config['download_paths']['filename']
 
         self.download_chunk_encoded = config['download_chunk_encoded']
+        self.download_block_size = int(config['download_block_size'])
+        self.download_range_size = int(config['download_range_size'])
+        self.download_max_ranges = int(config['download_max_ranges'])
+
+        self.accel_root = config['download_accel_root']
+        self.accel_location = config['download_accel_location']
 
     def init_routes(self):
         wr_api_spec.set_curr_tag('WASAPI (Downloads)')
@@ -51,7 +63,7 @@ class DownloadController(BaseController):
 
         @self.app.get('/api/v1/download/webdata')
         @self.api(
-            query=['?user', '?collection'],
+            query=['?user', '?collection', '?page', '?page_size'],
             resp='wasapi_list',
             description='List all files available for download, their locations and checksums, per WASAPI spec'
         )
@@ -147,7 +159,9 @@ class DownloadController(BaseController):
 
         filename = self.download_filename.format(title=quote(name),
                                                  timestamp=now)
-        loader = BlockLoader()
+        reader = PrefetchReader(self.download_block_size,
+                                self.download_range_size,
+                                self.download_max_ranges)
 
         coll_info = self.create_coll_warcinfo(user, collection, filename)
 
@@ -165,21 +179,30 @@ class DownloadController(BaseController):
                 size += recording.size
                 yield recording, warcinfo, size
 
-        def read_all(infos):
+        def iter_parts(infos):
             yield coll_info
 
             for recording, warcinfo, _ in infos:
                 yield warcinfo
 
-                for n, warc_path in recording.iter_all_files():
-                    try:
-                        fh = loader.load(warc_path)
-                    except Exception:
-                        print('Skipping invalid ' + warc_path)
-                        continue
+                all_files = list(recording.iter_all_files())
+
+                # sizes of committed WARCs, stored at commit time
+                checksums = collection.get_warc_checksums([n for n, _ in all_files])
+
+                for n, warc_path in all_files:
+                    local_path = self.get_local_path(warc_path)
+                    if local_path:
+                        yield (local_path, 0, None)
+
+                    elif n in checksums:
+                        yield from reader.split_ranges(warc_path, checksums[n][2])
+
+                    else:
+                        yield (warc_path, 0, None)
 
-                    for chunk in StreamIter(fh):
-                        yield chunk
+        def read_all(infos):
+            return reader(iter_parts(infos))
 
         response.headers['Content-Type'] = 'application/octet-stream'
         response.headers['Content-Disposition'] = "attachment; filename*=UTF-8''" + filename
@@ -199,6 +222,52 @@ class DownloadController(BaseController):
 
             return read_all(iter_infos())
 
+    def get_local_path(self, warc_path):
+        """Return local path of WARC, read directly rather than through
+        the WARC server.
+
+        :param str warc_path: WARC path, as stored
+
+        :returns: local path or None if not a local file
+        :rtype: str or None
+        """
+        local_path = strip_prefix(warc_path)
+        if os.path.isabs(local_path) and os.path.isfile(local_path):
+            return local_path
+
+        return None
+
+    def serve_local_file(self, local_path, filename):
+        """Serve local WARC, with Range support, via nginx X-Accel-Redirect
+        if configured or else via the server's wsgi.file_wrapper.
+
+        :param str local_path: local path
+        :param str filename: download filename
+
+        :returns: response
+        :rtype: HTTPResponse or str
+        """
+        disposition = "attachment; filename*=UTF-8''" + filename
+
+        if self.accel_location and local_path.startswith(self.accel_root):
+            response.headers['Content-Type'] = 'application/octet-stream'
+            response.headers['Content-Disposition'] = disposition
+            response.headers['X-Accel-Redirect'] = self.accel_location + quote(local_path[len(self.accel_root):])
+            return ''
+
+        res = static_file(os.path.basename(local_path),
+                          root=os.path.dirname(local_path),
+                          mimetype='application/octet-stream')
+
+        res.set_header('Content-Disposition', disposition)
+
+        # WARCs still being recorded may grow, only send size as of now
+        record_root = os.environ.get('RECORD_ROOT')
+        if record_root and hasattr(res.body, 'read') and local_path.startswith(record_root):
+            res.body = LimitReader(res.body, int(res.headers['Content-Length']))
+
+        return res
+
     def _get_wasapi_user(self, username=''):
         basic_auth = request.auth
 
@@ -243,50 +312,88 @@ class DownloadController(BaseController):
         else:
             colls = user.get_collections()
 
-        files = []
-        download_path = self.get_origin() + '/api/v1/download/{user}/{coll}/{filename}'
+        try:
+            page = int(request.query.get('page', 1))
+            page_size = int(request.query.get('page_size', self.WASAPI_PAGE_SIZE))
+            assert page > 0 and page_size > 0
+        except (ValueError, AssertionError):
+            self._raise_error(400, 'invalid_page')
+
+        page_size = min(page_size, self.WASAPI_PAGE_SIZE)
+
         local_storage = LocalFileStorage(self.redis)
 
+        # list all files from metadata only, in a stable order for paging
+        all_files = []
         for collection in colls:
             commit_storage = collection.get_storage()
 
-            for recording in collection.get_recordings(include_derivs=True):
-                is_committed = recording.is_fully_committed()
-                is_open = not is_committed and recording.get_pending_count() > 0
+            for recording, is_committed, is_open, name, path in collection.get_warc_files():
                 storage = commit_storage if is_committed else local_storage
+                all_files.append((collection, recording, storage, is_committed, is_open, name, path))
 
-                for name, path in recording.iter_all_files(include_index=False):
-                    full_warc_path = collection.get_warc_path(name)
+        start = (page - 1) * page_size
+        page_files = all_files[start:start + page_size]
 
-                    local_download = download_path.format(user=user.name, coll=collection.name, filename=name)
-                    remote_download_url = storage.get_remote_presigned_url(full_warc_path)
+        # checksums stored when closed or committed
+        checksums = {}
+        for collection in colls:
+            names = [name for coll, _, _, _, _, name, _ in page_files
+                     if coll is collection]
 
-                    # if remote download url exists (eg. for s3), include that first
-                    # always include local download url as well
-                    if remote_download_url and is_committed:
-                        locations = [remote_download_url, local_download]
-                    else:
-                        locations = [local_download]
-
-                    # add .open if current pending requests, checksum will likely change
-                    if is_open:
-                        name += '.open'
-
-                    kind, check_sum, size = storage.get_checksum_and_size(full_warc_path)
-                    files.append({
-                        'content-type': 'application/warc',
-                        'filetype': 'application/warc',
-                        'filename': name,
-                        'size': size,
-                        'recording': recording.my_id,
-                        'recording_date': recording.get_prop('created_at'),
-                        'collection': collection.name,
-                        'checksums': {kind: check_sum},
-                        'locations': locations,
-                        'is_active': not is_committed
-                    })
-
-        return {'files': files, 'include-extra': len(files) > 0}
+            checksums[collection.my_id] = collection.get_warc_checksums(names)
+
+        files = []
+        download_path = self.get_origin() + '/api/v1/download/{user}/{coll}/{filename}'
+
+        for collection, recording, storage, is_committed, is_open, name, full_warc_path in page_files:
+            local_download = download_path.format(user=user.name, coll=collection.name, filename=name)
+            remote_download_url = storage.get_remote_presigned_url(full_warc_path)
+
+            # if remote download url exists (eg. for s3), include that first
+            # always include local download url as well
+            if remote_download_url and is_committed:
+                locations = [remote_download_url, local_download]
+            else:
+                locations = [local_download]
+
+            checksum = checksums[collection.my_id].get(name)
+            if checksum:
+                kind, check_sum, size = checksum
+            else:
+                kind, check_sum, size = storage.get_checksum_and_size(full_warc_path)
+
+                # committed before checksums were stored, store now
+                if is_committed and check_sum:
+                    collection.set_warc_checksum(name, kind, check_sum, size)
+
+            # add .open if current pending requests, checksum will likely change
+            if is_open:
+                name += '.open'
+
+            files.append({
+                'content-type': 'application/warc',
+                'filetype': 'application/warc',
+                'filename': name,
+                'size': size,
+                'recording': recording.my_id,
+                'recording_date': recording.get_prop('created_at'),
+                'collection': collection.name,
+                'checksums': {kind: check_sum},
+                'locations': locations,
+                'is_active': not is_committed
+            })
+
+        return {'count': len(all_files),
+                'next': self._wasapi_page_url(page + 1) if start + page_size < len(all_files) else None,
+                'previous': self._wasapi_page_url(page - 1) if page > 1 else None,
+                'files': files,
+                'include-extra': len(files) > 0}
+
+    def _wasapi_page_url(self, page):
+        params = dict(request.query.decode())
+        params['page'] = page
+        return self.get_origin() + request.path + '?' + urlencode(params)
 
     def wasapi_download(self, username, coll_name, filename):
         user = self._get_wasapi_user(username)
@@ -309,6 +416,10 @@ class DownloadController(BaseController):
         if not warc_path:
             self._raise_error(404, 'file_not_found')
 
+        local_path = self.get_local_path(warc_path)
+        if local_path:
+            return self.serve_local_file(local_path, filename)
+
         response.headers['Content-Type'] = 'application/octet-stream'
         response.headers['Content-Disposition'] = "attachment; filename*=UTF-8''" + filename
         response.headers['Transfer-Encoding'] = 'chunked'
@@ -325,3 +436,143 @@ class DownloadController(BaseController):
                 yield chunk
 
         return read_all(fh)
+
+
+# ============================================================================
+class PrefetchReader(object):
+    """Read download parts strictly in order, while fetching remote WARCs
+    ahead, in concurrent byte ranges, into a bounded buffer.
+
+    Each part is either bytes, a (path, offset, length) range or
+    a (path, 0, None) full WARC, streamed when reached.
+    At most 2 * max_ranges ranges are held in memory at a time.
+
+    A range that can not be read after RANGE_RETRIES attempts aborts
+    the download, unless it is the first range of its WARC: a WARC that
+    can not be read before any of it is sent is skipped.
+
+    :cvar int RANGE_RETRIES: attempts to read a range
+    :ivar int block_size: read size of streamed WARCs
+    :ivar int range_size: max size of fetched range
+    :ivar int max_ranges: max number of concurrent fetches
+    :ivar BlockLoader loader: WARC loader
+    """
+    RANGE_RETRIES = 3
+
+    def __init__(self, block_size, range_size, max_ranges):
+        self.block_size = block_size
+        self.range_size = range_size
+        self.max_ranges = max_ranges
+        self.loader = BlockLoader()
+
+    def split_ranges(self, path, size):
+        """Split WARC into ranges.
+
+        :param str path: WARC path
+        :param int size: WARC size
+
+        :returns: ranges
+        :rtype: generator
+        """
+        for offset in range(0, size, self.range_size):
+            yield (path, offset, min(self.range_size, size - offset))
+
+    def fetch(self, part):
+        """Fetch range, retrying if failed or incomplete, or open WARC
+        to be streamed.
+
+        :param part: download part
+        :type: bytes or tuple
+
+        :returns: data or stream, None if WARC could not be read
+        :rtype: bytes or file-like object or None
+        """
+        if isinstance(part, bytes):
+            return part
+
+        path, offset, length = part
+
+        if length is None:
+            try:
+                return self.loader.load(path)
+            except Exception:
+                print('Could not open ' + path)
+                return None
+
+        for attempt in range(self.RANGE_RETRIES):
+            fh = None
+            try:
+                fh = self.loader.load(path, offset, length)
+                buff = fh.read()
+                if len(buff) == length:
+                    return buff
+
+                print('Incomplete range {0}:{1}, {2} of {3} bytes'.format(path, offset, len(buff), length))
+
+            except Exception as e:
+                print('Could not read range {0}:{1}: {2}'.format(path, offset, e))
+
+            finally:
+                no_except_close(fh)
+
+        return None
+
+    def __call__(self, parts):
+        pool = Pool(self.max_ranges)
+
+        # opened WARCs, not yet fully sent
+        streams = set()
+
+        def fetch(part):
+            res = self.fetch(part)
+            if res is not None and not isinstance(res, bytes):
+                streams.add(res)
+
+            return part, res
+
+        skip_path = None
+
+        try:
+            for part, res in pool.imap(fetch, parts, maxsize=self.max_ranges):
+                if isinstance(part, bytes):
+                    yield res
+                    continue
+
+                path, offset, length = part
+
+                # skip remaining ranges of skipped WARC
+                if path == skip_path:
+                    if res is not None and not isinstance(res, bytes):
+                        streams.discard(res)
+                        no_except_close(res)
+                    continue
+
+                skip_path = None
+
+                if res is None:
+                    # none of WARC sent yet, skip whole WARC
+                    if offset == 0:
+                        print('Skipping invalid ' + path)
+                        skip_path = path
+                        continue
+
+                    raise IOError('Could not read {0} at {1}, aborting download'.format(path, offset))
+
+                if isinstance(res, bytes):
+                    yield res
+                else:
+                    try:
+                        while True:
+                            buff = res.read(self.block_size)
+                            if not buff:
+                                break
+
+                            yield buff
+                    finally:
+                        streams.discard(res)
+                        no_except_close(res)
+        finally:
+            pool.kill()
+
+            for stream in streams:
+                no_except_close(stream)
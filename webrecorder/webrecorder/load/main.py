@@ -1,8 +1,9 @@
 from gevent.monkey import patch_all; patch_all()
 
-from pywb.warcserver.index.indexsource import LiveIndexSource, RedisIndexSource
+from pywb.warcserver.index.indexsource import BaseIndexSource, LiveIndexSource, RedisIndexSource
 from pywb.warcserver.index.indexsource import MementoIndexSource, WBMementoIndexSource, RemoteIndexSource
 from pywb.warcserver.index.aggregator import SimpleAggregator, GeventTimeoutAggregator
+from pywb.warcserver.index.cdxobject import CDXObject
 
 from pywb.warcserver.resource.responseloader import LiveWebLoader
 from pywb.warcserver.resource.pathresolvers import RedisResolver
@@ -11,16 +12,29 @@ from pywb.warcserver.handlers import DefaultResourceHandler, HandlerSeq, Resourc
 from pywb.warcserver.warcserver import BaseWarcServer, init_index_source, register_source
 
 from pywb.utils.wbexception import NotFoundException
-from pywb.utils.loaders import load_yaml_config
+from pywb.utils.loaders import load, load_yaml_config
+from pywb.utils.binsearch import iter_range
 
-from webrecorder.utils import load_wr_config, init_logging
+from webrecorder.utils import load_wr_config, init_logging, get_bool
+
+from webrecorder.rec.storage.storagepaths import strip_prefix
 
 from webrecorder.load.wamsourceloader import WAMSourceLoader
 
 from webrecorder.models import Recording, Collection
 
+from contextlib import closing
+from heapq import merge
+
 import os
 import json
+import hashlib
+import logging
+import shutil
+import tempfile
+
+
+logger = logging.getLogger('wr.io')
 
 
 # =============================================================================
@@ -62,9 +76,13 @@ class WRWarcServer(object):
                                             redis_url=rec_url,
                                             redis=redis)
 
-        coll_redis_source = RedisIndexSource(timeout=timeout,
-                                             redis_url=coll_url,
-                                             redis=redis)
+        if get_bool(config.get('coll_cdxj_from_files')):
+            coll_redis_source = CommittedIndexSource(redis=redis,
+                                                     cache_dir=config.get('coll_cdxj_cache_dir'))
+        else:
+            coll_redis_source = RedisIndexSource(timeout=timeout,
+                                                 redis_url=coll_url,
+                                                 redis=redis)
 
         live_rec = DefaultResourceHandler(
                         SimpleAggregator(
@@ -143,6 +161,101 @@ class WRWarcServer(object):
         return patch_archives
 
 
+# ============================================================================
+class CommittedIndexSource(BaseIndexSource):
+    """Collection index source which serves committed recordings directly
+    from their sorted CDXJ index files, using binary search, and merges
+    these with the Redis index of recordings not yet committed.
+
+    Index files not available locally are downloaded once to `cache_dir`.
+    External collections are served from the collection Redis index.
+    """
+    def __init__(self, redis, cache_dir=None):
+        self.redis = redis
+        self.redis_source = RedisIndexSource(redis=redis)
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'wr-cdxj-cache')
+
+    def load_index(self, params):
+        coll = params['coll']
+
+        if self.redis.exists(Collection.EXTERNAL_KEY.format(coll=coll)):
+            coll_cdxj_key = Collection.COLL_CDXJ_KEY.format(coll=coll)
+            return self.redis_source.load_key_index(coll_cdxj_key, params)
+
+        recs = list(self.redis.smembers(Collection.RECS_KEY.format(coll=coll)))
+
+        pi = self.redis.pipeline(transaction=False)
+        for rec in recs:
+            pi.exists(Recording.CDXJ_KEY.format(rec=rec))
+            pi.hget(Recording.INFO_KEY.format(rec=rec), Recording.INDEX_FILE_KEY)
+
+        res = pi.execute()
+
+        iter_list = []
+        for rec, is_open, index_file in zip(recs, res[0::2], res[1::2]):
+            # not yet fully committed, rec index still in redis
+            if is_open:
+                cdxj_key = Recording.CDXJ_KEY.format(rec=rec)
+                iter_list.append(self.redis_source.load_key_index(cdxj_key, params))
+
+            elif index_file:
+                cdx_iter = self.load_file_index(index_file, params)
+                if cdx_iter:
+                    iter_list.append(cdx_iter)
+
+        return merge(*iter_list)
+
+    def load_file_index(self, index_file, params):
+        try:
+            filename = strip_prefix(index_file)
+            if not os.path.isfile(filename):
+                filename = self.get_cached_file(index_file)
+
+        except Exception as e:
+            logger.error('CDXJ Index: Could not load {0}: {1}'.format(index_file, e))
+            return None
+
+        def do_iter():
+            # opened on first read, closed even if not fully consumed
+            try:
+                fh = open(filename, 'rb')
+            except Exception as e:
+                logger.error('CDXJ Index: Could not open {0}: {1}'.format(index_file, e))
+                return
+
+            with fh:
+                for line in iter_range(fh, params['key'], params['end_key']):
+                    yield CDXObject(line)
+
+        return do_iter()
+
+    def get_cached_file(self, index_file):
+        # committed index files are not modified, no need to revalidate
+        # keyed by full path, index file names are not unique across storage paths
+        path_hash = hashlib.sha1(index_file.encode('utf-8')).hexdigest()
+        cached_file = os.path.join(self.cache_dir, path_hash + '-' + os.path.basename(index_file))
+        if os.path.isfile(cached_file):
+            return cached_file
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        logger.debug('CDXJ Index: Caching ' + index_file)
+
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as out:
+            try:
+                with closing(load(index_file)) as fh:
+                    shutil.copyfileobj(fh, out)
+            except Exception:
+                os.remove(out.name)
+                raise
+
+        os.rename(out.name, cached_file)
+        return cached_file
+
+    def __str__(self):
+        return 'file'
+
+
 # ============================================================================
 class ProxyMementoIndexSource(MementoIndexSource):
     def __init__(self, timegate_url, timemap_url, replay_url):
@@ -4,6 +4,7 @@ import os
 
 from pywb.utils.loaders import load
 from contextlib import closing
+from functools import lru_cache
 
 
 # ============================================================================
@@ -12,9 +13,16 @@ class WAMLoader(object):
 
     STRIP_SCHEME = re.compile(r'https?://')
 
+    # number of most recent url lookups cached
+    LOOKUP_CACHE_SIZE = 4096
+
     def __init__(self):
         self.replay_info = {}
 
+        # replay prefix trie, built on first lookup after archives are loaded
+        self.prefix_trie = None
+        self._cached_find = lru_cache(maxsize=self.LOOKUP_CACHE_SIZE)(self._find_archive_for_url)
+
         webarchives_path = self.merge_webarchives()
 
         try:
@@ -23,17 +31,53 @@ class WAMLoader(object):
             print('No Archives Loaded')
 
     def find_archive_for_url(self, url):
+        return self._cached_find(url)
+
+    def _find_archive_for_url(self, url):
         schemeless_url = self.STRIP_SCHEME.sub('', url)
-        for pk, info in self.replay_info.items():
-            if schemeless_url.startswith(info['replay_prefix']):
-                orig_url = schemeless_url[len(info['replay_prefix']):]
-                if info.get('parse_collection'):
-                    coll, orig_url = orig_url.split('/', 1)
-                    id_ = pk + ':' + coll
-                else:
-                    id_ = pk
 
-                return pk, orig_url, id_
+        # walk trie along url, if several prefixes match, first loaded archive wins
+        node = self._get_prefix_trie()
+        match = node.get(None)
+
+        for ch in schemeless_url:
+            node = node.get(ch)
+            if node is None:
+                break
+
+            found = node.get(None)
+            if found and (not match or found < match):
+                match = found
+
+        if not match:
+            return None
+
+        pk = match[1]
+        orig_url = schemeless_url[len(self.replay_info[pk]['replay_prefix']):]
+        if self.replay_info[pk].get('parse_collection'):
+            coll, orig_url = orig_url.split('/', 1)
+            id_ = pk + ':' + coll
+        else:
+            id_ = pk
+
+        return pk, orig_url, id_
+
+    def _get_prefix_trie(self):
+        if self.prefix_trie is not None:
+            return self.prefix_trie
+
+        trie = {}
+
+        for index, (pk, info) in enumerate(self.replay_info.items()):
+            node = trie
+            for ch in info['replay_prefix']:
+                node = node.setdefault(ch, {})
+
+            # None key marks end of prefix: (load order, archive id)
+            node.setdefault(None, (index, pk))
+
+        self.prefix_trie = trie
+        return trie
 
     def load_all(self, webarchives_path):
         wa_file = load(webarchives_path)
@@ -68,6 +112,10 @@ class WAMLoader(object):
                                 'name': archive_name,
                                 'about': archive_about}
 
+        # rebuild lookup on next find
+        self.prefix_trie = None
+        self._cached_find.cache_clear()
+
         return True
 
     @classmethod
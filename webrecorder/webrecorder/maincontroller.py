@@ -166,7 +166,8 @@ class MainController(BaseController):
                                            session_redis,
                                            config,
                                            access_cls=SessionAccessCache,
-                                           access_redis=self.redis)
+                                           access_redis=self.redis,
+                                           replay_only_check=content_app.is_public_replay_request)
 
         final_app = WSGIProxMiddleware(final_app, '/_proxy/',
                                        proxy_host='webrecorder.proxy',
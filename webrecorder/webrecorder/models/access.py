@@ -2,7 +2,7 @@
 from bottle import template, request, HTTPError
 
 from webrecorder.models.user import SessionUser
-from webrecorder.models.base import BaseAccess
+from webrecorder.models.base import BaseAccess, ComponentCache
 
 
 # ============================================================================
@@ -14,6 +14,7 @@ class SessionAccessCache(BaseAccess):
     :ivar Session sesh: session
     :ivar StrictRedis redis: Redis interface
     :ivar SessionUser _session_user: logged-in user
+    :ivar ComponentCache comp_cache: component entries loaded during request
     """
     READ_PREFIX = 'r:'
     WRITE_PREFIX = 'w:'
@@ -29,6 +30,8 @@ class SessionAccessCache(BaseAccess):
 
         self._session_user = None
 
+        self.comp_cache = ComponentCache()
+
     @property
     def session_user(self):
         """Read-only attribute session user."""
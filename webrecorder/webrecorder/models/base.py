@@ -2,7 +2,7 @@
 :synopsis: Interface classes to Redis components, such as, e.g., ordered lists.
 """
 from datetime import datetime
-from webrecorder.utils import get_bool, get_new_id
+from webrecorder.utils import get_bool, get_new_id, redis_pipeline
 
 
 # ============================================================================
@@ -21,9 +21,13 @@ class RedisUniqueComponent(object):
     :cvar None ALL_KEYS: component key template
     :cvar None OWNER_CLS: class of owner
     :cvar None ID_LEN: component ID length
+    :cvar int LOAD_BATCH_SIZE: max number of components loaded per pipeline
+    :cvar dict INDEX_KEYS: property -> sorted set indexing components by value
 
     :ivar StrictRedis redis: Redis interface
     :ivar SessionAccessCache access: Webrecorder session access
+    :ivar comp_cache: request-scoped cache of component entries
+    :type: ComponentCache or None
     :ivar str my_id: component ID
     :ivar info_key: Redis component key
     :type: str or None
@@ -41,6 +45,10 @@ class RedisUniqueComponent(object):
 
     ID_LEN = None
 
+    LOAD_BATCH_SIZE = 500
+
+    INDEX_KEYS = {}
+
     def __init__(self, **kwargs):
         """Initialize Redis component.
 
@@ -52,6 +60,7 @@ class RedisUniqueComponent(object):
         self.redis = kwargs['redis']
         self.my_id = kwargs.get('my_id', '')
         self.access = kwargs['access']
+        self.comp_cache = getattr(self.access, 'comp_cache', None)
         self.owner = None
 
         if self.my_id:
@@ -83,6 +92,11 @@ class RedisUniqueComponent(object):
         """
         val = self.redis.hincrby(self.info_key, key, value)
         self.data[key] = int(val)
+        if self.comp_cache is not None:
+            self.comp_cache.update(self.info_key, key, int(val))
+
+        self._update_index(self.redis, key, val)
+
         self.set_prop('updated_at', self._get_now())
 
     def incr_size(self, size):
@@ -149,15 +163,91 @@ class RedisUniqueComponent(object):
 
     def load(self):
         """Load Redis entries."""
-        self.data = self.redis.hgetall(self.info_key)
+        if self.comp_cache is not None:
+            self._set_loaded_data(dict(self.comp_cache.get_data(self)))
+        else:
+            self._set_loaded_data(self.redis.hgetall(self.info_key))
+
+    def _set_loaded_data(self, data):
+        """Set loaded Redis entries.
+
+        :param dict data: entries
+        """
+        self.data = data
         self._format_keys()
         self.loaded = True
 
+    @classmethod
+    def load_many(cls, my_ids, redis, access, owner=None):
+        """Create and load Redis components, fetching all entries
+        in pipelined batches instead of one round trip per component.
+
+        :param list my_ids: component IDs
+        :param StrictRedis redis: Redis interface
+        :param SessionAccessCache access: Webrecorder session access
+        :param owner: owner of all components
+        :type: RedisUniqueComponent or None
+
+        :returns: list of loaded Redis components
+        :rtype: list
+        """
+        objs = []
+        for my_id in my_ids:
+            obj = cls(my_id=my_id,
+                      redis=redis,
+                      access=access)
+
+            if owner:
+                obj.owner = owner
+
+            objs.append(obj)
+
+        return cls.load_all(objs)
+
+    @classmethod
+    def load_all(cls, objs):
+        """Load Redis entries of existing Redis components
+        in pipelined batches.
+
+        :param list objs: Redis components
+
+        :returns: Redis components
+        :rtype: list
+        """
+        uncached = []
+        for obj in objs:
+            if obj.comp_cache is not None and obj.info_key in obj.comp_cache:
+                obj.load()
+            else:
+                uncached.append(obj)
+
+        for i in range(0, len(uncached), cls.LOAD_BATCH_SIZE):
+            batch = uncached[i:i + cls.LOAD_BATCH_SIZE]
+
+            pi = batch[0].redis.pipeline(transaction=False)
+            for obj in batch:
+                pi.hgetall(obj.info_key)
+
+            for obj, data in zip(batch, pi.execute()):
+                obj._set_loaded_data(data)
+                if obj.comp_cache is not None:
+                    obj.comp_cache.add(obj.info_key, obj.data)
+
+        return objs
+
     def _format_keys(self):
         """Cast values of loaded entries to int."""
-        for key in self.INT_KEYS:
-            if key in self.data:
-                self.data[key] = int(self.data[key])
+        self._format_data(self.data)
+
+    @classmethod
+    def _format_data(cls, data):
+        """Cast values of given entries to int.
+
+        :param dict data: entries
+        """
+        for key in cls.INT_KEYS:
+            if key in data:
+                data[key] = int(data[key])
 
     def _create_new_id(self):
         """Create new unique ID.
@@ -208,6 +298,13 @@ class RedisUniqueComponent(object):
         pi = pi or self.redis
         pi.hmset(self.info_key, self.data)
 
+        for attr in self.INDEX_KEYS:
+            if attr in self.data:
+                self._update_index(pi, attr, self.data[attr])
+
+        if self.comp_cache is not None:
+            self.comp_cache.invalidate(self.info_key)
+
     def serialize(self, include_duration=False, convert_date=True):
         """Serialize Redis entries.
 
@@ -252,7 +349,16 @@ class RedisUniqueComponent(object):
         """
         if not self.loaded:
             if force_update or attr not in self.data:
-                self.data[attr] = self.redis.hget(self.info_key, attr) or default_val
+                # forced read may see writes made outside of this request,
+                # refresh cached entry if so
+                if force_update or self.comp_cache is None:
+                    value = self.redis.hget(self.info_key, attr)
+                    if self.comp_cache is not None:
+                        self.comp_cache.refresh(self, attr, value)
+                else:
+                    value = self.comp_cache.get_data(self).get(attr)
+
+                self.data[attr] = value or default_val
                 if force_type:
                     self.data[attr] = force_type(self.data[attr])
 
@@ -268,6 +374,67 @@ class RedisUniqueComponent(object):
         self.data[attr] = value
         self.redis.hset(self.info_key, attr, value)
 
+        if self.comp_cache is not None:
+            self.comp_cache.update(self.info_key, attr, value)
+
+        if attr == 'owner' and self.INDEX_KEYS:
+            self.reindex()
+        else:
+            self._update_index(self.redis, attr, value)
+
+    def _is_indexed(self):
+        """Return whether component should be in property indexes.
+
+        :returns: whether component should be indexed
+        :rtype: bool
+        """
+        return True
+
+    def _update_index(self, pi, attr, value):
+        """Update index of property, if property is indexed.
+
+        :param StrictRedis pi: Redis interface (pipeline)
+        :param str attr: attribute name
+        :param value: attribute value
+        """
+        index_key = self.INDEX_KEYS.get(attr)
+        if not index_key or not self._is_indexed():
+            return
+
+        try:
+            score = int(value)
+        except (ValueError, TypeError):
+            # older, non-timestamp dates
+            try:
+                score = int(datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S').timestamp())
+            except (ValueError, TypeError):
+                return
+
+        pi.zadd(index_key, score, self.my_id)
+
+    def reindex(self):
+        """Add to (or remove from) all property indexes."""
+        if not self._is_indexed():
+            self.remove_from_indexes()
+            return
+
+        attrs = list(self.INDEX_KEYS.keys())
+        values = self.redis.hmget(self.info_key, attrs)
+
+        with redis_pipeline(self.redis) as pi:
+            for attr, value in zip(attrs, values):
+                self._update_index(pi, attr, value)
+
+    def remove_from_indexes(self, pi=None):
+        """Remove from all property indexes.
+
+        :param pi: Redis interface
+        :type: StrictRedis or None
+        """
+        pi = pi or self.redis
+        for index_key in self.INDEX_KEYS.values():
+            pi.zrem(index_key, self.my_id)
+
     def mark_updated(self, ts=None):
         """Update Redis component's owner.
 
@@ -321,6 +488,12 @@ class RedisUniqueComponent(object):
             self.redis.delete(key)
             deleted = True
 
+        if self.INDEX_KEYS:
+            self.remove_from_indexes()
+
+        if self.comp_cache is not None:
+            self.comp_cache.invalidate(self.info_key)
+
         return deleted
 
     def get_owner(self):
@@ -402,6 +575,99 @@ class RedisUniqueComponent(object):
         return get_new_id(max_len)
 
 
+# ============================================================================
+class ComponentCache(object):
+    """Request-scoped identity map of Redis component entries.
+
+    Each component's info hash is read from Redis at most once and then
+    shared by all component objects for the same ID during the request.
+    Writes through :meth:`RedisUniqueComponent.set_prop` and
+    :meth:`RedisUniqueComponent.incr_key` update the cached entries,
+    forced reads through :meth:`RedisUniqueComponent.get_prop` refresh them.
+
+    :ivar dict entries: cached entries, keyed by info key
+    """
+    def __init__(self):
+        """Initialize component cache."""
+        self.entries = {}
+
+    def __contains__(self, info_key):
+        """Return whether entries for info key are cached.
+
+        :param str info_key: Redis component key
+
+        :returns: whether entries are cached
+        :rtype: bool
+        """
+        return info_key in self.entries
+
+    def get_data(self, comp):
+        """Return cached entries of Redis component, loading them
+        from Redis if not yet cached.
+
+        :param RedisUniqueComponent comp: Redis component
+
+        :returns: entries
+        :rtype: dict
+        """
+        data = self.entries.get(comp.info_key)
+        if data is None:
+            data = comp.redis.hgetall(comp.info_key)
+            comp._format_data(data)
+            self.entries[comp.info_key] = data
+
+        return data
+
+    def add(self, info_key, data):
+        """Add entries loaded from Redis.
+
+        :param str info_key: Redis component key
+        :param dict data: entries
+        """
+        self.entries[info_key] = dict(data)
+
+    def update(self, info_key, attr, value):
+        """Update single cached entry, if entries are cached.
+
+        :param str info_key: Redis component key
+        :param str attr: attribute name
+        :param value: attribute value
+        """
+        data = self.entries.get(info_key)
+        if data is not None:
+            data[attr] = value
+
+    def refresh(self, comp, attr, value):
+        """Update single cached entry with value just read from Redis,
+        if entries are cached.
+
+        :param RedisUniqueComponent comp: Redis component
+        :param str attr: attribute name
+        :param value: value read from Redis
+        :type: str or None
+        """
+        data = self.entries.get(comp.info_key)
+        if data is None:
+            return
+
+        if value is None:
+            data.pop(attr, None)
+        else:
+            data[attr] = value
+            comp._format_data(data)
+
+    def invalidate(self, info_key):
+        """Remove cached entries.
+
+        :param str info_key: Redis component key
+        """
+        self.entries.pop(info_key, None)
+
+    def clear(self):
+        """Remove all cached entries."""
+        self.entries.clear()
+
+
 # ============================================================================
 class RedisNamedMap(object):
     """Redis hash interface.
@@ -630,6 +896,9 @@ class RedisOrderedList(object):
         """
         all_objs = self.get_ordered_keys(start, end)
 
+        if load:
+            return cls.load_many(all_objs, self.redis, self.comp.access, owner=self.comp)
+
         obj_list = []
         for val in all_objs:
             obj = cls(my_id=val,
@@ -637,9 +906,6 @@ class RedisOrderedList(object):
                       access=self.comp.access)
 
             obj.owner = self.comp
-            if load:
-                obj.load()
-
             obj_list.append(obj)
 
         return obj_list
@@ -829,6 +1095,9 @@ class RedisUnorderedList(object):
         """
         all_objs = self.get_keys()
 
+        if load:
+            return cls.load_many(all_objs, self.redis, self.comp.access, owner=self.comp)
+
         obj_list = []
 
         for val in all_objs:
@@ -837,9 +1106,6 @@ class RedisUnorderedList(object):
                       access=self.comp.access)
 
             obj.owner = self.comp
-            if load:
-                obj.load()
-
             obj_list.append(obj)
 
         return obj_list
@@ -898,7 +1164,12 @@ class RedisUnorderedList(object):
 
 # ============================================================================
 class BaseAccess(object):
-    """Webrecorder access rights base class."""
+    """Webrecorder access rights base class.
+
+    :cvar None comp_cache: no component cache outside of requests
+    """
+    comp_cache = None
+
     def can_read_coll(self, collection, allow_superuser=True):
         """Return whether collection can be read.
 
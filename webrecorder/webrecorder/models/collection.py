@@ -1,10 +1,15 @@
+import bisect
+import json
 import logging
 import os
 import re
+import time
 import traceback
 from datetime import date
+from io import BytesIO
 
 import gevent
+from redis.exceptions import WatchError
 from pywb.utils.loaders import BlockLoader, load
 from pywb.warcserver.index.cdxobject import CDXObject
 
@@ -16,10 +21,11 @@ from webrecorder.models.datshare import DatShare
 from webrecorder.models.list_bookmarks import BookmarkList
 from webrecorder.models.pages import PagesMixin
 from webrecorder.models.recording import Recording
+from webrecorder.models.stats import Stats
 from webrecorder.rec.storage import get_storage as get_global_storage
 from webrecorder.rec.storage.storagepaths import strip_prefix
 from webrecorder.solrmanager import SolrManager
-from webrecorder.utils import get_new_id, load_wr_config, sanitize_title
+from webrecorder.utils import CDXJBulkLoader, get_bool, get_new_id, load_wr_config, redis_pipeline, sanitize_title
 
 
 logger = logging.getLogger('wr.io')
@@ -41,6 +47,27 @@ class Collection(PagesMixin, RedisUniqueComponent):
     :cvar str DEFAULT_COLL_DESC: default description
     :cvar str DEFAULT_STORE_TYPE: default Webrecorder storage
     :cvar int COLL_CDXJ_TTL: TTL of CDX index file
+    :cvar bool COLL_CDXJ_FROM_FILES: whether replay reads committed CDX
+    index files directly instead of the collection CDX index
+    :cvar str COLL_CDXJ_LRU_KEY: last replay time of collection CDX indexes
+    :cvar str COLL_CDXJ_SIZE_KEY: estimated size of collection CDX indexes
+    :cvar str COLL_CDXJ_TOTAL_KEY: estimated total size of all collection
+    CDX indexes
+    :cvar str COLL_CDXJ_BUILD_KEY: number of CDX index downloads pending
+    for collection CDX index, not evicted while set
+    :cvar int COLL_CDXJ_MAX_SIZE: memory budget for all collection CDX
+    indexes in bytes (0 for no limit and no accounting)
+    :cvar int COLL_CDXJ_ENTRY_SIZE: estimated size of CDX index entry
+    :cvar int COLL_CDXJ_EVICT_BATCH: number of least recently replayed
+    collection CDX indexes checked per batch when evicting
+    :cvar int SEARCH_BATCH_SIZE: number of CDX index entries read per batch
+    when searching
+    :cvar int MIME_LOAD_WAIT_SECS: max time to load the MIME type index of
+    a committed recording, not loaded again meanwhile
+    :cvar int SOLR_BATCH_SIZE: number of docs per Solr ingest batch
+    :cvar int SOLR_MAX_SKIP: max bytes to read past between text records
+    :cvar dict INDEX_KEYS: sorted sets indexing collections of
+    non-temporary users, by creation/update date, size and public flag
     :ivar RedisUnorderedList recs: recordings
     :ivar RedisOrderedList lists: n.s.
     :ivar RedisNamedMap list_names: n.s.
@@ -49,6 +76,11 @@ class Collection(PagesMixin, RedisUniqueComponent):
     INFO_KEY = 'c:{coll}:info'
     ALL_KEYS = 'c:{coll}:*'
 
+    INDEX_KEYS = {'created_at': 'z:colls:created',
+                  'updated_at': 'z:colls:updated',
+                  'size': 'z:colls:size',
+                  'public': 'z:colls:public'}
+
     RECS_KEY = 'c:{coll}:recs'
 
     LISTS_KEY = 'c:{coll}:lists'
@@ -62,6 +94,7 @@ class Collection(PagesMixin, RedisUniqueComponent):
     CLOSE_WAIT_KEY = 'c:{coll}:wait:{id}'
 
     EXTERNAL_KEY = 'c:{coll}:ext'
+    EXTERNAL_REMOVE_KEY = 's:colls:ext'
 
     COMMIT_WAIT_KEY = 'w:{filename}'
 
@@ -75,6 +108,23 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
     COLL_CDXJ_TTL = 1800
 
+    COLL_CDXJ_FROM_FILES = False
+
+    COLL_CDXJ_LRU_KEY = 'z:cdxj-lru'
+    COLL_CDXJ_SIZE_KEY = 'h:cdxj-size'
+    COLL_CDXJ_TOTAL_KEY = 'cdxj-size:total'
+    COLL_CDXJ_BUILD_KEY = 'c:{coll}:cdxj:_'
+
+    COLL_CDXJ_MAX_SIZE = 0
+    COLL_CDXJ_ENTRY_SIZE = 300
+    COLL_CDXJ_EVICT_BATCH = 100
+
+    SEARCH_BATCH_SIZE = 500
+    MIME_LOAD_WAIT_SECS = 300
+
+    SOLR_BATCH_SIZE = 500
+    SOLR_MAX_SKIP = 1024 * 1024
+
     def __init__(self, **kwargs):
         """Initialize collection Redis building block."""
         super(Collection, self).__init__(**kwargs)
@@ -93,6 +143,11 @@ class Collection(PagesMixin, RedisUniqueComponent):
         """
         cls.COLL_CDXJ_TTL = int(config['coll_cdxj_ttl'])
 
+        cls.COLL_CDXJ_FROM_FILES = get_bool(config.get('coll_cdxj_from_files'))
+
+        cls.COLL_CDXJ_MAX_SIZE = int(config.get('coll_cdxj_max_size', 0))
+        cls.COLL_CDXJ_ENTRY_SIZE = int(config.get('coll_cdxj_entry_size', cls.COLL_CDXJ_ENTRY_SIZE))
+
         cls.DEFAULT_STORE_TYPE = os.environ.get('DEFAULT_STORAGE', 'local')
 
         cls.DEFAULT_COLL_DESC = config['coll_desc']
@@ -179,7 +234,14 @@ class Collection(PagesMixin, RedisUniqueComponent):
         return auto
 
     def get_autos(self):
-        return [self.get_auto(aid) for aid in self.redis.smembers(self.AUTO_KEY.format(coll=self.my_id))]
+        if not self.access.can_admin_coll(self):
+            return []
+
+        aids = self.redis.smembers(self.AUTO_KEY.format(coll=self.my_id))
+
+        autos = Auto.load_many(aids, self.redis, self.access, owner=self)
+
+        return [auto for auto in autos if auto['owner'] == self.my_id]
 
     def remove_auto(self, auto):
         self.access.assert_can_admin_coll(self)
@@ -369,6 +431,19 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         return coll
 
+    def _is_indexed(self):
+        """Return whether collection is in property indexes,
+        only if owned by a non-temporary user.
+
+        :returns: whether collection is indexed
+        :rtype: bool
+        """
+        owner = self.data.get('owner')
+        if not owner:
+            owner = self.owner.my_id if self.owner else self.get_prop('owner')
+
+        return bool(owner) and not owner.startswith(self.OWNER_CLS.TEMP_PREFIX)
+
     def get_recording(self, rec):
         """Return recording.
 
@@ -413,6 +488,42 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         return recs
 
+    def get_warc_files(self):
+        """Return WARC files of all recordings, including derivative
+        recordings, ordered by recording ID and WARC name. The state and
+        WARCs of all recordings are read in one pipeline.
+
+        :returns: recording, whether fully committed, whether ongoing
+        (pending CDX index lines), WARC name and path
+        :rtype: list
+        """
+        recordings = sorted(self.get_recordings(include_derivs=True), key=lambda rec: rec.my_id)
+
+        pi = self.redis.pipeline(transaction=False)
+        for recording in recordings:
+            pi.get(Recording.PENDING_COUNT_KEY.format(rec=recording.my_id))
+            pi.exists(Recording.CDXJ_KEY.format(rec=recording.my_id))
+            pi.smembers(Recording.REC_WARC_KEY.format(rec=recording.my_id))
+
+        results = pi.execute()
+
+        names = list(set().union(*results[2::3]))
+        paths = dict(zip(names, self.redis.hmget(self.get_warc_key(), names))) if names else {}
+
+        warc_files = []
+        for recording, pending_count, has_cdxj, rec_names in zip(recordings, results[0::3], results[1::3], results[2::3]):
+            # same as Recording.is_fully_committed()
+            pending_count = int(pending_count or 0)
+            is_committed = pending_count == 0 and not has_cdxj
+            is_open = pending_count > 0
+
+            for name in sorted(rec_names):
+                path = paths.get(name)
+                if path:
+                    warc_files.append((recording, is_committed, is_open, name, path))
+
+        return warc_files
+
     def _get_rec_keys(self, key_templ):
         """Return recording Redis keys.
 
@@ -561,6 +672,7 @@ class Collection(PagesMixin, RedisUniqueComponent):
                         include_lists=True,
                         include_rec_pages=False,
                         include_pages=True,
+                        pages_limit=0,
                         include_bookmarks='first',
                         convert_date=True,
                         check_slug=False,
@@ -614,7 +726,9 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         if include_pages:
             if is_owner or data['public_index']:
-                data['pages'] = self.list_pages()
+                data['pages'], cursor = self.list_pages_range(limit=pages_limit)
+                if cursor is not None:
+                    data['pages_cursor'] = cursor
 
         data.pop('num_downloads', '')
 
@@ -705,20 +819,18 @@ class Collection(PagesMixin, RedisUniqueComponent):
             return 0
 
         coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
-        count = 0
+        cdxj_loader = CDXJBulkLoader(self.redis, coll_cdxj_key)
 
         for line in cdxj_text.split(b'\n'):
             if not line:
                 continue
 
             try:
-                cdx = CDXObject(line)
-                self.redis.zadd(coll_cdxj_key, 0, str(cdx))
-                count += 1
+                cdxj_loader.add(str(CDXObject(line)))
             except:
                 pass
 
-        return count
+        return cdxj_loader.close()
 
     def add_warcs(self, warc_map):
         if not self.is_external():
@@ -739,7 +851,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
     def set_external_remove_on_expire(self):
         key = self.EXTERNAL_KEY.format(coll=self.my_id)
-        self.redis.set(key, '1')
+
+        with redis_pipeline(self.redis) as pi:
+            pi.set(key, '1')
+            pi.sadd(self.EXTERNAL_REMOVE_KEY, self.my_id)
 
     def commit_file(self, filename, full_filename, obj_type,
                     update_key=None, update_prop=None, direct_delete=False):
@@ -779,6 +894,17 @@ class Collection(PagesMixin, RedisUniqueComponent):
             logger.debug('File Commit: Not Yet Available: {0}'.format(full_filename))
             return False
 
+        # store checksum and size computed during upload, or read
+        # from the local file while still available
+        if obj_type == 'warcs':
+            checksum = storage.get_upload_checksum(filename)
+            warc_sum_key = Recording.COLL_WARC_SUM_KEY.format(coll=self.my_id)
+            if not self.redis.hexists(warc_sum_key, filename):
+                if not checksum:
+                    checksum = storage.compute_checksum_and_size(full_filename)
+
+                self.set_warc_checksum(filename, *checksum)
+
         if update_key:
             update_prop = update_prop or filename
             self.redis.hset(update_key, update_prop, remote_url)
@@ -803,6 +929,40 @@ class Collection(PagesMixin, RedisUniqueComponent):
         logger.debug('File Committed {0} -> {1}'.format(full_filename, remote_url))
         return True
 
+    def set_warc_checksum(self, filename, kind, checksum, size):
+        """Store checksum and size of closed or committed WARC file.
+
+        :param str filename: WARC filename
+        :param str kind: kind of checksum
+        :param str checksum: checksum
+        :param int size: size
+        """
+        warc_sum_key = Recording.COLL_WARC_SUM_KEY.format(coll=self.my_id)
+        value = json.dumps({'kind': kind, 'checksum': checksum, 'size': size})
+        self.redis.hset(warc_sum_key, filename, value)
+
+    def get_warc_checksums(self, filenames):
+        """Return stored checksums and sizes of closed or committed WARC files.
+
+        :param list filenames: WARC filenames
+
+        :returns: kind of checksum, checksum and size by filename
+        :rtype: dict
+        """
+        if not filenames:
+            return {}
+
+        warc_sum_key = Recording.COLL_WARC_SUM_KEY.format(coll=self.my_id)
+        values = self.redis.hmget(warc_sum_key, filenames)
+
+        checksums = {}
+        for filename, value in zip(filenames, values):
+            if value:
+                value = json.loads(value)
+                checksums[filename] = (value['kind'], value['checksum'], value['size'])
+
+        return checksums
+
     def has_cdxj(self):
         coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
         return self.redis.exists(coll_cdxj_key)
@@ -820,29 +980,408 @@ class Collection(PagesMixin, RedisUniqueComponent):
         coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
         return self.redis.zscan_iter(coll_cdxj_key, match='*', count=100)
 
+    def iter_cdxj_lines(self, after=None):
+        """Return collection CDX index lines in order, in batches.
+
+        :param after: last line already returned, to resume from
+        :type: str or None
+
+        :returns: CDX index lines
+        :rtype: generator
+        """
+        self.sync_coll_index(exists=False, do_async=False)
+        coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
+
+        min_line = '(' + after if after else '-'
+
+        while True:
+            lines = self.redis.zrangebylex(coll_cdxj_key, min_line, '+',
+                                           start=0, num=self.SEARCH_BATCH_SIZE)
+
+            yield from lines
+
+            if len(lines) < self.SEARCH_BATCH_SIZE:
+                return
+
+            min_line = '(' + lines[-1]
+
+    def search_cdxj(self, mimes, search='', url='', ts_from=None, ts_to=None, after=None):
+        """Search CDX index entries by MIME type prefix, URL and date.
+
+        Uses the per-recording MIME type indexes. Scans the collection
+        CDX index instead if the collection is external, or if any
+        recording with WARCs has no MIME type index, while the missing
+        indexes of committed recordings are loaded in the background.
+
+        Each result is returned with its position, from which a later
+        search may resume: ['m', <MIME type prefix>, <recording ID>, <member>]
+        for the MIME type indexes, ['s', <CDX index line>] for a scan.
+
+        :param list mimes: MIME type prefixes
+        :param str search: lowercase text contained in URL
+        :param str url: lowercase text contained in URL
+        :param ts_from: min timestamp, 12 digits (minutes)
+        :type: int or None
+        :param ts_to: max timestamp, 12 digits (minutes)
+        :type: int or None
+        :param after: position of last result already returned
+        :type: list or None
+
+        :returns: position and URL, timestamp and MIME type of matching entries
+        :rtype: generator
+        """
+        date_filter = ts_from is not None and ts_to is not None
+
+        def matches(url_, timestamp, mime):
+            if date_filter:
+                try:
+                    # trim seconds
+                    ts = int(timestamp[:12])
+                except ValueError:
+                    return False
+                if ts < ts_from or ts > ts_to:
+                    return False
+
+            if search and search not in url_.lower():
+                return False
+
+            if url and url not in url_.lower():
+                return False
+
+            return True
+
+        after_kind = after[0] if after else None
+
+        recs = [] if self.is_external() else sorted(self.recs.get_keys())
+
+        pi = self.redis.pipeline(transaction=False)
+        for rec in recs:
+            pi.ttl(Recording.MIME_KEY.format(rec=rec))
+            pi.scard(Recording.REC_WARC_KEY.format(rec=rec))
+            pi.hget(Recording.INFO_KEY.format(rec=rec), Recording.INDEX_FILE_KEY)
+
+        results = pi.execute()
+
+        indexed_recs = []
+        expiring_recs = []
+        all_indexed = True
+
+        for rec, ttl, num_warcs, index_file in zip(recs, results[0::3], results[1::3], results[2::3]):
+            # -2 if no index, -1 if kept until committed
+            if ttl != -2:
+                indexed_recs.append(rec)
+                if ttl > 0:
+                    expiring_recs.append(rec)
+
+            elif num_warcs:
+                # expired while paging, resume from same index
+                if index_file and after_kind == 'm' and self.load_mime_index(rec, index_file):
+                    indexed_recs.append(rec)
+                    continue
+
+                # committed, load index for later searches
+                if index_file:
+                    self.load_mime_index_async(rec, index_file)
+
+                # or recorded before MIME type indexes were maintained
+                all_indexed = False
+
+        # external or not indexed by MIME type, scan full index
+        if not all_indexed or not indexed_recs or after_kind == 's':
+            for line in self.iter_cdxj_lines(after[1] if after_kind == 's' else None):
+                cdxj = CDXObject(line.encode('utf-8'))
+
+                if mimes and not any(cdxj['mime'].startswith(mime) for mime in mimes):
+                    continue
+
+                if matches(cdxj['url'], cdxj['timestamp'], cdxj['mime']):
+                    yield ['s', line], {'url': cdxj['url'],
+                                        'timestamp': cdxj['timestamp'],
+                                        'mime': cdxj['mime']}
+
+            return
+
+        # keep indexes loaded from committed index while searched
+        if expiring_recs and self.COLL_CDXJ_TTL > 0:
+            with redis_pipeline(self.redis) as pi:
+                for rec in expiring_recs:
+                    pi.expire(Recording.MIME_KEY.format(rec=rec), self.COLL_CDXJ_TTL)
+
+        # skip prefixes already covered by a shorter prefix
+        prefixes = []
+        for mime in sorted(set(mimes)):
+            if not any(mime.startswith(prefix) for prefix in prefixes):
+                prefixes.append(mime)
+
+        after_mime_rec = tuple(after[1:3]) if after_kind == 'm' else None
+
+        for mime in prefixes:
+            for rec in indexed_recs:
+                if after_mime_rec and (mime, rec) < after_mime_rec:
+                    continue
+
+                if after_mime_rec == (mime, rec):
+                    min_member = '(' + after[3]
+                else:
+                    min_member = '[' + mime if mime else '-'
+
+                max_member = '[' + mime + '\U0010ffff' if mime else '+'
+
+                mime_key = Recording.MIME_KEY.format(rec=rec)
+
+                while True:
+                    members = self.redis.zrangebylex(mime_key, min_member, max_member,
+                                                     start=0, num=self.SEARCH_BATCH_SIZE)
+
+                    for member in members:
+                        mime_, timestamp, url_ = member.split(' ', 2)
+                        if matches(url_, timestamp, mime_):
+                            yield ['m', mime, rec, member], {'url': url_,
+                                                             'timestamp': timestamp,
+                                                             'mime': mime_}
+
+                    if len(members) < self.SEARCH_BATCH_SIZE:
+                        break
+
+                    min_member = '(' + members[-1]
+
+    def load_mime_index_async(self, rec, index_file):
+        """Load MIME type index of committed recording in the background,
+        unless already loading.
+
+        :param str rec: recording ID
+        :param str index_file: committed CDX index file
+
+        :returns: loading greenlet, None if already loading
+        :rtype: Greenlet or None
+        """
+        lock_key = Recording.MIME_KEY.format(rec=rec) + ':_lock'
+        if not self.redis.set(lock_key, '1', ex=self.MIME_LOAD_WAIT_SECS, nx=True):
+            return None
+
+        def do_load():
+            try:
+                self.load_mime_index(rec, index_file)
+            finally:
+                self.redis.delete(lock_key)
+
+        return gevent.spawn(do_load)
+
+    def load_mime_index(self, rec, index_file):
+        """Load MIME type index of committed recording from its CDX
+        index file. The loaded index expires after COLL_CDXJ_TTL.
+
+        :param str rec: recording ID
+        :param str index_file: committed CDX index file
+
+        :returns: whether loaded
+        :rtype: bool
+        """
+        mime_key = Recording.MIME_KEY.format(rec=rec)
+        build_key = mime_key + ':_'
+
+        fh = None
+        try:
+            fh = load(index_file)
+
+            self.redis.delete(build_key)
+
+            members = []
+            for line in fh:
+                try:
+                    cdx = CDXObject(line.rstrip())
+                    members.extend((0, ' '.join((cdx['mime'], cdx['timestamp'], cdx['url']))))
+                except Exception:
+                    continue
+
+                if len(members) >= CDXJBulkLoader.BATCH_SIZE * 2:
+                    self.redis.zadd(build_key, *members)
+                    members = []
+
+            if members:
+                self.redis.zadd(build_key, *members)
+
+            # swap in complete index only, if not empty
+            if not self.redis.exists(build_key):
+                return False
+
+            with redis_pipeline(self.redis) as pi:
+                pi.rename(build_key, mime_key)
+                if self.COLL_CDXJ_TTL > 0:
+                    pi.expire(mime_key, self.COLL_CDXJ_TTL)
+
+            return True
+
+        except Exception as e:
+            logger.error('MIME Index: Could not load: ' + index_file)
+            traceback.print_exc()
+            return False
+
+        finally:
+            if fh:
+                fh.close()
+
+    def sync_replay_index(self):
+        """Ensure the collection CDX index is available for replay.
+
+        Not needed when replay reads committed CDX index files directly.
+        """
+        if self.COLL_CDXJ_FROM_FILES:
+            return
+
+        self.sync_coll_index(exists=False, do_async=False)
+
     def sync_coll_index(self, exists=False, do_async=False):
         coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
         if exists != self.redis.exists(coll_cdxj_key):
             self.reset_cdxj_ttl(coll_cdxj_key)
+            if not exists and self.COLL_CDXJ_MAX_SIZE > 0:
+                self.redis.zadd(self.COLL_CDXJ_LRU_KEY, time.time(), self.my_id)
+                Stats(self.redis).incr_cdxj_cache('hit')
             return
 
         cdxj_keys = self._get_rec_keys(Recording.CDXJ_KEY)
         if not cdxj_keys:
             return
 
+        if not exists and self.COLL_CDXJ_MAX_SIZE > 0:
+            Stats(self.redis).incr_cdxj_cache('miss')
+
+        download_keys = [cdxj_key for cdxj_key in cdxj_keys
+                         if not self.redis.exists(cdxj_key)]
+
+        # mark as rebuilding before index is created, so that it is not
+        # evicted while committed indexes are still being added
+        if download_keys:
+            build_key = self.COLL_CDXJ_BUILD_KEY.format(coll=self.my_id)
+            self.redis.set(build_key, len(download_keys), ex=self.COMMIT_WAIT_SECS)
+
         self.redis.zunionstore(coll_cdxj_key, cdxj_keys)
         self.reset_cdxj_ttl(coll_cdxj_key)
+        self.track_cdxj_size(coll_cdxj_key)
 
         ges = []
-        for cdxj_key in cdxj_keys:
-            if self.redis.exists(cdxj_key):
-                continue
-
+        for cdxj_key in download_keys:
             ges.append(gevent.spawn(self._do_download_cdxj, cdxj_key, coll_cdxj_key))
 
         if not do_async:
             res = gevent.joinall(ges)
 
+    def track_cdxj_size(self, coll_cdxj_key):
+        """Update estimated size and last replay time of the collection
+        CDX index, and the running total of all collection CDX indexes,
+        evicting least recently replayed collection CDX indexes if over
+        the memory budget.
+
+        :param str coll_cdxj_key: collection CDX index Redis key
+        """
+        if self.COLL_CDXJ_MAX_SIZE <= 0:
+            return
+
+        size = self.redis.zcard(coll_cdxj_key) * self.COLL_CDXJ_ENTRY_SIZE
+
+        # add change in size to total, retried if sizes change meanwhile
+        with self.redis.pipeline() as pi:
+            while True:
+                try:
+                    pi.watch(self.COLL_CDXJ_SIZE_KEY, self.COLL_CDXJ_TOTAL_KEY)
+
+                    old_size = int(pi.hget(self.COLL_CDXJ_SIZE_KEY, self.my_id) or 0)
+
+                    # sizes tracked before total was kept, count once
+                    init_total = None
+                    if not pi.exists(self.COLL_CDXJ_TOTAL_KEY):
+                        init_total = sum(int(value) for value in pi.hvals(self.COLL_CDXJ_SIZE_KEY))
+
+                    pi.multi()
+                    if init_total is not None:
+                        pi.set(self.COLL_CDXJ_TOTAL_KEY, init_total)
+
+                    pi.zadd(self.COLL_CDXJ_LRU_KEY, time.time(), self.my_id)
+                    pi.hset(self.COLL_CDXJ_SIZE_KEY, self.my_id, size)
+                    pi.incrby(self.COLL_CDXJ_TOTAL_KEY, size - old_size)
+                    total = pi.execute()[-1]
+                    break
+
+                except WatchError:
+                    continue
+
+        if total > self.COLL_CDXJ_MAX_SIZE:
+            self.evict_cdxj(self.COLL_CDXJ_MAX_SIZE)
+
+    def evict_cdxj(self, max_size):
+        """Delete least recently replayed collection CDX indexes until
+        total estimated size is within given size.
+
+        Only reads the least recently replayed entries, in batches, until
+        enough have been evicted. Entries for expired collection CDX
+        indexes found meanwhile are removed as well.
+
+        :param int max_size: max total size in bytes
+
+        :returns: number of evicted collection CDX indexes
+        :rtype: int
+        """
+        total = int(self.redis.get(self.COLL_CDXJ_TOTAL_KEY) or 0)
+        evicted = 0
+
+        # number of entries at head of LRU kept, skipped in next batch
+        kept = 0
+
+        while total > max_size:
+            colls = self.redis.zrange(self.COLL_CDXJ_LRU_KEY, kept,
+                                      kept + self.COLL_CDXJ_EVICT_BATCH - 1)
+            if not colls:
+                break
+
+            pi = self.redis.pipeline(transaction=False)
+            for coll in colls:
+                pi.exists(self.COLL_CDXJ_KEY.format(coll=coll))
+                pi.exists(self.COLL_CDXJ_BUILD_KEY.format(coll=coll))
+
+            pi.hmget(self.COLL_CDXJ_SIZE_KEY, colls)
+            res = pi.execute()
+
+            sizes = res[-1]
+
+            removed = []
+            removed_size = 0
+
+            for coll, exists, building, size in zip(colls, res[0:-1:2], res[1:-1:2], sizes):
+                if total - removed_size <= max_size:
+                    break
+
+                size = int(size or 0)
+
+                if exists:
+                    # partially loaded, would be left incomplete if deleted now
+                    if coll == self.my_id or building:
+                        kept += 1
+                        continue
+
+                    logger.debug('CDX Sync: Evicting index for coll: ' + coll)
+                    self.redis.delete(self.COLL_CDXJ_KEY.format(coll=coll))
+                    evicted += 1
+
+                removed.append(coll)
+                removed_size += size
+
+            if removed:
+                with redis_pipeline(self.redis) as pi:
+                    pi.zrem(self.COLL_CDXJ_LRU_KEY, *removed)
+                    pi.hdel(self.COLL_CDXJ_SIZE_KEY, *removed)
+                    pi.incrby(self.COLL_CDXJ_TOTAL_KEY, -removed_size)
+
+                total -= removed_size
+
+            elif len(colls) < self.COLL_CDXJ_EVICT_BATCH:
+                break
+
+        if evicted:
+            Stats(self.redis).incr_cdxj_cache('evict', evicted)
+
+        return evicted
+
     def sync_solr_derivatives(self, do_async=True):
         jobs = [gevent.spawn(self._ingest_stored_derivs)]
 
@@ -851,24 +1390,34 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
     def _ingest_stored_derivs(self):
         loader = BlockLoader()
-        pages = self.list_pages()
         solr_mgr = SolrManager(load_wr_config())
+        user_name = self.get_owner().name
 
         solr_batch = []
 
-        # mapping of recording ids to warc files
-        rec_warcs = {
-            r.my_id: [f[0] for f in r.iter_all_files()]
-            for r in self.get_recordings()
-        }
+        # text page keys, sorted for prefix lookup
+        pages = {}
+        for page in self.list_pages():
+            pages['urn:text:{timestamp}/{url}'.format(**page)] = page
+
+        page_keys = sorted(pages.keys())
+
+        # mapping of warc files to recording ids
+        warc_recs = {}
+        for recording in self.get_recordings():
+            for name, _ in recording.iter_all_files():
+                warc_recs.setdefault(name, recording.my_id)
+
+        # text records to read, grouped by warc file
+        text_entries = {}
+        warc_key = self.get_warc_key()
 
         for line, _ in self.get_cdxj_iter():
             # submit chunk of docs to be indexed
-            if len(solr_batch) >= 500:
+            if len(solr_batch) >= self.SOLR_BATCH_SIZE:
                 solr_mgr.batch_ingest(solr_batch)
                 solr_batch = []
 
-
             cdxo = CDXObject(line.encode('utf-8'))
 
             if (cdxo['mime'] == 'warc/revisit'
@@ -877,16 +1426,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
             # index non-text/hml cdxj entries
             if cdxo['mime'] != 'text/html':
-                rec = ''
-                for k,itm in rec_warcs.items():
-                    if cdxo['filename'] in itm:
-                        rec = k
-                        break
-
                 solr_batch.append(solr_mgr.prepare_doc({
-                    'user': self.get_owner().name,
+                    'user': user_name,
                     'coll': self.my_id,
-                    'rec': rec,
+                    'rec': warc_recs.get(cdxo['filename'], ''),
                     'url': cdxo['url'],
                     'timestamp': cdxo['timestamp'],
                     'mime': cdxo['mime']
@@ -896,23 +1439,31 @@ class Collection(PagesMixin, RedisUniqueComponent):
             if not cdxo['urlkey'].startswith('urn:text'):
                 continue
 
-            f = self.redis.hget(self.get_warc_key(), cdxo['filename'])
+            page = self._find_text_page(pages, page_keys, cdxo['urlkey'])
 
-            if not f:
-                print('warc file not found')
+            if not page:
+                logger.debug('Text Index: Page not found: ' + cdxo['urlkey'])
                 continue
 
-            page = next((p for p in pages if 'urn:text:{timestamp}/{url}'.format(**p).startswith(cdxo['urlkey'])), None)
+            entries = text_entries.get(cdxo['filename'])
+            if entries is None:
+                entries = text_entries[cdxo['filename']] = []
 
-            if not page:
-                print('page not found..')
+            entries.append((int(cdxo['offset']), int(cdxo['length']), page))
+
+        # read text records, each warc once, in offset order
+        for filename, entries in text_entries.items():
+            warc_path = self.redis.hget(warc_key, filename)
+
+            if not warc_path:
+                logger.debug('Text Index: WARC not found: ' + filename)
                 continue
 
-            fh = loader.load(f, offset=int(cdxo['offset']), length=int(cdxo['length']))
-            for record in ArchiveIterator(fh):
-                data = record.raw_stream.read()
+            entries.sort(key=lambda entry: entry[0])
+
+            for page, data in self._iter_text_records(loader, warc_path, entries):
                 record = {
-                    'user': self.get_owner().name,
+                    'user': user_name,
                     'coll': self.my_id,
                     'rec': page.get('rec'),
                     'pid': page.get('id'),
@@ -924,12 +1475,98 @@ class Collection(PagesMixin, RedisUniqueComponent):
                 }
                 solr_batch.append(solr_mgr.prepare_doc(record, data))
 
+                if len(solr_batch) >= self.SOLR_BATCH_SIZE:
+                    solr_mgr.batch_ingest(solr_batch)
+                    solr_batch = []
+
         # submit final batch
         solr_mgr.batch_ingest(solr_batch)
 
         # all done
         self.set_bool_prop('indexing', False)
 
+    def _find_text_page(self, pages, page_keys, urlkey):
+        """Find page whose text key starts with the given CDX urlkey.
+
+        :param dict pages: pages by text key
+        :param list page_keys: sorted text keys
+        :param str urlkey: CDX urlkey
+
+        :returns: page or None
+        :rtype: dict or None
+        """
+        page = pages.get(urlkey)
+        if page:
+            return page
+
+        i = bisect.bisect_left(page_keys, urlkey)
+        if i < len(page_keys) and page_keys[i].startswith(urlkey):
+            return pages[page_keys[i]]
+
+        return None
+
+    def _iter_text_records(self, loader, warc_path, entries):
+        """Read WARC records at the given offsets from a single open stream.
+
+        Skips forward over small gaps and reopens the stream at the next
+        offset otherwise.
+
+        :param BlockLoader loader: loader
+        :param str warc_path: WARC path
+        :param list entries: (offset, length, page) tuples sorted by offset
+
+        :returns: (page, record payload) tuples
+        :rtype: generator
+        """
+        fh = None
+        pos = 0
+
+        try:
+            for offset, length, page in entries:
+                try:
+                    if fh and offset != pos:
+                        if hasattr(fh, 'seekable') and fh.seekable():
+                            fh.seek(offset)
+                        elif offset > pos and offset - pos <= self.SOLR_MAX_SKIP:
+                            self._skip_bytes(fh, offset - pos)
+                        else:
+                            fh.close()
+                            fh = None
+
+                    if not fh:
+                        fh = loader.load(warc_path, offset=offset)
+
+                    buff = BytesIO(fh.read(length))
+                    pos = offset + length
+
+                    records = [record.raw_stream.read() for record in ArchiveIterator(buff)]
+
+                except Exception as e:
+                    logger.warning('Text Index: Skipping record at {0} in {1}: {2}'.format(offset, warc_path, e))
+
+                    # stream position unknown, reopen at next offset
+                    if fh:
+                        fh.close()
+                        fh = None
+
+                    continue
+
+                for data in records:
+                    yield page, data
+
+        finally:
+            if fh:
+                fh.close()
+
+    @staticmethod
+    def _skip_bytes(fh, count):
+        while count > 0:
+            buff = fh.read(min(count, 16384))
+            if not buff:
+                break
+
+            count -= len(buff)
+
     def _do_download_cdxj(self, cdxj_key, output_key):
         lock_key = None
         try:
@@ -952,10 +1589,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
                 fh = None
                 try:
                     fh = load(cdxj_filename)
-                    buff = fh.read()
 
-                    for cdxj_line in buff.splitlines():
-                        self.redis.zadd(output_key, 0, cdxj_line)
+                    cdxj_loader = CDXJBulkLoader(self.redis, output_key)
+                    cdxj_loader.load_stream(fh)
+                    cdxj_loader.close()
 
                     break
                 except Exception as e:
@@ -968,6 +1605,7 @@ class Collection(PagesMixin, RedisUniqueComponent):
                         fh.close()
 
             self.reset_cdxj_ttl(output_key)
+            self.track_cdxj_size(output_key)
 
         except Exception as e:
             logger.error('CDX Sync: Error downloading cache: ' + str(e))
@@ -977,6 +1615,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
             if lock_key:
                 self.redis.delete(lock_key)
 
+            build_key = self.COLL_CDXJ_BUILD_KEY.format(coll=self.my_id)
+            if self.redis.decr(build_key) <= 0:
+                self.redis.delete(build_key)
+
 
 # ============================================================================
 Recording.OWNER_CLS = Collection
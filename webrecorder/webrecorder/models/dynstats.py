@@ -1,4 +1,4 @@
-from webrecorder.utils import redis_pipeline
+from webrecorder.models.stats import Stats
 
 # ============================================================================
 class DynStats(object):
@@ -12,6 +12,8 @@ class DynStats(object):
 
         self.dyn_stats_secs = config['dyn_stats_secs']
 
+        self.stats = Stats(redis)
+
     def _res_url_templ(self, base_templ, params, url=''):
         rec = params['rec']
         if not rec or rec == '*':
@@ -36,43 +38,48 @@ class DynStats(object):
         curr_url_key = self._res_url_templ(self.dyn_stats_key_templ,
                                            params, url)
 
-        with redis_pipeline(self.redis) as pi:
+        with self.stats.counter_pipeline() as pi:
             pi.delete(curr_url_key)
 
             pi.hincrby(dyn_stats_key, source, 1)
             pi.expire(dyn_stats_key, self.dyn_stats_secs)
 
-            if url.endswith('.css'):
-                css_res = self._res_url_templ(self.dyn_ref_templ, params, url)
-                pi.setex(css_res, self.dyn_stats_secs, referrer)
+        # css referrer lookup must see this immediately
+        if url.endswith('.css'):
+            css_res = self._res_url_templ(self.dyn_ref_templ, params, url)
+            self.redis.setex(css_res, self.dyn_stats_secs, referrer)
 
-            if ra_recording:
-                ra_recording.track_remote_archive(pi, source)
+        if ra_recording:
+            ra_recording.track_remote_archive(self.redis, source)
 
-    def get_dyn_stats(self, user, collection, recording, sesh_id, stats_urls):
-        params = {'user': user.name,
-                  'coll': collection.my_id,
+    def get_dyn_stats_keys(self, collection, recording, sesh_id, stats_urls):
+        params = {'coll': collection.my_id,
                   'rec': recording.my_id if recording else 0,
                   'id': sesh_id}
 
-        sum_stats = {}
-
-        for url in stats_urls:
-            dyn_stats_key = self._res_url_templ(self.dyn_stats_key_templ,
-                                                params, url)
-
-            stats = self.redis.hgetall(dyn_stats_key)
-            if not stats:
-                continue
+        return [self._res_url_templ(self.dyn_stats_key_templ, params, url)
+                for url in stats_urls]
 
-            self.redis.expire(dyn_stats_key, self.dyn_stats_secs)
+    def sum_dyn_stats(self, all_stats):
+        sum_stats = {}
 
+        for stats in all_stats:
             for stat, value in stats.items():
                 sum_stats[stat] = int(value) + int(sum_stats.get(stat, 0))
 
-
         return sum_stats
 
+    def get_dyn_stats(self, user, collection, recording, sesh_id, stats_urls):
+        dyn_stats_keys = self.get_dyn_stats_keys(collection, recording, sesh_id, stats_urls)
+
+        pi = self.redis.pipeline(transaction=False)
+        for dyn_stats_key in dyn_stats_keys:
+            pi.hgetall(dyn_stats_key)
+            pi.expire(dyn_stats_key, self.dyn_stats_secs)
+
+        # skip expire results
+        return self.sum_dyn_stats(pi.execute()[::2])
+
     def get_cookie_key(self, user, collection, recording, sesh_id):
         params = {'user': user.name,
                   'coll': collection.my_id,
@@ -1,4 +1,5 @@
 from tempfile import SpooledTemporaryFile, NamedTemporaryFile
+from io import BytesIO
 from bottle import request
 
 from warcio.archiveiterator import ArchiveIterator
@@ -8,23 +9,36 @@ from har2warc.har2warc import har2warc
 import codecs
 
 from warcio.warcwriter import BufferWARCWriter, WARCWriter
-from warcio.timeutils import iso_date_to_datetime
+from warcio.timeutils import iso_date_to_datetime, timestamp20_now
 
 
 from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.indexer.archiveindexer import DefaultRecordParser
 
 import traceback
 import json
 import requests
 import atexit
+import multiprocessing
 
 import base64
+import glob
+import gzip
+import hashlib
 import os
+import shutil
+import socket
 import gevent
 import redis
 
+from collections import deque
+from string import Formatter
+from gevent.socket import wait_read
+
 from webrecorder.utils import SizeTrackingReader, CacheingLimitReader
 from webrecorder.utils import get_bool, redis_pipeline, sanitize_title
+from webrecorder.rec.webrecrecorder import CDXJIndexer
+from webrecorder.load.wamloader import WAMLoader
 
 import logging
 logger = logging.getLogger(__name__)
@@ -230,7 +244,10 @@ class BaseImporter(ImportStatusChecker):
                 count += 1
                 logger.debug('Id: {0}, Uploading Rec {1} of {2}'.format(upload_key, count, num_recs))
 
-                if info['length'] > 0:
+                if info['length'] > 0 and info.get('warc_path'):
+                    self.add_indexed_upload(upload_key, user.name, info)
+
+                elif info['length'] > 0:
                     self.do_upload(upload_key,
                                    filename,
                                    stream,
@@ -266,8 +283,12 @@ class BaseImporter(ImportStatusChecker):
 
         finally:
             # add remainder of file, assumed consumed/skipped, if any
-            last_end = stream.tell()
-            stream.close()
+            # (no stream if upload was already written and indexed on parse)
+            if stream:
+                last_end = stream.tell()
+                stream.close()
+            else:
+                last_end = total_size
 
             if last_end < total_size:
                 diff = total_size - last_end
@@ -287,7 +308,8 @@ class BaseImporter(ImportStatusChecker):
         # detect pages if none
         detected = False
         if pages is None:
-            pages = self.detect_pages(info['coll'], info['rec'], upload_key, total_size)
+            pages = self.detect_pages(info['coll'], info['rec'], upload_key, total_size,
+                                      info.get('cdx_list'))
             detected = True
 
         # if no pages, nothing more to do
@@ -353,7 +375,8 @@ class BaseImporter(ImportStatusChecker):
         :returns: collection and recordings
         :rtype: Collection and list
         """
-        stream.seek(0)
+        if stream:
+            stream.seek(0)
 
         count = 0
 
@@ -413,6 +436,8 @@ class BaseImporter(ImportStatusChecker):
                                   'created_at': info.get('created_at'),
                                   'updated_at': info.get('updated_at'),
                                   'recorded_at': info.get('recorded_at', info.get('updated_at')),
+                                  'warc_path': info.get('warc_path'),
+                                  'cdx_list': info.get('cdx_list'),
                                  })
 
             if not first_coll:
@@ -445,11 +470,13 @@ class BaseImporter(ImportStatusChecker):
                     bookmark_data['page_id'] = page_id_map.get(page_id)
                 bookmark = blist.create_bookmark(bookmark_data, incr_stats=False)
 
-    def detect_pages(self, coll, rec, upload_key, total_size):
+    def detect_pages(self, coll, rec, upload_key, total_size, cdx_list=None):
         """Find pages in recording.
 
         :param str coll: collection ID
         :param str rec: recording ID
+        :param cdx_list: CDXJ lines of recording, if already known
+        :type: list or None
 
         :returns: pages
         :rtype: list
@@ -459,13 +486,22 @@ class BaseImporter(ImportStatusChecker):
         pages = []
         count = 0
 
-        total_cdx = self.redis.zcard(key)
+        if cdx_list is not None:
+            total_cdx = len(cdx_list)
+            members = sorted(cdx_list)
+        else:
+            total_cdx = self.redis.zcard(key)
+            members = (member.encode('utf-8') for member, score in
+                       self.redis.zscan_iter(key, match='*', count=100))
+
+        if not total_cdx:
+            return pages
 
         incr = int((total_size * 0.25) / total_cdx)
         count = 0
 
-        for member, score in self.redis.zscan_iter(key, match='*', count=100):
-            cdxj = CDXObject(member.encode('utf-8'))
+        for member in members:
+            cdxj = CDXObject(member)
 
             count += 1
             self.redis.hincrby(upload_key, 'size', incr)
@@ -512,21 +548,69 @@ class BaseImporter(ImportStatusChecker):
 
         return False
 
-    def parse_uploaded(self, stream, expected_size):
+    def parse_uploaded(self, stream, expected_size, splitter=None):
         """Parse WARC archive.
 
+        If a splitter is specified, the archive is also indexed in the same
+        pass, the CDXJ lines added to the splitter per recording.
+
         :param stream: file object
         :param int expected_size: expected WARC archive size
+        :param splitter: per-recording WARC writer
+        :type: UploadSplitWriter or None
 
         :returns: list of recordings (indices)
         :rtype: list
         """
-        arciterator = ArchiveIterator(stream,
-                                      no_record_parse=True,
-                                      verify_http=True,
-                                      block_size=BLOCK_SIZE)
         infos = []
 
+        if not splitter:
+            arciterator = ArchiveIterator(stream,
+                                          no_record_parse=True,
+                                          verify_http=True,
+                                          block_size=BLOCK_SIZE)
+
+            for record in self.iter_upload_records(arciterator, stream, infos):
+                pass
+
+        else:
+            arciterator = ArchiveIterator(stream,
+                                          ensure_http_headers=True,
+                                          block_size=BLOCK_SIZE)
+
+            records = UploadRecordIter(arciterator,
+                                       self.iter_upload_records(arciterator, stream, infos, splitter))
+
+            parser = DefaultRecordParser(cdxj=True, append_post=True)
+
+            entry_iter = parser.join_request_records(parser.create_record_iter(records))
+
+            for entry in entry_iter:
+                if entry.record.rec_type not in ('request', 'warcinfo'):
+                    splitter.add_entry(entry)
+
+        # if anything left over, likely due to WARC error, consume remainder
+        if stream.tell() < expected_size:
+            while True:
+                buff = stream.read(8192)
+                if not buff:
+                    break
+
+        return infos
+
+    def iter_upload_records(self, arciterator, stream, infos, splitter=None):
+        """Iterate over WARC archive records, adding recordings
+        (indices) to list of recordings. warcinfo records are consumed.
+
+        :param ArchiveIterator arciterator: WARC archive iterator
+        :param stream: file object
+        :param list infos: list of recordings (indices)
+        :param splitter: per-recording WARC writer
+        :type: UploadSplitWriter or None
+
+        :returns: WARC records
+        :rtype: generator
+        """
         last_indexinfo = None
         indexinfo = None
         is_first = True
@@ -541,22 +625,28 @@ class BaseImporter(ImportStatusChecker):
                     print('Error Parsing WARCINFO')
                     traceback.print_exc()
 
-            elif remote_archives is not None:
-                source_uri = record.rec_headers.get('WARC-Source-URI')
-                if source_uri:
-                    if self.wam_loader:
-                        res = self.wam_loader.find_archive_for_url(source_uri)
-                        if res:
-                            remote_archives.add(res[2])
+            else:
+                if remote_archives is not None:
+                    source_uri = record.rec_headers.get('WARC-Source-URI')
+                    if source_uri:
+                        if self.wam_loader:
+                            res = self.wam_loader.find_archive_for_url(source_uri)
+                            if res:
+                                remote_archives.add(res[2])
+
+                yield record
 
             arciterator.read_to_end(record)
 
             if last_indexinfo:
                 last_indexinfo['offset'] = arciterator.member_info[0]
+                if splitter:
+                    splitter.start_segment(last_indexinfo, last_indexinfo['offset'])
+
                 last_indexinfo = None
 
             if warcinfo and 'json-metadata' in warcinfo:
-                self.add_index_info(infos, indexinfo, arciterator.member_info[0])
+                self.add_index_info(infos, indexinfo, arciterator.member_info[0], splitter)
 
                 indexinfo = warcinfo.get('json-metadata')
                 indexinfo['offset'] = None
@@ -578,6 +668,9 @@ class BaseImporter(ImportStatusChecker):
                              'offset': 0,
                             }
 
+                if splitter:
+                    splitter.start_segment(indexinfo, 0)
+
             if is_first and warcinfo and 'software' in warcinfo:
                 indexinfo['warcinfo:software'] = warcinfo['software']
                 indexinfo['warcinfo:datetime'] = record.rec_headers.get('WARC-Date')
@@ -585,23 +678,45 @@ class BaseImporter(ImportStatusChecker):
             is_first = False
 
         if indexinfo:
-            self.add_index_info(infos, indexinfo, stream.tell())
+            self.add_index_info(infos, indexinfo, stream.tell(), splitter)
 
-        # if anything left over, likely due to WARC error, consume remainder
-        if stream.tell() < expected_size:
-            while True:
-                buff = stream.read(8192)
-                if not buff:
-                    break
+    def index_inplace(self, filename, base_name, upload_key=None):
+        """Parse and index WARC archive in place, in a single pass.
 
-        return infos
+        :param str filename: WARC archive filename
+        :param str base_name: WARC archive filename in index
+        :param upload_key: upload Redis key, to track progress
+        :type: str or None
+
+        :returns: list of recordings (indices) with CDXJ lines, None on error
+        :rtype: list or None
+        """
+        try:
+            size = os.path.getsize(filename)
+            index_writer = UploadIndexWriter(filename, base_name)
+
+            with open(filename, 'rb') as fh:
+                stream = fh
+                if upload_key:
+                    stream = SizeTrackingReader(fh, size, self.redis, upload_key)
+
+                infos = self.parse_uploaded(stream, size, index_writer)
+
+            index_writer.close()
+            return infos
 
-    def add_index_info(self, infos, indexinfo, curr_offset):
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    def add_index_info(self, infos, indexinfo, curr_offset, splitter=None):
         """Add index to list of recordings.
 
         :param list infos: list of recordings (indices)
         :param dict indexinfo: information about index
         :param int curr_offset: current offset to start of stream
+        :param splitter: per-recording WARC writer
+        :type: UploadSplitWriter or None
         """
         if not indexinfo or indexinfo.get('offset') is None:
             return
@@ -610,6 +725,9 @@ class BaseImporter(ImportStatusChecker):
 
         infos.append(indexinfo)
 
+        if splitter:
+            splitter.end_segment(indexinfo, curr_offset)
+
     def parse_warcinfo(self, record):
         """Parse WARC information.
 
@@ -656,6 +774,27 @@ class BaseImporter(ImportStatusChecker):
     def to_gmt_string(cls, dt):
         return iso_date_to_datetime(dt).strftime("%Y-%m-%d %H:%M:%S") + ' GMT'
 
+    def add_indexed_upload(self, upload_key, user, info):
+        """Add recording WARC written and indexed while parsing
+        the upload to the recording, without re-reading it.
+
+        :param str upload_key: upload Redis key
+        :param str user: username
+        :param dict info: recording information
+        """
+        params = {'param.user': user,
+                  'param.coll': info['coll'],
+                  'param.rec': info['rec'],
+                  'param.upid': upload_key,
+                 }
+
+        logger.debug('add_indexed_upload(): {0} file: {1}: len: {2}'.format(info['rec'], info['warc_path'], info['length']))
+
+        self.indexer.add_warc_file(info['warc_path'], params)
+        self.indexer.add_cdx_to_index(info['cdx_list'], params, info['length'])
+
+        self._add_indexed_size(info['length'], upload_key)
+
     def do_upload(self, upload_key, filename, stream, user, coll, rec, offset, length):
         raise NotImplemented()
 
@@ -671,6 +810,9 @@ class BaseImporter(ImportStatusChecker):
     def _add_split_padding(self, diff, upload_key):
         raise NotImplemented()
 
+    def _add_indexed_size(self, length, upload_key):
+        raise NotImplemented()
+
     def _har2warc_temp_file(self, filename):
         raise NotImplemented()
 
@@ -678,9 +820,295 @@ class BaseImporter(ImportStatusChecker):
         raise NotImplemented()
 
 
+# ============================================================================
+class UploadRecordIter(object):
+    """Record iterator passed to the CDXJ record parser, wrapping
+    the upload record generator.
+
+    :ivar ArchiveIterator arciterator: WARC archive iterator
+    :ivar records: WARC records
+    """
+    def __init__(self, arciterator, records):
+        """Initialize record iterator.
+
+        :param ArchiveIterator arciterator: WARC archive iterator
+        :param records: WARC records
+        """
+        self.arciterator = arciterator
+        self.records = records
+
+    def __iter__(self):
+        return self.records
+
+    def read_to_end(self, record=None):
+        self.arciterator.read_to_end(record)
+
+    @property
+    def member_info(self):
+        return self.arciterator.member_info
+
+
+# ============================================================================
+class UploadIndexWriter(object):
+    """Collect the CDXJ index lines of each recording in a WARC archive,
+    as it is parsed. The archive is indexed in place, offsets relative
+    to the start of the archive.
+
+    :ivar str warc_path: WARC archive path
+    :ivar str filename: WARC archive filename in index
+    :ivar list segments: recordings, in order
+    """
+    def __init__(self, warc_path, filename):
+        """Initialize index writer.
+
+        :param str warc_path: WARC archive path
+        :param str filename: WARC archive filename in index
+        """
+        self.warc_path = warc_path
+        self.filename = filename
+        self.segments = []
+
+    def start_segment(self, info, offset):
+        """Start recording at offset.
+
+        :param dict info: recording information
+        :param int offset: offset to start of recording
+        """
+        if info.get('type') != 'recording':
+            return
+
+        segment = {'info': info,
+                   'start': offset,
+                   'end': None,
+                   'base': 0,
+                   'path': self.warc_path,
+                   'filename': self.filename,
+                  }
+
+        self._add_recording(segment)
+
+    def end_segment(self, info, offset):
+        """Mark end of recording.
+
+        :param dict info: recording information
+        :param int offset: offset to end of recording
+        """
+        if self.segments and self.segments[-1]['info'] is info:
+            self.segments[-1]['end'] = offset
+
+    def _add_recording(self, segment):
+        segment['cdx_out'] = BytesIO()
+        segment['cdx'] = CDXJIndexer(segment['cdx_out'])
+        segment['info']['warc_path'] = segment['path']
+        self.segments.append(segment)
+
+    def add_entry(self, entry):
+        """Add index entry to index of recording it belongs to.
+
+        :param entry: index entry
+        """
+        offset = int(entry['offset'])
+
+        for segment in reversed(self.segments):
+            if segment['start'] <= offset:
+                break
+        else:
+            return
+
+        if segment['end'] is not None and offset >= segment['end']:
+            return
+
+        entry['offset'] = str(offset - segment['base'])
+        segment['cdx'].write(entry, segment['filename'])
+
+    def close(self):
+        """Finish indexing, setting CDXJ lines of each recording."""
+        for segment in self.segments:
+            cdx_list = segment['cdx_out'].getvalue().rstrip().split(b'\n')
+            segment['info']['cdx_list'] = [line for line in cdx_list if line]
+
+            # no longer needed, info may be sent to another process
+            segment['cdx'] = segment['cdx_out'] = None
+
+
+# ============================================================================
+class UploadSplitWriter(UploadIndexWriter):
+    """Write uploaded WARC archive, as it is read, into a new WARC file
+    per recording and collect the CDXJ index lines of each file.
+
+    Data not part of a recording (e.g. collection warcinfo) is
+    written to a scratch file and removed.
+
+    :ivar str warc_dir: directory of new WARC files
+    :ivar str filename_templ: WARC filename template
+    :ivar str hostname: hostname
+    :ivar dict curr: segment currently written to
+    :ivar int pos: number of bytes written
+    """
+    def __init__(self, warc_dir, filename_templ):
+        """Initialize writer.
+
+        :param str warc_dir: directory of new WARC files
+        :param str filename_templ: WARC filename template
+        """
+        super(UploadSplitWriter, self).__init__(None, None)
+        self.warc_dir = warc_dir
+        self.filename_templ = filename_templ
+        self.hostname = socket.gethostname()
+
+        os.makedirs(warc_dir, exist_ok=True)
+
+        self.pos = 0
+        self.curr = self._new_segment(None, 0)
+
+    def _new_segment(self, info, offset):
+        filename = self.filename_templ.format(timestamp=timestamp20_now(),
+                                              hostname=self.hostname,
+                                              random=base64.b32encode(os.urandom(5)).decode('utf-8'))
+
+        path = os.path.join(self.warc_dir, filename)
+
+        segment = {'info': info,
+                   'start': offset,
+                   'end': None,
+                   'base': offset,
+                   'path': path,
+                   'filename': filename,
+                   'fh': open(path, 'w+b'),
+                  }
+
+        if info:
+            self._add_recording(segment)
+
+        return segment
+
+    def write(self, buff):
+        self.curr['fh'].write(buff)
+        self.pos += len(buff)
+
+    def start_segment(self, info, offset):
+        """Start writing new recording (or discarding non-recording data)
+        from offset, moving any data already read past the offset.
+
+        :param dict info: recording information
+        :param int offset: offset to start of recording
+        """
+        curr = self.curr
+        is_rec = (info.get('type') == 'recording')
+
+        if not curr['info']:
+            # no data yet for a recording, keep scratch file
+            if not is_rec:
+                return
+
+            # scratch file starts at offset, use as recording file
+            if curr['start'] == offset:
+                curr['info'] = info
+                self._add_recording(curr)
+                return
+
+        segment = self._new_segment(info if is_rec else None, offset)
+
+        curr['fh'].seek(offset - curr['start'])
+        shutil.copyfileobj(curr['fh'], segment['fh'])
+
+        self._close_segment(curr, offset)
+
+        self.curr = segment
+
+    def end_segment(self, info, offset):
+        """Mark end of current recording.
+
+        :param dict info: recording information
+        :param int offset: offset to end of recording
+        """
+        if self.curr['info'] is info:
+            self.curr['end'] = offset
+
+    def _close_segment(self, segment, offset):
+        end = segment['end'] if segment['end'] is not None else offset
+        segment['end'] = end
+
+        fh = segment['fh']
+        fh.truncate(end - segment['start'])
+        fh.close()
+
+        if not segment['info'] or end == segment['start']:
+            os.remove(segment['path'])
+            if segment['info']:
+                segment['info'].pop('warc_path', '')
+
+    def close(self):
+        """Finish writing, setting CDXJ lines of each recording."""
+        self._close_segment(self.curr, self.pos)
+
+        super(UploadSplitWriter, self).close()
+
+    def remove_all(self):
+        """Remove all WARC files written."""
+        if not self.curr['fh'].closed:
+            self._close_segment(self.curr, self.pos)
+
+        for segment in self.segments:
+            if os.path.isfile(segment['path']):
+                os.remove(segment['path'])
+
+            segment['info'].pop('warc_path', '')
+
+
 # ============================================================================
 class UploadImporter(BaseImporter):
-    """WARC archive importer (upload)."""
+    """WARC archive importer (upload).
+
+    If an indexer is set, the upload is imported in a single pass:
+    written into per-recording WARC files and indexed while parsing,
+    rather than spooled and sent to the recorder to be parsed again.
+
+    :ivar indexer: index writer, for single-pass import
+    :ivar str warc_dir_templ: recording WARC directory template
+    :ivar str warc_name_templ: recording WARC filename template
+    """
+    def __init__(self, redis, config, wam_loader=None, indexer=None):
+        """Initialize upload importer.
+
+        :param StrictRedis redis: Redis interface
+        :param dict config: Webrecorder configuration
+        :param wam_loader: n.s.
+        :param indexer: index writer, for single-pass import
+        """
+        super(UploadImporter, self).__init__(redis, config, wam_loader)
+        self.indexer = indexer
+
+        self.warc_dir_templ = os.environ.get('RECORD_ROOT', '') + config['warc_path_templ']
+        self.warc_name_templ = config['warc_name_templ']
+
+    def get_upload_warc_dir(self, user):
+        """Return directory to write recording WARC files of upload into.
+
+        Collection and recordings are not known until the upload is
+        parsed, so the directory template is only filled in up to the
+        first field other than the user (e.g. '{user}/{coll}/{rec}/'
+        becomes '<user>/').
+
+        :param User user: user
+
+        :returns: directory
+        :rtype: str
+        """
+        warc_dir = ''
+        for literal, field, spec, conv in Formatter().parse(self.warc_dir_templ):
+            warc_dir += literal
+            if field is None:
+                break
+
+            if field != 'user':
+                warc_dir = os.path.dirname(warc_dir) + os.path.sep
+                break
+
+            warc_dir += user.name
+
+        return warc_dir
+
     def upload_file(self, user, stream, expected_size, filename, force_coll_name=''):
         """Upload WARC archive.
 
@@ -715,6 +1143,9 @@ class UploadImporter(BaseImporter):
             #status = 'Collection {0} not found'.format(force_coll_name)
             return {'error': 'no_such_collection'}
 
+        if self.indexer:
+            return self.upload_file_single_pass(user, stream, expected_size, filename, force_coll_name)
+
         temp_file = SpooledTemporaryFile(max_size=BLOCK_SIZE)
 
         stream = CacheingLimitReader(stream, expected_size, temp_file)
@@ -735,6 +1166,54 @@ class UploadImporter(BaseImporter):
         return self.handle_upload(temp_file, upload_id, upload_key, infos, filename,
                                   user, force_coll_name, total_size)
 
+    def upload_file_single_pass(self, user, stream, expected_size, filename, force_coll_name):
+        """Upload WARC archive, writing and indexing each recording
+        while parsing.
+
+        :param User user: user
+        :param stream: file object
+        :param int expected_size: expected WARC archive size
+        :param str filename: WARC archive filename
+        :param str force_coll_name: name of collection to upload into
+
+        :returns: upload information
+        :rtype: dict
+        """
+        har_file = None
+        if filename.endswith('.har'):
+            har_file, expected_size = self.har2warc(filename, LimitReader(stream, expected_size))
+            stream = har_file
+
+        splitter = UploadSplitWriter(self.get_upload_warc_dir(user),
+                                     self.warc_name_templ)
+
+        stream = CacheingLimitReader(stream, expected_size, splitter)
+
+        try:
+            infos = self.parse_uploaded(stream, expected_size, splitter)
+            splitter.close()
+        except:
+            splitter.remove_all()
+            raise
+        finally:
+            if har_file:
+                har_file.close()
+
+        total_size = stream.tell()
+        if total_size != expected_size:
+            splitter.remove_all()
+            return {'error': 'incomplete_upload', 'expected': expected_size, 'actual': total_size}
+
+        upload_id, upload_key = self._init_upload_status(user, total_size, 1, filename=filename)
+
+        res = self.handle_upload(None, upload_id, upload_key, infos, filename,
+                                 user, force_coll_name, total_size)
+
+        if 'error' in res:
+            splitter.remove_all()
+
+        return res
+
     def do_upload(self, upload_key, filename, stream, user, coll, rec, offset, length):
         """Send PUT request to upload recording.
 
@@ -788,6 +1267,14 @@ class UploadImporter(BaseImporter):
         """
         self.redis.hincrby(upload_key, 'size', diff * 2)
 
+    def _add_indexed_size(self, length, upload_key):
+        """Update size of upload by size of recording written and indexed.
+
+        :param int length: size of recording
+        :param str upload_key: upload Redis key
+        """
+        self.redis.hincrby(upload_key, 'size', length * 2)
+
     def _har2warc_temp_file(self, filename):
         """Return temporary file.
 
@@ -844,9 +1331,12 @@ class InplaceImporter(BaseImporter):
     :ivar str upload_id: upload ID
     :ivar the_collection: collection to import WARC archive into
     :type: Collection or None
-    :ivar str cache_dir: cache directory
+    :ivar str cache_dir: cache directory (including per-archive index cache)
+    :ivar int index_workers: number of indexing worker processes
     :ivar str wr_temp_coll: temporary collection
     """
+    INDEX_CACHE_VERSION = '1.0'
+
     def __init__(self, redis, config, user, indexer, upload_id, create_coll=True, cache_dir=None):
         wam_loader = indexer.wam_loader if indexer else None
         super(InplaceImporter, self).__init__(redis, config, wam_loader)
@@ -854,6 +1344,8 @@ class InplaceImporter(BaseImporter):
         self.upload_id = upload_id
         self.cache_dir = cache_dir
 
+        self.index_workers = int(config.get('inplace_index_workers', 0)) or os.cpu_count() or 1
+
         self.wr_temp_coll = config['wr_temp_coll']
 
         if not create_coll:
@@ -882,15 +1374,34 @@ class InplaceImporter(BaseImporter):
 
         gevent.sleep(0)
 
+        indexed = self.index_files(user, files, upload_key)
+
         for filename in files:
             size = 0
             fh = None
+            infos = None
             try:
                 size = os.path.getsize(filename)
-                fh = open(filename, 'rb')
 
                 self.redis.hset(upload_key, 'filename', filename)
 
+                # already parsed and indexed, or cached, add to index
+                if filename in indexed:
+                    infos = indexed.pop(filename)
+                    if infos is None:
+                        infos = self.load_cached_index(filename)
+                        if infos is not None:
+                            self.redis.hincrby(upload_key, 'size', size)
+
+                if infos is not None:
+                    res = self.handle_upload(None, upload_id, upload_key, infos,
+                                             filename, user, False, size)
+
+                    assert('error' not in res)
+                    continue
+
+                fh = open(filename, 'rb')
+
                 stream = SizeTrackingReader(fh, size, self.redis, upload_key)
 
                 if filename.endswith('.har'):
@@ -915,6 +1426,226 @@ class InplaceImporter(BaseImporter):
                     self.redis.hincrby(upload_key, 'files', -1)
                     fh.close()
 
+    def index_files(self, user, files, upload_key):
+        """Parse and index WARC archives, each in a single pass.
+
+        Archives unchanged since last indexed have an index cache file,
+        if any, which is only loaded when the archive is imported. The
+        rest are indexed in worker processes, one archive at a time per
+        worker, or in this process if only one. The recordings and CDXJ
+        lines are returned to be added to the index by this process.
+
+        Archives not indexed (HAR files, or on error) are imported
+        by this process as before.
+
+        :param User user: user
+        :param list files: list of filenames
+        :param str upload_key: upload Redis key
+
+        :returns: recordings (indices), by filename, None if cached
+        :rtype: dict
+        """
+        params = {'param.user': user.name}
+
+        tasks = deque()
+        results = {}
+
+        for filename in files:
+            if filename.endswith('.har'):
+                continue
+
+            cache_file = self._get_index_cache_file(filename)
+            if cache_file and os.path.isfile(cache_file):
+                results[filename] = None
+            else:
+                tasks.append((filename, self.indexer._get_rel_or_base_name(filename, params)))
+
+        new_files = [filename for filename, base_name in tasks]
+
+        if self.index_workers > 1 and len(tasks) > 1:
+            self.index_in_workers(tasks, results, upload_key)
+
+        # index any remaining in this process
+        while tasks:
+            filename, base_name = tasks.popleft()
+            infos = self.index_inplace(filename, base_name, upload_key)
+            if infos is not None:
+                results[filename] = infos
+
+        for filename in new_files:
+            if filename in results:
+                self.save_cached_index(filename, results[filename])
+
+        return results
+
+    def index_in_workers(self, tasks, results, upload_key):
+        """Parse and index WARC archives in worker processes.
+
+        :param deque tasks: archives to index
+        :param dict results: recordings (indices), by filename
+        :param str upload_key: upload Redis key
+        """
+        # spawn, as forking is not supported from gevent threadpool
+        ctx = multiprocessing.get_context('spawn')
+
+        feeders = []
+
+        try:
+            for i in range(min(self.index_workers, len(tasks))):
+                tasks_in, tasks_out = ctx.Pipe(duplex=False)
+                results_in, results_out = ctx.Pipe(duplex=False)
+
+                proc = ctx.Process(target=index_worker,
+                                   args=(self.config, tasks_in, results_out),
+                                   daemon=True)
+                proc.start()
+
+                tasks_in.close()
+                results_out.close()
+
+                feeders.append(gevent.spawn(self._feed_index_worker, proc,
+                                            tasks_out, results_in,
+                                            tasks, results, upload_key))
+        except Exception:
+            print('Index workers not started, indexing in process')
+            traceback.print_exc()
+
+        gevent.joinall(feeders)
+
+    def _get_index_cache_file(self, filename):
+        """Return index cache file of WARC archive, named by its path
+        and by its size and modification time, so that only a cache file
+        of the unchanged archive exists under this name.
+
+        :param str filename: WARC archive filename
+
+        :returns: index cache file, None if no cache directory
+        :rtype: str or None
+        """
+        if not self.cache_dir:
+            return None
+
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+
+        file_check = json.dumps([self.INDEX_CACHE_VERSION, self._get_file_check(filename)], sort_keys=True)
+        check = hashlib.sha1(file_check.encode('utf-8')).hexdigest()[:16]
+
+        return os.path.join(self.cache_dir, 'index', key + '-' + check + '.json.gz')
+
+    def _get_file_check(self, filename):
+        res = os.stat(filename)
+        return {'path': os.path.abspath(filename),
+                'file_size': res.st_size,
+                'file_mod': res.st_mtime}
+
+    def load_cached_index(self, filename):
+        """Return recordings (indices) with CDXJ lines of WARC archive
+        from index cache, if archive unchanged since cached.
+
+        :param str filename: WARC archive filename
+
+        :returns: list of recordings (indices) or None
+        :rtype: list or None
+        """
+        cache_file = self._get_index_cache_file(filename)
+        if not cache_file or not os.path.isfile(cache_file):
+            return None
+
+        try:
+            with gzip.open(cache_file, 'rt') as fh:
+                root = json.loads(fh.read())
+
+            assert(root['version'] == self.INDEX_CACHE_VERSION)
+            assert(root['file_check'] == self._get_file_check(filename))
+
+            infos = root['infos']
+            for info in infos:
+                if 'ra' in info:
+                    info['ra'] = set(info['ra'])
+
+                if 'cdx_list' in info:
+                    info['cdx_list'] = [line.encode('utf-8') for line in info['cdx_list']]
+
+                if 'warc_path' in info:
+                    info['warc_path'] = filename
+
+        except Exception as e:
+            logger.debug('Index Cache Load from {0} Failed: {1}'.format(cache_file, e))
+            return None
+
+        logger.debug('Index Loaded from Cache: ' + filename)
+        return infos
+
+    def save_cached_index(self, filename, infos):
+        """Save recordings (indices) with CDXJ lines of WARC archive
+        to index cache.
+
+        :param str filename: WARC archive filename
+        :param list infos: list of recordings (indices)
+        """
+        cache_file = self._get_index_cache_file(filename)
+        if not cache_file:
+            return
+
+        def to_json(value):
+            if isinstance(value, set):
+                return list(value)
+            elif isinstance(value, bytes):
+                return value.decode('utf-8')
+
+            raise TypeError(repr(value))
+
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+            root = {'version': self.INDEX_CACHE_VERSION,
+                    'file_check': self._get_file_check(filename),
+                    'infos': infos}
+
+            with gzip.open(cache_file, 'wt') as fh:
+                fh.write(json.dumps(root, default=to_json))
+
+            # remove cache files of archive before it changed
+            prefix = cache_file.rsplit('-', 1)[0]
+            for old_file in glob.glob(glob.escape(prefix) + '-*.json.gz'):
+                if old_file != cache_file:
+                    os.remove(old_file)
+
+        except Exception as e:
+            logger.debug('Index Cache Save to {0} Failed: {1}'.format(cache_file, e))
+
+    def _feed_index_worker(self, proc, tasks_out, results_in, tasks, results, upload_key):
+        """Send WARC archives to index to worker process until none left.
+
+        :param Process proc: worker process
+        :param Connection tasks_out: archives to index
+        :param Connection results_in: recordings (indices) of archives
+        :param deque tasks: remaining archives to index
+        :param dict results: recordings (indices), by filename
+        :param str upload_key: upload Redis key
+        """
+        try:
+            while tasks:
+                filename, base_name = tasks.popleft()
+                tasks_out.send((filename, base_name))
+
+                wait_read(results_in.fileno())
+                infos = results_in.recv()
+
+                if infos is not None:
+                    results[filename] = infos
+                    self.redis.hincrby(upload_key, 'size', os.path.getsize(filename))
+
+            tasks_out.send(None)
+
+        except Exception:
+            traceback.print_exc()
+
+        finally:
+            tasks_out.close()
+            results_in.close()
+            proc.join()
+
     def do_upload(self, upload_key, filename, stream, user, coll, rec, offset, length):
         """Upload recording.
 
@@ -965,6 +1696,14 @@ class InplaceImporter(BaseImporter):
         """
         self.redis.hincrby(upload_key, 'size', diff)
 
+    def _add_indexed_size(self, length, upload_key):
+        """Update import size by size of recording indexed.
+
+        :param int length: size of recording
+        :param str upload_key: upload Redis key
+        """
+        self.redis.hincrby(upload_key, 'size', length)
+
     def _har2warc_temp_file(self, filename):
         """Return temporay file.
 
@@ -1017,3 +1756,27 @@ class InplaceImporter(BaseImporter):
         self.the_collection.set_bool_prop('public', True)
 
         return self.the_collection
+
+
+# ============================================================================
+def index_worker(config, tasks_in, results_out):
+    """Parse and index WARC archives in place, in a worker process,
+    sending back the recordings (indices) of each, with CDXJ lines.
+
+    :param dict config: Webrecorder configuration
+    :param Connection tasks_in: archives to index, None to exit
+    :param Connection results_out: recordings (indices), None on error
+    """
+    if not CDXJIndexer.wam_loader:
+        CDXJIndexer.wam_loader = WAMLoader()
+
+    importer = BaseImporter(None, config, CDXJIndexer.wam_loader)
+
+    while True:
+        task = tasks_in.recv()
+        if task is None:
+            break
+
+        filename, base_name = task
+
+        results_out.send(importer.index_inplace(filename, base_name))
@@ -1,8 +1,11 @@
 import json
 import hashlib
+import itertools
 import os
 
-from webrecorder.utils import get_bool
+from redis.exceptions import WatchError
+
+from webrecorder.utils import get_bool, redis_pipeline
 
 search_auto = get_bool(os.environ.get('SEARCH_AUTO'))
 
@@ -13,18 +16,36 @@ class PagesMixin(object):
 
     :cvar str PAGES_KEY: pages Redis key template
     :cvar str PAGE_BOOKMARKS_CACHE_KEY: temporary list of pages->bookmarks Redis key template
-    :ivar _pages_cache: n.s.
+    :cvar str PAGES_TS_KEY: page IDs by timestamp Redis key template
+    :cvar str PAGES_REC_KEY: page IDs by timestamp, per recording, Redis key template
+    :cvar str PAGES_TERMS_KEY: title and URL n-grams of pages Redis key template
+    (lexicographical, '<field>:<n-gram>\\0<page ID>')
+    :cvar str PAGES_LONG_KEY: page IDs with a title or URL longer than
+    MAX_INDEX_LEN, only partly in n-gram index, Redis key template
+    :cvar str PAGES_INDEX_VERSION_KEY: version of page indexes Redis key template
+    :cvar int PAGES_INDEX_VERSION: current version of page indexes
+    :cvar int NGRAM_LEN: length of indexed n-grams
+    :cvar int MAX_INDEX_LEN: max length of title and URL indexed per page
+    :cvar int PAGE_BATCH_SIZE: number of pages loaded per batch
     """
     PAGES_KEY = 'c:{coll}:p'
     PAGE_BOOKMARKS_CACHE_KEY = 'c:{coll}:p_to_b'
     PAGES_Q = 'c:{coll}:pq'
 
-    NEW_PAGES_Q = 'new_pages:q'
+    PAGES_TS_KEY = 'c:{coll}:p:ts'
+    PAGES_REC_KEY = 'c:{coll}:p:r:{rec}'
+    PAGES_TERMS_KEY = 'c:{coll}:p:terms'
+    PAGES_LONG_KEY = 'c:{coll}:p:long'
+
+    PAGES_INDEX_VERSION_KEY = 'c:{coll}:p:_v'
+    PAGES_INDEX_VERSION = 2
+
+    NGRAM_LEN = 3
+    MAX_INDEX_LEN = 512
 
-    def __init__(self, **kwargs):
-        """Initialize recording pages."""
-        super(PagesMixin, self).__init__(**kwargs)
-        self._pages_cache = None
+    PAGE_BATCH_SIZE = 500
+
+    NEW_PAGES_Q = 'new_pages:q'
 
     @property
     def pages_key(self):
@@ -57,7 +78,9 @@ class PagesMixin(object):
 
         pid = self._new_page_id(page)
 
-        self.redis.hset(self.pages_key, pid, json.dumps(page))
+        with redis_pipeline(self.redis) as pi:
+            pi.hset(self.pages_key, pid, json.dumps(page))
+            self._index_page(pi, pid, page)
 
         if search_auto and self.access.search_access():
             self.queue_page_for_derivs(pid, page)
@@ -117,11 +140,13 @@ class PagesMixin(object):
 
         return count
 
-    def delete_page(self, pid, all_page_bookmarks):
+    def delete_page(self, pid, all_page_bookmarks, page=None):
         """Delete page.
 
         :param str pid: page ID
         :param dict all_page_bookmarks: list of bookmarks
+        :param page: page, if already loaded
+        :type: dict or None
         """
         page_bookmarks = all_page_bookmarks.get(pid, {})
         for bid, list_id in page_bookmarks.items():
@@ -129,10 +154,15 @@ class PagesMixin(object):
             if blist:
                 blist.remove_bookmark(bid)
 
-        self.redis.hdel(self.pages_key, pid)
+        if page is None:
+            page = self.get_page(pid) or {}
 
         page_bookmarks_key = self.PAGE_BOOKMARKS_CACHE_KEY.format(coll=self.my_id)
-        self.redis.hdel(page_bookmarks_key, pid)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.hdel(self.pages_key, pid)
+            pi.hdel(page_bookmarks_key, pid)
+            self._unindex_page(pi, pid, page)
 
     def page_exists(self, pid):
         """Return whether page exists.
@@ -166,7 +196,10 @@ class PagesMixin(object):
 
         pid = page.get('id', '')
         if pid:
-            self.redis.hset(self.pages_key, pid, json.dumps(page))
+            with redis_pipeline(self.redis) as pi:
+                pi.hset(self.pages_key, pid, json.dumps(page))
+                # any terms no longer in page are filtered out by search
+                self._index_page(pi, pid, page)
 
     def count_pages(self):
         """Return number of pages.
@@ -202,12 +235,70 @@ class PagesMixin(object):
         :returns: list of pages
         :rtype: list
         """
-        rec_id = recording.my_id
+        return list(self.iter_pages(self.get_page_ids(rec=recording.my_id)))
 
-        if not self._pages_cache:
-            self._pages_cache = self.list_pages()
+    def count_rec_pages(self, recording):
+        """Return number of pages in recording.
+
+        :param Recording recording: recording
+
+        :returns: number of pages
+        :rtype: int
+        """
+        self.ensure_page_index()
 
-        return [page for page in self._pages_cache if page.get('rec') == rec_id]
+        return self.redis.zcard(self.PAGES_REC_KEY.format(coll=self.my_id,
+                                                          rec=recording.my_id))
+
+    def get_page_ids(self, rec=None, since=None, cursor=0, limit=0):
+        """Return page IDs in timestamp order.
+
+        :param rec: recording ID, all recordings if None
+        :type: str or None
+        :param since: min page timestamp (inclusive), may be a prefix
+        :type: str or None
+        :param int cursor: offset of first page ID
+        :param int limit: max number of page IDs, all if 0
+
+        :returns: page IDs
+        :rtype: list
+        """
+        self.ensure_page_index()
+
+        if rec:
+            key = self.PAGES_REC_KEY.format(coll=self.my_id, rec=rec)
+        else:
+            key = self.PAGES_TS_KEY.format(coll=self.my_id)
+
+        min_score = self.get_page_ts_score(since) if since else '-inf'
+
+        if limit:
+            return self.redis.zrangebyscore(key, min_score, '+inf',
+                                            start=cursor, num=limit)
+
+        return self.redis.zrangebyscore(key, min_score, '+inf')[cursor:]
+
+    def list_pages_range(self, rec=None, since=None, cursor=0, limit=0):
+        """List pages in timestamp order, one range at a time.
+
+        :param rec: recording ID, all recordings if None
+        :type: str or None
+        :param since: min page timestamp (inclusive), may be a prefix
+        :type: str or None
+        :param int cursor: offset of first page
+        :param int limit: max number of pages, all if 0
+
+        :returns: list of pages and cursor of next range (None if no more pages)
+        :rtype: tuple
+        """
+        pids = self.get_page_ids(rec, since, cursor, limit + 1 if limit else 0)
+
+        next_cursor = None
+        if limit and len(pids) > limit:
+            pids = pids[:limit]
+            next_cursor = cursor + limit
+
+        return list(self.iter_pages(pids)), next_cursor
 
     def get_pages_for_list(self, id_list):
         """List all pages in list of page IDs.
@@ -235,7 +326,9 @@ class PagesMixin(object):
         all_page_bookmarks = self.get_all_page_bookmarks(rec_pages)
 
         for n in rec_pages:
-            self.delete_page(n['id'], all_page_bookmarks)
+            self.delete_page(n['id'], all_page_bookmarks, n)
+
+        self.redis.delete(self.PAGES_REC_KEY.format(coll=self.my_id, rec=recording.my_id))
 
     def import_pages(self, pagelist, recording):
         """Import pages into recording.
@@ -267,10 +360,335 @@ class PagesMixin(object):
 
             pages[pid] = json.dumps(page)
 
-        self.redis.hmset(self.pages_key, pages)
+        with redis_pipeline(self.redis) as pi:
+            pi.hmset(self.pages_key, pages)
+
+            for page in pagelist:
+                self._index_page(pi, page['id'], page)
 
         return id_map
 
+    @classmethod
+    def get_page_ts_score(cls, timestamp):
+        """Return page timestamp as 14-digit number, for page indexes.
+
+        :param str timestamp: page timestamp
+
+        :returns: timestamp score
+        :rtype: int
+        """
+        try:
+            return int(str(timestamp)[:14].ljust(14, '0'))
+        except ValueError:
+            return 0
+
+    @classmethod
+    def get_ngrams(cls, text):
+        """Return distinct lowercase n-grams of text.
+
+        :param str text: text
+
+        :returns: n-grams
+        :rtype: set
+        """
+        text = (text or '').lower()
+        return set(text[i:i + cls.NGRAM_LEN]
+                   for i in range(len(text) - cls.NGRAM_LEN + 1))
+
+    def get_page_terms(self, page):
+        """Return indexed title and URL n-grams of page.
+
+        :param dict page: page
+
+        :returns: n-grams, prefixed with field, and whether the title
+        or URL is only partly indexed
+        :rtype: tuple
+        """
+        terms = set()
+        is_long = False
+        for field, prop in (('t', 'title'), ('u', 'url')):
+            text = page.get(prop) or ''
+            if len(text) > self.MAX_INDEX_LEN:
+                is_long = True
+
+            for gram in self.get_ngrams(text[:self.MAX_INDEX_LEN]):
+                terms.add(field + ':' + gram)
+
+        return terms, is_long
+
+    def _index_page(self, pi, pid, page):
+        """Add page to page indexes.
+
+        :param StrictRedis pi: Redis interface (pipeline)
+        :param str pid: page ID
+        :param dict page: page
+        """
+        score = self.get_page_ts_score(page.get('timestamp', ''))
+
+        pi.zadd(self.PAGES_TS_KEY.format(coll=self.my_id), score, pid)
+
+        if page.get('rec'):
+            pi.zadd(self.PAGES_REC_KEY.format(coll=self.my_id, rec=page['rec']), score, pid)
+
+        page_terms, is_long = self.get_page_terms(page)
+
+        terms = []
+        for term in page_terms:
+            terms.extend((0, term + '\0' + pid))
+
+        if terms:
+            pi.zadd(self.PAGES_TERMS_KEY.format(coll=self.my_id), *terms)
+
+        if is_long:
+            pi.sadd(self.PAGES_LONG_KEY.format(coll=self.my_id), pid)
+
+    def _unindex_page(self, pi, pid, page):
+        """Remove page from page indexes.
+
+        :param StrictRedis pi: Redis interface (pipeline)
+        :param str pid: page ID
+        :param dict page: page
+        """
+        pi.zrem(self.PAGES_TS_KEY.format(coll=self.my_id), pid)
+
+        if page.get('rec'):
+            pi.zrem(self.PAGES_REC_KEY.format(coll=self.my_id, rec=page['rec']), pid)
+
+        page_terms, is_long = self.get_page_terms(page)
+
+        terms = [term + '\0' + pid for term in page_terms]
+        if terms:
+            pi.zrem(self.PAGES_TERMS_KEY.format(coll=self.my_id), *terms)
+
+        pi.srem(self.PAGES_LONG_KEY.format(coll=self.my_id), pid)
+
+    def ensure_page_index(self):
+        """Rebuild page indexes once, if not at current version
+        (eg. pages added before page indexes were maintained).
+
+        The indexes are replaced in a single transaction, retried if
+        pages are changed while rebuilding.
+        """
+        version_key = self.PAGES_INDEX_VERSION_KEY.format(coll=self.my_id)
+        if self.redis.get(version_key) == str(self.PAGES_INDEX_VERSION):
+            return
+
+        rec_keys = list(self.redis.scan_iter(self.PAGES_REC_KEY.format(coll=self.my_id, rec='*')))
+
+        with self.redis.pipeline() as pi:
+            while True:
+                try:
+                    pi.watch(self.pages_key)
+
+                    page_data = pi.hgetall(self.pages_key)
+
+                    pi.multi()
+                    pi.delete(self.PAGES_TS_KEY.format(coll=self.my_id),
+                              self.PAGES_TERMS_KEY.format(coll=self.my_id),
+                              self.PAGES_LONG_KEY.format(coll=self.my_id),
+                              *rec_keys)
+
+                    for pid, value in page_data.items():
+                        self._index_page(pi, pid, json.loads(value))
+
+                    pi.set(version_key, self.PAGES_INDEX_VERSION)
+                    pi.execute()
+                    return
+
+                except WatchError:
+                    continue
+
+    def iter_pages(self, pids):
+        """Load pages in batches, in given order.
+
+        :param pids: page IDs
+        :type: list or generator
+
+        :returns: pages
+        :rtype: generator
+        """
+        pids = iter(pids)
+
+        while True:
+            batch = list(itertools.islice(pids, self.PAGE_BATCH_SIZE))
+            if not batch:
+                return
+
+            for pid, value in zip(batch, self.redis.hmget(self.pages_key, batch)):
+                # removed since listed
+                if not value:
+                    continue
+
+                page = json.loads(value)
+                page['id'] = pid
+                yield page
+
+    def _find_term_pages(self, field, text):
+        """Return IDs of pages which may contain text in given field,
+        those with all n-grams of text and those only partly indexed.
+
+        :param str field: field, 't' (title) or 'u' (URL)
+        :param str text: lowercase text
+
+        :returns: page IDs, None if text is too short to look up
+        :rtype: set or None
+        """
+        grams = self.get_ngrams(text)
+        if not grams:
+            return None
+
+        terms_key = self.PAGES_TERMS_KEY.format(coll=self.my_id)
+        pids = None
+
+        for gram in grams:
+            prefix = field + ':' + gram + '\0'
+            members = self.redis.zrangebylex(terms_key, '[' + prefix, '[' + prefix + '\U0010ffff')
+            found = set(member[len(prefix):] for member in members)
+
+            pids = found if pids is None else pids & found
+            if not pids:
+                break
+
+        return pids | self.redis.smembers(self.PAGES_LONG_KEY.format(coll=self.my_id))
+
+    def _iter_page_index(self, key, min_score, max_score, after=None):
+        """Return page IDs from page timestamp index in range,
+        in batches, starting after the given position.
+
+        :param str key: page timestamp index Redis key
+        :param min_score: min timestamp score
+        :type: int or str
+        :param max_score: max timestamp score
+        :type: int or str
+        :param after: timestamp score and ID of last page already returned
+        :type: tuple or None
+
+        :returns: page IDs
+        :rtype: generator
+        """
+        start = 0
+        if min_score != '-inf':
+            start = self.redis.zcount(key, '-inf', '(' + str(min_score))
+
+        # after pages with lower score, and same score pages (in ID order)
+        # up to last page, whether or not still in index
+        if after:
+            score, pid = after
+
+            pi = self.redis.pipeline(transaction=False)
+            pi.zcount(key, '-inf', '(' + str(score))
+            pi.zrangebyscore(key, score, score)
+            count, ties = pi.execute()
+
+            start = max(start, count + len([tie for tie in ties if tie <= pid]))
+
+        while True:
+            batch = self.redis.zrange(key, start, start + self.PAGE_BATCH_SIZE - 1,
+                                      withscores=True)
+
+            for pid, score in batch:
+                if max_score != '+inf' and score > max_score:
+                    return
+
+                yield pid
+
+            if len(batch) < self.PAGE_BATCH_SIZE:
+                return
+
+            start += len(batch)
+
+    def search_pages(self, search='', url='', ts_from=None, ts_to=None, rec=None, after=None):
+        """Search pages by title, URL, date and recording, in timestamp order.
+
+        Candidate pages are looked up from the page indexes, by title and
+        URL n-grams, by recording or by timestamp range, and then
+        checked against all filters.
+
+        :param str search: lowercase text contained in title
+        :param str url: lowercase text contained in URL
+        :param ts_from: min timestamp, 12 digits (minutes)
+        :type: int or None
+        :param ts_to: max timestamp, 12 digits (minutes)
+        :type: int or None
+        :param rec: recording ID
+        :type: str or None
+        :param after: position (timestamp score and ID) of last page
+        already returned, to resume search from
+        :type: tuple or None
+
+        :returns: pages
+        :rtype: generator
+        """
+        self.ensure_page_index()
+
+        date_filter = ts_from is not None and ts_to is not None
+        if date_filter:
+            min_score = ts_from * 100
+            max_score = ts_to * 100 + 99
+        else:
+            min_score = '-inf'
+            max_score = '+inf'
+
+        pids = None
+        for field, text in (('t', search), ('u', url)):
+            found = self._find_term_pages(field, text)
+            if found is not None:
+                pids = found if pids is None else pids & found
+
+        if pids is not None:
+            pids = list(pids)
+
+            pi = self.redis.pipeline(transaction=False)
+            ts_key = self.PAGES_TS_KEY.format(coll=self.my_id)
+            for pid in pids:
+                pi.zscore(ts_key, pid)
+
+            positions = sorted((score, pid) for score, pid in zip(pi.execute(), pids)
+                               if score is not None)
+
+            if after:
+                positions = [pos for pos in positions if pos > tuple(after)]
+
+            pids = [pid for score, pid in positions]
+
+        elif rec:
+            pids = self._iter_page_index(self.PAGES_REC_KEY.format(coll=self.my_id, rec=rec),
+                                         min_score, max_score, after)
+
+        else:
+            pids = self._iter_page_index(self.PAGES_TS_KEY.format(coll=self.my_id),
+                                         min_score, max_score, after)
+
+        # no filters, all pages
+        if not date_filter and not rec and not search and not url:
+            yield from self.iter_pages(pids)
+            return
+
+        for page in self.iter_pages(pids):
+            # check for legacy hidden flag
+            if page.get('hidden', False):
+                continue
+
+            if date_filter:
+                try:
+                    # trim seconds
+                    ts = int(page['timestamp'][:12])
+                except ValueError:
+                    continue
+                if ts < ts_from or ts > ts_to:
+                    continue
+
+            if rec and page['rec'] != rec:
+                continue
+
+            if search and search not in page.get('title', '').lower():
+                continue
+
+            if url and url not in page['url'].lower():
+                continue
+
+            yield page
+
     def clear_page_bookmark_cache(self):
         """ Check if on-demand page->bookmark cache already exists
         """
@@ -3,6 +3,7 @@ import hashlib
 import os
 import base64
 import shutil
+import time
 import traceback
 import logging
 
@@ -34,6 +35,11 @@ class Recording(RedisUniqueComponent):
     :cvar str ALL_KEYS: building block key pattern Redis key
     :cvar str OPEN_REC_KEY: ongoing recording Redis key
     :cvar str CDX: CDX index Redis key
+    :cvar str MIME_KEY: CDX index entries by MIME type Redis key
+    (lexicographical, '<mime> <timestamp> <url>'), kept while the
+    recording is open, like the CDX index, then loaded in the background
+    from the committed CDX index file when searched (expires after
+    COLL_CDXJ_TTL unless searched again)
     :cvar str RA_KEY: remote archives Redis key
     :cvar str PENDING_SIZE_KEY: outstanding size Redis key
     :cvar str PENDING_COUNT_KEY: outstanding CDX index lines Redis key
@@ -41,10 +47,13 @@ class Recording(RedisUniqueComponent):
     :cvar int COMMIT_WAIT_SECS: wait for the given number of seconds
     :cvar str REC_WARC_KEY: WARC Redis key (recording)
     :cvar str COLL_WARC_KEY: WARC Redis key (collection)
+    :cvar str COLL_WARC_SUM_KEY: closed or committed WARC checksum and size Redis key
+    (collection)
     :cvar str COMMIT_LOCK_KEY: storage lock Redis key
     :cvar str INDEX_FILE_KEY: CDX index file
     :cvar str INDEX_NAME_TEMPL: CDX index filename template
     :cvar str DELETE_RETRY: delete/retry Redis key
+    :cvar str COMMIT_QUEUE_KEY: commit queue Redis key (sorted by due time)
     :cvar int OPEN_REC_TTL: TTL ongoing recording
     """
     MY_TYPE = 'rec'
@@ -55,6 +64,8 @@ class Recording(RedisUniqueComponent):
 
     CDXJ_KEY = 'r:{rec}:cdxj'
 
+    MIME_KEY = 'r:{rec}:mime'
+
     RA_KEY = 'r:{rec}:ra'
 
     PENDING_SIZE_KEY = 'r:{rec}:_ps'
@@ -65,6 +76,7 @@ class Recording(RedisUniqueComponent):
 
     REC_WARC_KEY = 'r:{rec}:wk'
     COLL_WARC_KEY = 'c:{coll}:warc'
+    COLL_WARC_SUM_KEY = 'c:{coll}:wsum'
 
     COMMIT_LOCK_KEY = 'r:{rec}:lock'
 
@@ -74,6 +86,8 @@ class Recording(RedisUniqueComponent):
 
     DELETE_RETRY = 'q:delete_retry'
 
+    COMMIT_QUEUE_KEY = 'q:commit'
+
     # overridable
     OPEN_REC_TTL = 5400
 
@@ -132,6 +146,9 @@ class Recording(RedisUniqueComponent):
 
             pi.setex(open_rec_key, self.OPEN_REC_TTL, 1)
 
+            # check for commit once recording would go idle
+            pi.zadd(self.COMMIT_QUEUE_KEY, time.time() + self.OPEN_REC_TTL, rec)
+
         return rec
 
     def is_open(self, extend=True):
@@ -150,9 +167,19 @@ class Recording(RedisUniqueComponent):
             return self.redis.exists(open_rec_key)
 
     def set_closed(self):
-        """Close recording."""
+        """Close recording and queue it for commit."""
         open_rec_key = self.OPEN_REC_KEY.format(rec=self.my_id)
-        self.redis.delete(open_rec_key)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.delete(open_rec_key)
+            pi.zadd(self.COMMIT_QUEUE_KEY, time.time(), self.my_id)
+
+    def queue_commit(self, delay=0):
+        """Schedule recording to be checked for commit to storage.
+
+        :param int delay: number of seconds until recording is due
+        """
+        self.redis.zadd(self.COMMIT_QUEUE_KEY, time.time() + delay, self.my_id)
 
     def is_fully_committed(self):
         """Return whether the CDX index file has been fully committed
@@ -186,9 +213,13 @@ class Recording(RedisUniqueComponent):
         return int(self.redis.get(pending_size) or 0)
 
     def inc_pending_count(self):
-        """Increase outstanding CDX index lines."""
+        """Increase outstanding CDX index lines.
+
+        :returns: whether recording is ongoing (and count increased)
+        :rtype: bool
+        """
         if not self.is_open(extend=False):
-            return
+            return False
 
         pending_count = self.PENDING_COUNT_KEY.format(rec=self.my_id)
 
@@ -196,32 +227,43 @@ class Recording(RedisUniqueComponent):
             pi.incrby(pending_count, 1)
             pi.expire(pending_count, self.PENDING_TTL)
 
-    def inc_pending_size(self, size):
+        return True
+
+    def inc_pending_size(self, size, check_open=True):
         """Increase outstanding size.
 
         :param int size: size
+        :param bool check_open: whether to check recording is ongoing
+        (not needed if already checked for the pending count)
+
+        :returns: whether recording is ongoing (and size increased)
+        :rtype: bool
         """
-        if not self.is_open(extend=False):
-            return
+        if check_open and not self.is_open(extend=False):
+            return False
 
         pending_size = self.PENDING_SIZE_KEY.format(rec=self.my_id)
         with redis_pipeline(self.redis) as pi:
             pi.incrby(pending_size, size)
             pi.expire(pending_size, self.PENDING_TTL)
 
+        return True
+
     def dec_pending_count_and_size(self, size):
         """Decrease outstanding CDX index lines and size.
 
         :param int size: size
         """
-        # return if rec no longer exists (deleted while transfer is pending)
-        if not self.redis.exists(self.info_key):
-            return
-
         pending_count = self.PENDING_COUNT_KEY.format(rec=self.my_id)
 
         pending_size = self.PENDING_SIZE_KEY.format(rec=self.my_id)
 
+        # rec no longer exists (deleted while transfer is pending),
+        # remove any size added since
+        if not self.redis.exists(self.info_key):
+            self.redis.delete(pending_count, pending_size)
+            return
+
         with redis_pipeline(self.redis) as pi:
             pi.incrby(pending_count, -1)
             pi.incrby(pending_size, -size)
@@ -287,6 +329,8 @@ class Recording(RedisUniqueComponent):
         if derivs:
             derivs.delete_me(storage, False)
 
+        self.redis.zrem(self.COMMIT_QUEUE_KEY, self.my_id)
+
         if not self.delete_object():
             res['error'] = 'not_found'
 
@@ -353,6 +397,7 @@ class Recording(RedisUniqueComponent):
                 self.redis.rpush(self.DELETE_RETRY, v)
             else:
                 self.redis.hdel(coll_warc_key, n)
+                self.redis.hdel(self.COLL_WARC_SUM_KEY.format(coll=self.get_prop('owner')), n)
 
         if errs:
             return {'error_delete_files': errs}
@@ -451,11 +496,14 @@ class Recording(RedisUniqueComponent):
 
         :param storage: Webrecorder storage
         :type: BaseStorage or None
+
+        :returns: number of bytes uploaded
+        :rtype: int
         """
         commit_lock = self.COMMIT_LOCK_KEY.format(rec=self.my_id)
         if not self.redis.set(commit_lock, '1', ex=self.COMMIT_WAIT_SECS, nx=True):
             logger.debug('Skipping, Already Committing Rec: {0}'.format(self.my_id))
-            return
+            return 0
 
         try:
             logger.debug('Committing Rec: {0}'.format(self.my_id))
@@ -464,11 +512,11 @@ class Recording(RedisUniqueComponent):
 
             if not collection:
                 print('Collection missing for: ' + self.my_id)
-                return
+                return 0
 
             if not user:
                 print('User missing for: ' + self.my_id)
-                return
+                return 0
 
             if not storage and not user.is_anon():
                 storage = collection.get_storage()
@@ -487,6 +535,10 @@ class Recording(RedisUniqueComponent):
                 all_done = collection.commit_file(cdxj_filename, full_cdxj_filename, 'indexes',
                                             info_key, self.INDEX_FILE_KEY, direct_delete=True)
 
+                # index file url written directly to info key
+                if self.comp_cache is not None:
+                    self.comp_cache.invalidate(info_key)
+
                 for warc_filename, warc_full_filename in self.iter_all_files():
                     done = collection.commit_file(warc_filename, warc_full_filename, 'warcs', warc_key)
 
@@ -494,7 +546,10 @@ class Recording(RedisUniqueComponent):
 
             if all_done:
                 logger.debug('Commit Done, Deleting Rec CDXJ: ' + cdxj_key)
-                self.redis.delete(cdxj_key)
+                # MIME type index loaded from committed index when searched
+                self.redis.delete(cdxj_key, self.MIME_KEY.format(rec=self.my_id))
+
+            return storage.bytes_uploaded if storage else 0
 
         finally:
             self.redis.delete(commit_lock)
@@ -569,6 +624,9 @@ class Recording(RedisUniqueComponent):
 
         self.redis.zunionstore(target_key, [source_key])
 
+        self.redis.zunionstore(self.MIME_KEY.format(rec=self.my_id),
+                               [self.MIME_KEY.format(rec=source.my_id)])
+
         # recreate pages, if any, in new recording
         source_coll = source.get_owner()
         source_pages = source_coll.list_rec_pages(source)
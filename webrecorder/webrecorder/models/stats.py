@@ -1,6 +1,12 @@
 import os
+import atexit
 
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
+
+import gevent
+
 from webrecorder.utils import redis_pipeline, today_str
 
 from pywb.warcserver.index.cdxobject import CDXObject
@@ -45,6 +51,10 @@ class Stats(object):
 
     BEHAVIOR_KEY = 'st:behaviors:{stat}:{name}'
 
+    CDXJ_CACHE_HIT_KEY = 'st:cdxj-cache-hit'
+    CDXJ_CACHE_MISS_KEY = 'st:cdxj-cache-miss'
+    CDXJ_CACHE_EVICT_KEY = 'st:cdxj-cache-evict'
+
     BROWSERS_KEY = 'st:br:{0}'
 
     SOURCES_KEY = 'st:ra:{0}'
@@ -53,6 +63,12 @@ class Stats(object):
     RATE_LIMIT_HOURS = 0
     RATE_LIMIT_TTL = 0
 
+    BUFFER_MODE = 'exact'
+    BUFFER_FLUSH_MS = 1000
+    BUFFER_FLUSH_MAX = 1000
+
+    _buffer = None
+
     @classmethod
     def init_props(cls, config):
         cls.RATE_LIMIT_HOURS = int(os.environ.get('RATE_LIMIT_HOURS', 0))
@@ -60,9 +76,40 @@ class Stats(object):
 
         cls.TEMP_PREFIX = config['temp_prefix']
 
+        cls.BUFFER_MODE = os.environ.get('STATS_BUFFER_MODE',
+                                         config.get('stats_buffer_mode', 'exact'))
+        cls.BUFFER_FLUSH_MS = int(config.get('stats_buffer_flush_ms', 1000))
+        cls.BUFFER_FLUSH_MAX = int(config.get('stats_buffer_flush_max', 1000))
+
     def __init__(self, redis):
         self.redis = redis
 
+    @contextmanager
+    def counter_pipeline(self):
+        """Pipeline for per-resource counter updates.
+
+        In 'buffered' mode, updates are merged into the per-process
+        :class:`StatsBuffer` and written later, otherwise written
+        immediately in a single pipeline.
+        """
+        if self.BUFFER_MODE != 'buffered':
+            with redis_pipeline(self.redis) as pi:
+                yield pi
+
+            return
+
+        buff = Stats._buffer
+
+        # create per process, after any fork
+        if not buff or buff.pid != os.getpid():
+            buff = StatsBuffer(self.redis,
+                               self.BUFFER_FLUSH_MS / 1000.0,
+                               self.BUFFER_FLUSH_MAX)
+            Stats._buffer = buff
+
+        yield buff
+        buff.add_event()
+
     def get_rate_limit_key(self, params):
         if not self.RATE_LIMIT_KEY or not self.RATE_LIMIT_TTL:
             return None
@@ -83,13 +130,14 @@ class Stats(object):
 
         today = today_str()
 
-        with redis_pipeline(self.redis) as pi:
-            # rate limiting
-            rate_limit_key = self.get_rate_limit_key(params)
-            if rate_limit_key:
+        # rate limiting, not buffered: read back by User.is_rate_limited()
+        rate_limit_key = self.get_rate_limit_key(params)
+        if rate_limit_key:
+            with redis_pipeline(self.redis) as pi:
                 pi.incrby(rate_limit_key, size)
                 pi.expire(rate_limit_key, self.RATE_LIMIT_TTL)
 
+        with self.counter_pipeline() as pi:
             # write size to usage hashes
             if username.startswith(self.TEMP_PREFIX):
                 key = self.ALL_CAPTURE_TEMP_KEY
@@ -103,7 +151,7 @@ class Stats(object):
         is_patch = params.get('param.recorder.rec') != None
 
         if is_extract or is_patch:
-            with redis_pipeline(self.redis) as pi:
+            with self.counter_pipeline() as pi:
                 for cdx in cdx_list:
                     try:
                         cdx = CDXObject(cdx)
@@ -176,7 +224,8 @@ class Stats(object):
         else:
             key = self.REPLAY_USER_KEY
 
-        self.redis.hincrby(key, today_str(), size)
+        with self.counter_pipeline() as pi:
+            pi.hincrby(key, today_str(), size)
 
     def move_temp_to_user_usage(self, collection):
         today = today_str()
@@ -188,6 +237,18 @@ class Stats(object):
             pi.hincrby(self.ALL_CAPTURE_USER_KEY, date_str, size)
             pi.hincrby(self.ALL_CAPTURE_TEMP_KEY, date_str, -size)
 
+    def incr_cdxj_cache(self, result, num=1):
+        if result == 'hit':
+            key = self.CDXJ_CACHE_HIT_KEY
+        elif result == 'miss':
+            key = self.CDXJ_CACHE_MISS_KEY
+        elif result == 'evict':
+            key = self.CDXJ_CACHE_EVICT_KEY
+        else:
+            return
+
+        self.redis.hincrby(key, today_str(), num)
+
     def incr_behavior_stat(self, stat, behavior, browser):
         if stat not in ('start', 'done'):
             return
@@ -198,3 +259,100 @@ class Stats(object):
         key = self.BEHAVIOR_KEY.format(stat=stat, name=behavior)
 
         self.redis.hincrby(key, today_str(), 1)
+
+
+# ============================================================================
+class StatsBuffer(object):
+    """Per-process aggregator for stats counter updates.
+
+    Supports the subset of pipeline commands used for counters. Increments
+    to the same key and field are merged in memory and written in a single
+    pipeline after *flush_secs* or every *flush_max* events, and on exit.
+
+    Only for counters that are not read back right away. Not locked:
+    all entry points run under gevent, so the buffer is only used from
+    greenlets of a single thread, and no method yields while updating
+    the pending state (:meth:`flush` swaps it out before writing).
+
+    :ivar StrictRedis redis: Redis
+    :ivar float flush_secs: max time before pending updates are written
+    :ivar int flush_max: max number of events before pending updates are written
+    :ivar int pid: process the buffer was created in
+    """
+    def __init__(self, redis, flush_secs, flush_max):
+        self.redis = redis
+        self.flush_secs = flush_secs
+        self.flush_max = flush_max
+        self.pid = os.getpid()
+
+        self.flusher = None
+        self._reset()
+
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self.deletes = set()
+        self.incrs = defaultdict(int)
+        self.hincrs = defaultdict(int)
+        self.expires = {}
+        self.num_events = 0
+
+    def hincrby(self, key, field, amount=1):
+        self.hincrs[(key, field)] += amount
+
+    def incrby(self, key, amount=1):
+        self.incrs[key] += amount
+
+    def expire(self, key, secs):
+        self.expires[key] = secs
+
+    def delete(self, key):
+        # earlier pending increments are deleted along with key
+        self.incrs.pop(key, None)
+
+        for key_field in [kf for kf in self.hincrs if kf[0] == key]:
+            del self.hincrs[key_field]
+
+        self.deletes.add(key)
+
+    def add_event(self):
+        """Count completed event, flushing if *flush_max* reached."""
+        self.num_events += 1
+
+        if self.num_events >= self.flush_max:
+            self.flush()
+
+        elif not self.flusher:
+            self.flusher = gevent.spawn_later(self.flush_secs, self.flush)
+
+    def flush(self):
+        """Write all pending updates in one pipeline."""
+        deletes = self.deletes
+        incrs = self.incrs
+        hincrs = self.hincrs
+        expires = self.expires
+        num_events = self.num_events
+
+        self._reset()
+
+        if self.flusher and self.flusher is not gevent.getcurrent():
+            self.flusher.kill(block=False)
+
+        self.flusher = None
+
+        if not num_events:
+            return
+
+        with redis_pipeline(self.redis) as pi:
+            # deletes first: increments made after a delete are kept
+            for key in deletes:
+                pi.delete(key)
+
+            for key, amount in incrs.items():
+                pi.incrby(key, amount)
+
+            for (key, field), amount in hincrs.items():
+                pi.hincrby(key, field, amount)
+
+            for key, secs in expires.items():
+                pi.expire(key, secs)
@@ -1,4 +1,5 @@
 import os
+import time
 from datetime import datetime
 import json
 
@@ -21,6 +22,12 @@ class User(RedisUniqueComponent):
     COLLS_KEY = 'u:{user}:colls'
     COLLS_REDIR_KEY = 'u:{user}:cr'
 
+    TEMP_USERS_KEY = 'z:temp-users'
+
+    INDEX_KEYS = {'created_at': 'z:users:created',
+                  'updated_at': 'z:users:updated',
+                  'size': 'z:users:size'}
+
     MAX_ANON_SIZE = 1000000000
     MAX_USER_SIZE = 5000000000
 
@@ -74,6 +81,10 @@ class User(RedisUniqueComponent):
         self.info_key = self.INFO_KEY.format_map({self.MY_TYPE: self.my_id})
         return self.my_id
 
+    def _is_indexed(self):
+        # only index non-temporary users
+        return not self.my_id.startswith(self.TEMP_PREFIX)
+
     def create_collection(self, coll_name, allow_dupe=False, **kwargs):
         coll_name = self.colls.reserve_obj_name(coll_name, allow_dupe=allow_dupe)
 
@@ -108,12 +119,16 @@ class User(RedisUniqueComponent):
 
     def get_collections(self, load=True):
         all_collections = self.colls.get_objects(Collection)
-        collections = []
         for collection in all_collections:
             collection.owner = self
+
+        # load all at once, also avoids a per-collection lookup for access check
+        if load:
+            Collection.load_all(all_collections)
+
+        collections = []
+        for collection in all_collections:
             if self.access.can_read_coll(collection, allow_superuser=False):
-                if load:
-                    collection.load()
                 collections.append(collection)
 
         return collections
@@ -163,6 +178,8 @@ class User(RedisUniqueComponent):
         for collection in self.get_collections(load=False):
             collection.delete_me()
 
+        self.redis.zrem(self.TEMP_USERS_KEY, self.my_id)
+
         return self.delete_object()
 
     def get_size_allotment(self):
@@ -347,6 +364,9 @@ class SessionUser(User):
 
         self.init_new(max_size=max_size)
 
+        # index temp users by creation time, for cleanup
+        self.redis.zadd(self.TEMP_USERS_KEY, time.time(), self.my_id)
+
         self.sesh.set_anon()
         self.sesh_type = 'anon'
         return True
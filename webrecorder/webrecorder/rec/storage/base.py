@@ -1,15 +1,26 @@
+import hashlib
+import os
+from contextlib import closing
+
+from pywb.utils.loaders import BlockLoader
+
+
 # ============================================================================
 class BaseStorage(object):
     """Webrecorder storage base class.
 
     :ivar dict cache: cache
+    :ivar dict checksums: checksums and sizes of uploaded files
     :ivar str storage_root: root directory
+    :ivar int bytes_uploaded: number of bytes uploaded
     """
 
     def __init__(self, storage_root=None):
         """Initialize Webrecorder storage."""
         self.cache = {}
+        self.checksums = {}
         self.storage_root = storage_root
+        self.bytes_uploaded = 0
 
     def get_collection_url(self, collection):
         """Return collection URL.
@@ -79,11 +90,37 @@ class BaseStorage(object):
 
         target_url = self.get_target_url(collection, obj_type, filename)
 
-        if self.do_upload(target_url, full_filename):
-            self.cache[filename] = target_url
-            return True
+        try:
+            fh = open(full_filename, 'rb')
+        except OSError:
+            return False
+
+        with fh:
+            reader = HashingReader(fh)
+            if not self.do_upload(target_url, full_filename, reader):
+                return False
+
+        size = os.path.getsize(full_filename)
+
+        self.cache[filename] = target_url
+        self.bytes_uploaded += size
+
+        # checksum computed while copying, if the whole file was copied
+        if reader.size == size:
+            self.checksums[filename] = reader.get_checksum_and_size()
 
-        return False
+        return True
+
+    def get_upload_checksum(self, filename):
+        """Return checksum and size of uploaded file, computed during
+        upload.
+
+        :param str filename: filename
+
+        :returns: kind of checksum, checksum and size or None
+        :rtype: tuple[str, str, int] or None
+        """
+        return self.checksums.pop(filename, None)
 
     def get_upload_url(self, filename):
         """Return upload URL.
@@ -128,6 +165,29 @@ class BaseStorage(object):
         """
         return None, None, None
 
+    @staticmethod
+    def compute_checksum_and_size(filepath_or_url):
+        """Computes the md5 checksum and size of the supplied URL or filepath,
+        reading the resource once
+
+        :param str filepath_or_url: The URL or filepath to the resource
+        :return: A three tuple containing the kind of checksum, the checksum itself, and size
+        :rtype: tuple[str, str, int]
+        """
+        m = hashlib.md5()
+        amount = 1024 * 1024
+        total_size = 0
+        with closing(BlockLoader().load(filepath_or_url)) as f:
+            while True:
+                chunk = f.read(amount)
+                chunk_size = len(chunk)
+                if chunk_size == 0:
+                    break
+                total_size += chunk_size
+                m.update(chunk)
+
+        return 'md5', m.hexdigest(), total_size
+
     def get_remote_presigned_url(self, url, expires=3600):
         """Returns a remote presigned URL for direct, validating access to resource
         from remote source. Optional, only valid for remote storage (eg. S3)
@@ -149,3 +209,41 @@ class BaseStorage(object):
         """
         return True
 
+
+# ============================================================================
+class HashingReader(object):
+    """File reader computing the md5 checksum and size of all data read.
+
+    :ivar fh: file
+    :ivar md5: md5 hash
+    :ivar int size: number of bytes read
+    """
+    def __init__(self, fh):
+        """Initialize hashing reader.
+
+        :param fh: file
+        """
+        self.fh = fh
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def read(self, size=-1):
+        """Read from file.
+
+        :param int size: max number of bytes
+
+        :returns: data
+        :rtype: bytes
+        """
+        buff = self.fh.read(size)
+        self.md5.update(buff)
+        self.size += len(buff)
+        return buff
+
+    def get_checksum_and_size(self):
+        """Return checksum and size of data read.
+
+        :returns: kind of checksum, checksum and size
+        :rtype: tuple[str, str, int]
+        """
+        return 'md5', self.md5.hexdigest(), self.size
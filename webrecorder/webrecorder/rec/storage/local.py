@@ -1,11 +1,7 @@
-import hashlib
 import logging
 import os
 import shutil
 import traceback
-from contextlib import closing
-
-from pywb.utils.loaders import BlockLoader
 
 from webrecorder.rec.storage.base import BaseStorage
 from webrecorder.rec.storage.storagepaths import add_local_store_prefix, strip_prefix
@@ -42,11 +38,13 @@ class DirectLocalFileStorage(BaseStorage):
                 logger.error(str(e))
             return False
 
-    def do_upload(self, target_url, full_filename):
+    def do_upload(self, target_url, full_filename, reader=None):
         """Upload file into local file storage.
 
         :param str target_url: target URL
         :param str full_filename: path
+        :param reader: open file to copy from, if any
+        :type: HashingReader or None
 
         :returns: whether successful or not
         :rtype: bool
@@ -55,7 +53,11 @@ class DirectLocalFileStorage(BaseStorage):
 
         try:
             if full_filename != target_url:
-                shutil.copyfile(full_filename, target_url)
+                if reader:
+                    with open(target_url, 'wb') as out:
+                        shutil.copyfileobj(reader, out)
+                else:
+                    shutil.copyfile(full_filename, target_url)
             else:
                 logger.debug('Local Store: Same File, No Upload')
 
@@ -163,17 +165,5 @@ class LocalFileStorage(DirectLocalFileStorage):
         :return: A three tuple containing the kind of checksum, the checksum itself, and size
         :rtype: tuple[str|None, str|None, int|None]
         """
-        m = hashlib.md5()
-        amount = 1024 * 1024
-        total_size = 0
-        with closing(BlockLoader().load(filepath_or_url)) as f:
-            while True:
-                chunk = f.read(amount)
-                chunk_size = len(chunk)
-                if chunk_size == 0:
-                    break
-                total_size += chunk_size
-                m.update(chunk)
-
-        return 'md5', m.hexdigest(), total_size
+        return self.compute_checksum_and_size(filepath_or_url)
 
@@ -1,5 +1,8 @@
+import hashlib
 import logging
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from six.moves.urllib.parse import urlsplit
@@ -13,9 +16,19 @@ logger = logging.getLogger('wr.io')
 class S3Storage(BaseStorage):
     """Webrecorder storage (Amazon S3).
 
+    Files larger than the multipart threshold are uploaded in parts,
+    several at a time. An interrupted multipart upload is resumed by
+    the next upload of the same file.
+
+    :cvar int MULTIPART_CHUNK_SIZE: multipart upload part size
+    :cvar int MULTIPART_THRESHOLD: min. size of multipart upload
+    :cvar int MULTIPART_CONCURRENCY: number of parts uploaded at once
     :ivar str bucket_name: name of S3 bucket
     :ivar s3: service client
     """
+    MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+    MULTIPART_THRESHOLD = 16 * 1024 * 1024
+    MULTIPART_CONCURRENCY = 4
 
     def __init__(self):
         """Initialize Webrecorder storage."""
@@ -27,6 +40,10 @@ class S3Storage(BaseStorage):
         self.s3 = boto3.client('s3')
         self.is_local_storage = False
 
+        self.chunk_size = int(os.environ.get('S3_MULTIPART_CHUNK_SIZE', self.MULTIPART_CHUNK_SIZE))
+        self.multipart_threshold = int(os.environ.get('S3_MULTIPART_THRESHOLD', self.MULTIPART_THRESHOLD))
+        self.concurrency = int(os.environ.get('S3_MULTIPART_CONCURRENCY', self.MULTIPART_CONCURRENCY))
+
     def _split_bucket_path(self, url):
         """Split S3 bucket URL into network location and path.
 
@@ -76,11 +93,13 @@ class S3Storage(BaseStorage):
         """
         return self._get_s3_url(target_url)
 
-    def do_upload(self, target_url, full_filename):
+    def do_upload(self, target_url, full_filename, reader=None):
         """Upload file into Webrecorder storage.
 
         :param str target_url: target URL
         :param str full_filename: filename
+        :param reader: open file to upload from, if any
+        :type: HashingReader or None
 
         :returns: whether successful or not
         :rtype: bool
@@ -89,9 +108,22 @@ class S3Storage(BaseStorage):
 
         try:
             logger.debug('S3: Uploading {0} -> {1}'.format(full_filename, s3_url))
-            self.s3.upload_file(full_filename,
-                                Bucket=self.bucket_name,
-                                Key=target_url)
+            size = os.path.getsize(full_filename)
+            if size < self.multipart_threshold:
+                if reader:
+                    self.s3.upload_fileobj(reader,
+                                           Bucket=self.bucket_name,
+                                           Key=target_url)
+                else:
+                    self.s3.upload_file(full_filename,
+                                        Bucket=self.bucket_name,
+                                        Key=target_url)
+            else:
+                if reader:
+                    self.do_multipart_upload(target_url, full_filename, size, reader)
+                else:
+                    with open(full_filename, 'rb') as fh:
+                        self.do_multipart_upload(target_url, full_filename, size, fh)
 
             return True
         except Exception as e:
@@ -99,6 +131,126 @@ class S3Storage(BaseStorage):
             logger.debug('S3: Failed to Upload to {0}'.format(s3_url))
             return False
 
+    def do_multipart_upload(self, target_url, full_filename, size, reader):
+        """Upload file in parts, resuming existing multipart upload
+        if any.
+
+        The file is read once, in order, and parts are uploaded
+        several at a time.
+
+        :param str target_url: target URL
+        :param str full_filename: filename
+        :param int size: file size
+        :param reader: open file to upload from
+        """
+        num_parts = max((size + self.chunk_size - 1) // self.chunk_size, 1)
+
+        upload_id, etags = self._find_multipart_upload(target_url, full_filename, size)
+
+        if upload_id:
+            logger.debug('S3: Resuming Upload, {0} of {1} parts done'.format(len(etags), num_parts))
+        else:
+            res = self.s3.create_multipart_upload(Bucket=self.bucket_name,
+                                                  Key=target_url)
+            upload_id = res['UploadId']
+
+        def upload_part(part_num, data):
+            res = self.s3.upload_part(Bucket=self.bucket_name,
+                                      Key=target_url,
+                                      UploadId=upload_id,
+                                      PartNumber=part_num,
+                                      Body=data)
+
+            return part_num, res['ETag']
+
+        # on failure, the upload is left in place to be resumed
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+
+            for part_num in range(1, num_parts + 1):
+                # read reused parts as well, for the checksum of the whole file
+                data = reader.read(self.chunk_size)
+                if part_num in etags:
+                    continue
+
+                # limit number of parts held in memory
+                if len(pending) >= self.concurrency:
+                    done_num, etag = pending.popleft().result()
+                    etags[done_num] = etag
+
+                pending.append(executor.submit(upload_part, part_num, data))
+
+            while pending:
+                done_num, etag = pending.popleft().result()
+                etags[done_num] = etag
+
+        parts = [{'PartNumber': part_num, 'ETag': etags[part_num]}
+                 for part_num in range(1, num_parts + 1)]
+
+        self.s3.complete_multipart_upload(Bucket=self.bucket_name,
+                                          Key=target_url,
+                                          UploadId=upload_id,
+                                          MultipartUpload={'Parts': parts})
+
+    def _find_multipart_upload(self, target_url, full_filename, size):
+        """Return most recent unfinished multipart upload of target URL
+        and its parts that can be reused.
+
+        A part is only reused if its ETag is the MD5 of the same chunk
+        of the local file.
+
+        :param str target_url: target URL
+        :param str full_filename: filename
+        :param int size: file size
+
+        :returns: upload ID (or None) and ETags by part number
+        :rtype: str and dict
+        """
+        uploads = []
+
+        try:
+            paginator = self.s3.get_paginator('list_multipart_uploads')
+            for page in paginator.paginate(Bucket=self.bucket_name,
+                                           Prefix=target_url):
+
+                uploads.extend(upload for upload in page.get('Uploads', [])
+                               if upload['Key'] == target_url)
+
+        except Exception as e:
+            logger.debug(str(e))
+            return None, {}
+
+        if not uploads:
+            return None, {}
+
+        upload_id = max(uploads, key=lambda upload: upload['Initiated'])['UploadId']
+
+        etags = {}
+        paginator = self.s3.get_paginator('list_parts')
+
+        with open(full_filename, 'rb') as fh:
+            for page in paginator.paginate(Bucket=self.bucket_name,
+                                           Key=target_url,
+                                           UploadId=upload_id):
+
+                for part in page.get('Parts', []):
+                    part_num = part['PartNumber']
+                    offset = (part_num - 1) * self.chunk_size
+                    part_size = min(self.chunk_size, size - offset)
+
+                    # only reuse parts uploaded with same chunk size
+                    if part_size <= 0 or part['Size'] != part_size:
+                        continue
+
+                    fh.seek(offset)
+                    md5 = hashlib.md5(fh.read(part_size)).hexdigest()
+
+                    # and same data
+                    if part['ETag'].strip('"') == md5:
+                        etags[part_num] = part['ETag']
+
+        return upload_id, etags
+
     def client_url_to_target_url(self, client_url):
         """Get target URL (from client URL).
 
@@ -1,5 +1,9 @@
 import os
 import redis
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
 
 from webrecorder.models.recording import Recording
 from webrecorder.models.base import BaseAccess
@@ -10,6 +14,28 @@ logger = logging.getLogger('wr.io')
 
 # ============================================================================
 class StorageCommitter(object):
+    """Commits closed recordings to storage, several recordings at a time.
+
+    Recordings are taken from the commit queue, a sorted set scored by the
+    time each recording is next due to be checked. A recording is claimed
+    before it is processed, so that several committers can share the queue,
+    and remains queued until its CDX index has been fully committed.
+
+    :cvar str CLAIM_KEY: claimed recording Redis key
+    :cvar int CLAIM_SECS: TTL of claim, recording is retried if committer
+    exits while processing it
+    :cvar int BATCH_SIZE: maximum number of recordings processed per pass
+    :ivar int concurrency: number of recordings committed at once
+    :ivar int retry_secs: delay before checking a recording that is not
+    fully committed again
+    :ivar int queue_depth: number of recordings not yet processed in
+    current pass
+    """
+    CLAIM_KEY = 'r:{rec}:_claim'
+    CLAIM_SECS = 300
+
+    BATCH_SIZE = 1000
+
     def __init__(self, config):
         super(StorageCommitter, self).__init__()
 
@@ -17,34 +43,139 @@ class StorageCommitter(object):
 
         self.all_cdxj_templ = Recording.CDXJ_KEY.format(rec='*')
 
+        self.concurrency = int(config.get('storage_commit_concurrency', 4))
+        self.retry_secs = int(config.get('storage_commit_retry_secs', 0))
+        self.queue_depth = 0
+
         logger.info('Storage Committer Started')
         logger.info('Storage Root: ' + os.environ['STORAGE_ROOT'])
 
+        self.queue_existing()
+
+    def queue_existing(self):
+        """Add recordings with a CDX index that are not in the commit
+        queue, such as those created before it was in use.
+        """
+        recs = [cdxj_key.split(':', 2)[1]
+                for cdxj_key in self.redis.scan_iter(self.all_cdxj_templ, count=1000)]
+
+        if not recs:
+            return
+
+        pi = self.redis.pipeline(transaction=False)
+        for rec in recs:
+            pi.zscore(Recording.COMMIT_QUEUE_KEY, rec)
+
+        now = time.time()
+        args = []
+        for rec, score in zip(recs, pi.execute()):
+            if score is None:
+                args.extend([now, rec])
+
+        if args:
+            self.redis.zadd(Recording.COMMIT_QUEUE_KEY, *args)
+            logger.info('Storage Commit: Queued {0} existing recordings'.format(len(args) // 2))
+
     def __call__(self):
-        for cdxj_key in self.redis.scan_iter(self.all_cdxj_templ):
-            self.process_cdxj_key(cdxj_key)
+        recs = self.redis.zrangebyscore(Recording.COMMIT_QUEUE_KEY, 0, time.time(),
+                                        start=0, num=self.BATCH_SIZE)
+
+        recs = [rec for rec in recs if self.claim_rec(rec)]
+
+        self.queue_depth = len(recs)
+        if recs:
+            logger.debug('Storage Commit: {0} recordings queued'.format(self.queue_depth))
+
+        start_time = time.time()
+        total_size = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for size in executor.map(self._safe_process_rec, recs):
+                total_size += size
+                self.queue_depth -= 1
+
+        if total_size:
+            elapsed = time.time() - start_time
+            logger.debug('Storage Commit: {0} bytes in {1:.2f}s ({2:.0f} bytes/sec)'.format(
+                         total_size, elapsed, total_size / max(elapsed, 0.001)))
 
         self.redis.publish('close_idle', '')
 
-    def process_cdxj_key(self, cdxj_key):
-        _, rec, _2 = cdxj_key.split(':', 2)
+    def claim_rec(self, rec):
+        """Claim queued recording for processing by this committer.
+
+        :param str rec: recording ID
+
+        :returns: whether recording was claimed
+        :rtype: bool
+        """
+        claim_key = self.CLAIM_KEY.format(rec=rec)
+        return self.redis.set(claim_key, '1', ex=self.CLAIM_SECS, nx=True)
+
+    def _safe_process_rec(self, rec):
+        try:
+            return self.process_rec(rec) or 0
+        except Exception:
+            traceback.print_exc()
+            return 0
+        finally:
+            self.redis.delete(self.CLAIM_KEY.format(rec=rec))
 
+    def process_rec(self, rec):
+        """Commit queued recording if it is closed. Recording is
+        rescheduled if still open or not fully committed, and removed from
+        the queue otherwise.
+
+        :param str rec: recording ID
+
+        :returns: number of bytes uploaded
+        :rtype: int
+        """
         recording = Recording(my_id=rec,
                               redis=self.redis,
                               access=BaseAccess())
 
+        cdxj_key = Recording.CDXJ_KEY.format(rec=rec)
+        open_rec_key = Recording.OPEN_REC_KEY.format(rec=rec)
+
+        pi = self.redis.pipeline(transaction=False)
+        pi.exists(cdxj_key)
+        pi.ttl(open_rec_key)
+        has_cdxj, open_ttl = pi.execute()
+
+        # still open, check again once it would go idle
+        if open_ttl != -2:
+            recording.queue_commit(open_ttl if open_ttl > 0 else Recording.OPEN_REC_TTL)
+            return 0
+
+        if not has_cdxj:
+            # index lines may still be added for pending writes
+            if recording.get_pending_count() > 0:
+                recording.queue_commit(self.retry_secs)
+            else:
+                self.redis.zrem(Recording.COMMIT_QUEUE_KEY, rec)
+            return 0
+
         collection = recording.get_owner()
         if not collection:
             logger.debug('Deleting Invalid Rec: ' + recording.my_id)
             recording.delete_object()
-            return
+            self.redis.zrem(Recording.COMMIT_QUEUE_KEY, rec)
+            return 0
 
         if collection.is_external():
             logger.debug('Skipping recording commit for external collection: ' + collection.my_id)
-            return
+            self.redis.zrem(Recording.COMMIT_QUEUE_KEY, rec)
+            return 0
+
+        size = recording.commit_to_storage()
+
+        if self.redis.exists(cdxj_key):
+            recording.queue_commit(self.retry_secs)
+        else:
+            self.redis.zrem(Recording.COMMIT_QUEUE_KEY, rec)
 
-        if not recording.is_open(extend=False):
-            recording.commit_to_storage()
+        return size
 
 
 # =============================================================================
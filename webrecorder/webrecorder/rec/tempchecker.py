@@ -23,7 +23,8 @@ class TempChecker(object):
 
     When called, it:
     a) Compiles a list of all temporary users, both derived from the directory
-    structure of `self.record_root_dir` and retrieved from Redis;
+    structure of `self.record_root_dir` and retrieved from the Redis index
+    of temporary users;
     b) Deletes any temporary users whose sessions have expired, marks all
     their recording sessions closed, and signals that their collections
     should be deleted;
@@ -56,6 +57,37 @@ class TempChecker(object):
 
         logger.info('Temp Check Root: ' + self.record_root_dir)
 
+        self.index_existing()
+
+    def index_existing(self):
+        """Add temporary users and external collections not yet in their
+        Redis index, such as those created before the index was in use.
+        """
+        temp_match = User.INFO_KEY.format(user=self.temp_prefix + '*')
+        temp_users = [redis_key.rsplit(':', 2)[1]
+                      for redis_key in self.data_redis.scan_iter(match=temp_match, count=1000)]
+
+        if temp_users:
+            pi = self.data_redis.pipeline(transaction=False)
+            for temp_user in temp_users:
+                pi.zscore(User.TEMP_USERS_KEY, temp_user)
+
+            now = time.time()
+            args = []
+            for temp_user, score in zip(temp_users, pi.execute()):
+                if score is None:
+                    args.extend([now, temp_user])
+
+            if args:
+                self.data_redis.zadd(User.TEMP_USERS_KEY, *args)
+
+        all_ext_templ = Collection.EXTERNAL_KEY.format(coll='*')
+        colls = [ext_key.split(':', 2)[1]
+                 for ext_key in self.data_redis.scan_iter(all_ext_templ, count=1000)]
+
+        if colls:
+            self.data_redis.sadd(Collection.EXTERNAL_REMOVE_KEY, *colls)
+
     def delete_if_expired(self, temp_user, temp_dir):
         temp_key = 't:' + temp_user
         sesh = self.sesh_redis.get(temp_key)
@@ -118,6 +150,7 @@ class TempChecker(object):
 
         # no user session, remove temp dir and everything in it
         else:
+            self.data_redis.zrem(User.TEMP_USERS_KEY, temp_user)
             try:
                 logger.debug('TempChecker: Deleted expired temp dir: ' + temp_dir)
                 shutil.rmtree(temp_dir)
@@ -164,10 +197,7 @@ class TempChecker(object):
             all_temps.add((temp_user, warc_dir))
 
         # include any temp users in redis that were missed during the directory scan
-        temp_match = User.INFO_KEY.format(user=self.temp_prefix + '*')
-        for redis_key in self.data_redis.scan_iter(match=temp_match, count=100):
-            temp_user = redis_key.rsplit(':', 2)[1]
-
+        for temp_user in self.data_redis.zrange(User.TEMP_USERS_KEY, 0, -1):
             if temp_user not in all_temps:
                 all_temps.add((temp_user, os.path.join(self.record_root_dir, temp_user)))
 
@@ -182,23 +212,26 @@ class TempChecker(object):
     def delete_expired_external(self):
         """ Delete any expired external collections in non-temp users
         """
-        all_ext_templ = Collection.EXTERNAL_KEY.format(coll='*')
-
-        for ext_key in self.data_redis.scan_iter(all_ext_templ):
+        for coll in self.data_redis.smembers(Collection.EXTERNAL_REMOVE_KEY):
             try:
-                _, coll, _2 = ext_key.split(':', 2)
-
                 collection = Collection(my_id=coll,
                                         redis=self.data_redis,
                                         access=BaseAccess())
 
                 user = collection.get_owner()
-                if not user or user.is_anon():
+
+                # collection already deleted
+                if not user:
+                    self.data_redis.srem(Collection.EXTERNAL_REMOVE_KEY, coll)
+                    continue
+
+                if user.is_anon():
                     continue
 
                 if not collection.has_cdxj():
                     logger.debug('TempChecker: Delete Expired External Coll: ' + collection.name)
                     user.remove_collection(collection, delete=True)
+                    self.data_redis.srem(Collection.EXTERNAL_REMOVE_KEY, coll)
             except Exception:
                 import traceback
                 traceback.print_exc()
@@ -9,11 +9,12 @@ from pywb.recorder.filters import ExcludeHttpOnlyCookieHeaders
 from pywb.recorder.filters import SkipRangeRequestFilter, SkipDefaultFilter
 
 from pywb.indexer.cdxindexer import BaseCDXWriter, CDXJ
+from pywb.warcserver.index.cdxobject import CDXObject
 
 from pywb.utils.format import res_template
 from pywb.utils.io import BUFF_SIZE
 
-from webrecorder.utils import SizeTrackingReader, redis_pipeline
+from webrecorder.utils import CDXJBulkLoader, SizeTrackingReader, redis_pipeline
 
 from webrecorder.load.wamloader import WAMLoader
 
@@ -21,12 +22,13 @@ import webrecorder.rec.storage.storagepaths as storagepaths
 from webrecorder.rec.storage.local import DirectLocalFileStorage
 
 from webrecorder.models.base import BaseAccess
-from webrecorder.models import Recording, Collection, Stats
+from webrecorder.models import Recording, Collection, Stats, User
 
 import redis
 import json
 import glob
 import tempfile
+import time
 import traceback
 import logging
 
@@ -187,6 +189,9 @@ class WebRecRecorder(object):
         # determine if local file
         filename = storagepaths.strip_prefix(uri)
 
+        # no checksum for deleted file
+        self.recorder.writer.open_warcs.pop(filename, None)
+
         closed = self.recorder.writer.close_file(filename)
 
         self.local_storage.delete_file(filename)
@@ -285,12 +290,33 @@ class WebRecRedisIndexer(WritableRedisIndexer):
         cdx_list = (super(WebRecRedisIndexer, self).
                       add_urls_to_index(stream, params, filename, length))
 
+        self.update_index_info(cdx_list, params, length)
+
+        return cdx_list
+
+    def add_cdx_to_index(self, cdx_list, params, length):
+        """Add CDXJ lines already generated (e.g. while parsing an upload)
+        to the recording index, without re-reading the WARC.
+
+        :param list cdx_list: CDXJ lines
+        :param dict params: request parameters
+        :param int length: size of WARC data indexed
+        """
+        z_key = res_template(self.redis_key_template, params)
+
+        with redis_pipeline(self.redis) as pi:
+            for line in cdx_list:
+                pi.zadd(z_key, 0, line)
+
+        self.update_index_info(cdx_list, params, length)
+
+    def update_index_info(self, cdx_list, params, length):
         # if replay key exists, add to it as well!
         coll_cdxj_key = res_template(self.coll_cdxj_key, params)
         if self.redis.exists(coll_cdxj_key):
-            for cdx in cdx_list:
-                if cdx:
-                    self.redis.zadd(coll_cdxj_key, 0, cdx)
+            cdxj_loader = CDXJBulkLoader(self.redis, coll_cdxj_key)
+            cdxj_loader.add_lines(cdx_list)
+            cdxj_loader.close()
 
         dt_now = datetime.utcnow()
 
@@ -305,9 +331,31 @@ class WebRecRedisIndexer(WritableRedisIndexer):
                     if key_templ == self.rec_info_key_templ:
                         pi.hset(key, 'recorded_at', ts_sec)
 
+            # index by MIME type, for search
+            if cdx_list:
+                self.add_to_mime_index(pi, res_template(Recording.MIME_KEY, params), cdx_list)
+
+            # keep indexes of non-temporary users and collections current
+            user = params.get('param.user')
+            if user and not user.startswith(User.TEMP_PREFIX):
+                for comp_cls, comp_id in ((User, user), (Collection, params.get('param.coll'))):
+                    pi.zincrby(comp_cls.INDEX_KEYS['size'], comp_id, length)
+                    if cdx_list:
+                        pi.zadd(comp_cls.INDEX_KEYS['updated_at'], ts_sec, comp_id)
+
         self.stats.incr_record(params, length, cdx_list)
 
-        return cdx_list
+    def add_to_mime_index(self, pi, mime_key, cdx_list):
+        members = []
+        for line in cdx_list:
+            try:
+                cdx = CDXObject(line)
+                members.extend((0, ' '.join((cdx['mime'], cdx['timestamp'], cdx['url']))))
+            except Exception:
+                continue
+
+        if members:
+            pi.zadd(mime_key, *members)
 
 
 # ============================================================================
@@ -330,6 +378,53 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
         self.user_key = config['info_key_templ']['user']
 
+        self.pending_flush_size = int(config.get('pending_flush_size', 0))
+        self.pending_flush_secs = float(config.get('pending_flush_secs', 0))
+
+        # collection and name of open WARCs, by full filename
+        self.open_warcs = {}
+
+    def _open_file(self, filename, params):
+        fh = super(SkipCheckingMultiFileWARCWriter, self)._open_file(filename, params)
+
+        self.open_warcs[filename] = (res_template('{coll}', params),
+                                     self.dedup_index._get_rel_or_base_name(filename, params))
+
+        return fh
+
+    def _close_file(self, fh):
+        closed = super(SkipCheckingMultiFileWARCWriter, self)._close_file(fh)
+
+        open_warc = self.open_warcs.pop(fh.name, None)
+        if open_warc:
+            self.store_checksum(fh.name, *open_warc)
+
+        return closed
+
+    def store_checksum(self, filename, coll, name):
+        """Store checksum and size of closed WARC, not read again
+        when listed or committed.
+
+        :param str filename: full WARC filename
+        :param str coll: collection ID
+        :param str name: WARC name
+        """
+        # removed with its recording or collection
+        if not self.redis.hexists(Recording.COLL_WARC_KEY.format(coll=coll), name):
+            return
+
+        try:
+            checksum = DirectLocalFileStorage.compute_checksum_and_size(filename)
+        except Exception as e:
+            logger.error('Record Writer: Checksum failed for {0}: {1}'.format(filename, e))
+            return
+
+        collection = Collection(my_id=coll,
+                                redis=self.redis,
+                                access=BaseAccess())
+
+        collection.set_warc_checksum(name, *checksum)
+
     def create_write_buffer(self, params, name):
         rec_id = params.get('param.recorder.rec') or params.get('param.rec')
         recording = Recording(my_id=rec_id,
@@ -338,7 +433,9 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
         params['recording'] = recording
 
-        return TempWriteBuffer(recording, name, params['url'])
+        return TempWriteBuffer(recording, name, params['url'],
+                               flush_size=self.pending_flush_size,
+                               flush_secs=self.pending_flush_secs)
 
     def write_stream_to_file(self, params, stream):
         upload_id = params.get('param.upid')
@@ -392,21 +489,50 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
 # ============================================================================
 class TempWriteBuffer(tempfile.SpooledTemporaryFile):
-    def __init__(self, recording, class_name, url):
+    """Write buffer tracking pending count and size of its recording.
+
+    Pending size increments after the first write are coalesced and added
+    once `flush_size` bytes or `flush_secs` seconds have accumulated.
+    Whether the recording is open is only checked once, on creation.
+    """
+    def __init__(self, recording, class_name, url, flush_size=0, flush_secs=0):
         super(TempWriteBuffer, self).__init__(max_size=512*1024)
         self.recording = recording
         self.class_name = class_name
 
-        self.recording.inc_pending_count()
+        self.flush_size = flush_size
+        self.flush_secs = flush_secs
+
+        self._counted = self.recording.inc_pending_count()
 
         self._wsize = 0
+        self._pending_size = 0
+        self._flushed_size = 0
+        # first write is always flushed, so pending size is visible at once
+        self._last_flush = 0
 
     def write(self, buff):
         super(TempWriteBuffer, self).write(buff)
         length = len(buff)
         self._wsize += length
 
-        self.recording.inc_pending_size(length)
+        if not self._counted:
+            return
+
+        self._pending_size += length
+
+        if (self._pending_size >= self.flush_size or
+            time.time() - self._last_flush >= self.flush_secs):
+            self._flush_pending_size()
+
+    def _flush_pending_size(self):
+        if self._pending_size:
+            # open when counted, removed again on close even if closed meanwhile
+            self.recording.inc_pending_size(self._pending_size, check_open=False)
+            self._flushed_size += self._pending_size
+            self._pending_size = 0
+
+        self._last_flush = time.time()
 
     def close(self):
         try:
@@ -414,6 +540,8 @@ class TempWriteBuffer(tempfile.SpooledTemporaryFile):
         except:
             traceback.print_exc()
 
-        self.recording.dec_pending_count_and_size(self._wsize)
+        # unflushed size was never added, only remove what was
+        if self._counted:
+            self.recording.dec_pending_count_and_size(self._flushed_size)
 
 
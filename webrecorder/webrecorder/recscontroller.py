@@ -144,15 +144,25 @@ class RecsController(BaseController):
             return {'page_id': page_id}
 
         @self.app.get('/api/v1/recording/<rec>/pages')
-        @self.api(query=['user', 'coll'],
+        @self.api(query=['user', 'coll', '?since', 'cursor', 'limit'],
                   resp='pages')
         def list_pages(rec):
             user, collection, recording = self.load_recording(rec)
 
             self.access.assert_can_read_coll(collection)
 
-            pages = collection.list_rec_pages(recording)
-            return {'pages': pages}
+            cursor, limit = self.get_cursor_limit()
+
+            pages, next_cursor = collection.list_pages_range(rec=recording.my_id,
+                                                             since=request.query.get('since'),
+                                                             cursor=cursor,
+                                                             limit=limit)
+
+            data = {'pages': pages}
+            if next_cursor is not None:
+                data['cursor'] = next_cursor
+
+            return data
 
         @self.app.get('/api/v1/recording/<rec>/num_pages')
         @self.api(query=['user', 'coll'],
@@ -162,7 +172,7 @@ class RecsController(BaseController):
 
             self.access.assert_can_read_coll(collection)
 
-            return {'count': recording.count_pages() }
+            return {'count': collection.count_rec_pages(recording)}
 
         @self.app.delete('/api/v1/recording/<rec>/pages')
         @self.api(query=['user', 'coll'],
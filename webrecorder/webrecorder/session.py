@@ -5,12 +5,15 @@ from datetime import timedelta, datetime
 from warcio.timeutils import datetime_to_http_date
 
 import base64
+import json
 import pickle
 import redis
+import time
+from collections import OrderedDict
 from time import strftime, gmtime
 
 from webrecorder.cookieguard import CookieGuard
-from webrecorder.utils import redis_pipeline
+from webrecorder.utils import redis_pipeline, today_str
 from itsdangerous import URLSafeTimedSerializer, BadSignature
 
 
@@ -19,7 +22,14 @@ class Session(object):
     TEMP_KEY = 't:{0}'
     temp_prefix = ''
 
-    def __init__(self, cork, environ, redis, key, sesh, ttl, is_restricted, sesh_manager):
+    # session keys by expiry time
+    ACTIVE_SESSIONS_KEY = 'z:sessions'
+
+    # unique sessions seen per day (HyperLogLog)
+    UNIQUE_SESSIONS_KEY = 'st:sesh-uniq:{0}'
+
+    def __init__(self, cork, environ, redis, key, sesh, ttl, is_restricted, sesh_manager,
+                 replay_only=False):
         self.environ = environ
         self._sesh = sesh
         self.redis = redis
@@ -35,6 +45,9 @@ class Session(object):
 
         self.is_restricted = is_restricted
 
+        # session not loaded, only id from cookie available, never saved
+        self.replay_only = replay_only
+
         if self.is_restricted:
             self.dura_type = 'restricted'
         elif sesh.get('is_long'):
@@ -79,6 +92,9 @@ class Session(object):
         self.template_params = params
 
     def is_new(self):
+        if self.replay_only:
+            return False
+
         if self.ttl == -2:
             return True
 
@@ -133,7 +149,10 @@ class Session(object):
     def delete(self):
         self.should_delete = True
         self.environ['webrec.delete_all_cookies'] = 'all'
-        self.redis.delete(self.key)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.delete(self.key)
+            pi.zrem(self.ACTIVE_SESSIONS_KEY, self.key)
 
     def __getitem__(self, name):
         return self._sesh[name]
@@ -192,7 +211,10 @@ class Session(object):
         self.should_save = True
 
         self.environ['webrec.delete_all_cookies'] = 'non_sesh'
-        self.redis.delete(self.key)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.delete(self.key)
+            pi.zrem(self.ACTIVE_SESSIONS_KEY, self.key)
 
     def set_restricted_user(self, user):
         if not self.is_new():
@@ -244,15 +266,24 @@ class Session(object):
 
 # ============================================================================
 class RedisSessionMiddleware(CookieGuard):
-    def __init__(self, app, cork, redis, session_opts, access_cls=None, access_redis=None):
+    def __init__(self, app, cork, redis, session_opts, access_cls=None, access_redis=None,
+                 replay_only_check=None):
         super(RedisSessionMiddleware, self).__init__(app, session_opts['session.key'])
         self.redis = redis
         self.access_redis = access_redis
         self.cork = cork
 
+        # if returns true for request, session is not loaded from redis
+        self.replay_only_check = replay_only_check
+
         self.auto_login_user = os.environ.get('AUTO_LOGIN_USER')
 
         self.secret_key = expandvars(session_opts['session.secret'])
+        self.serializer = URLSafeTimedSerializer(self.secret_key)
+
+        # verified cookie -> (sesh_id, is_restricted), least recently used first
+        self.cookie_cache = OrderedDict()
+        self.cookie_cache_size = int(session_opts.get('session.cookie_cache_size', 1000))
 
         self.key_template = session_opts['session.key_template']
         self.long_sessions_key = session_opts['session.long_sessions_key']
@@ -261,7 +292,7 @@ class RedisSessionMiddleware(CookieGuard):
 
         self.access_cls = access_cls
 
-    def _load_session(self, environ):
+    def _load_cookie_sesh_id(self, environ):
         sesh_cookie = self.split_cookie(environ)
 
         if not sesh_cookie:
@@ -275,7 +306,10 @@ class RedisSessionMiddleware(CookieGuard):
 
         environ['webrec.sesh_cookie'] = sesh_cookie
 
-        result = self.signed_cookie_to_id(sesh_cookie)
+        return self.signed_cookie_to_id(sesh_cookie)
+
+    def _load_session(self, environ):
+        result = self._load_cookie_sesh_id(environ)
 
         if not result:
             return
@@ -283,27 +317,55 @@ class RedisSessionMiddleware(CookieGuard):
         sesh_id, is_restricted = result
         redis_key = self.key_template.format(sesh_id)
 
-        result = self.redis.get(redis_key)
+        pi = self.redis.pipeline(transaction=False)
+        pi.get(redis_key)
+        pi.ttl(redis_key)
+        result, ttl = pi.execute()
+
         if not result:
             return
 
-        data = pickle.loads(base64.b64decode(result))
-        ttl = self.redis.ttl(redis_key)
+        data = self.decode_session(result)
 
         return sesh_id, redis_key, data, ttl, is_restricted
 
+    def encode_session(self, data):
+        return json.dumps(data, separators=(',', ':'))
+
+    def decode_session(self, result):
+        if isinstance(result, bytes):
+            result = result.decode('utf-8')
+
+        if result.startswith('{'):
+            return json.loads(result)
+
+        # session saved in older pickle format, will be saved as json on next save
+        return pickle.loads(base64.b64decode(result))
+
     def init_session(self, environ):
         sesh_id = None
         redis_key = None
         data = None
         ttl = -2
         is_restricted = False
+        replay_only = False
 
         if 'wsgiprox.proxy_host' not in environ:
             try:
-                result = self._load_session(environ)
-                if result:
-                    sesh_id, redis_key, data, ttl, is_restricted = result
+                if self.replay_only_check and self.replay_only_check(environ):
+                    # only need session id, from signed cookie
+                    result = self._load_cookie_sesh_id(environ)
+                    if result:
+                        sesh_id, is_restricted = result
+                        redis_key = self.key_template.format(sesh_id)
+                        data = {'id': sesh_id}
+                        ttl = -1
+                        replay_only = True
+
+                else:
+                    result = self._load_session(environ)
+                    if result:
+                        sesh_id, redis_key, data, ttl, is_restricted = result
             except Exception as e:
                 import traceback
                 traceback.print_exc()
@@ -328,7 +390,8 @@ class RedisSessionMiddleware(CookieGuard):
                           data,
                           ttl,
                           is_restricted,
-                          self)
+                          self,
+                          replay_only=replay_only)
 
         environ['webrec.template_params'] = session.template_params
         environ['webrec.session'] = session
@@ -344,6 +407,9 @@ class RedisSessionMiddleware(CookieGuard):
 
         session = environ['webrec.session']
 
+        if session.replay_only:
+            return
+
         if session.should_delete:
             self._delete_session_cookie(environ, headers, self.sesh_key)
         else:
@@ -383,7 +449,7 @@ class RedisSessionMiddleware(CookieGuard):
 
         if session.should_save:
             with redis_pipeline(self.redis) as pi:
-                data = base64.b64encode(pickle.dumps(session._sesh))
+                data = self.encode_session(session._sesh)
 
                 ttl = session.ttl
                 if ttl <= 0:
@@ -397,10 +463,15 @@ class RedisSessionMiddleware(CookieGuard):
                 # set redis duration
                 if session.curr_role != 'anon':
                     pi.expire(session.key, duration)
+                    ttl = duration
+
+                self.track_active(session, ttl, pi)
 
         elif set_cookie and session.curr_role != 'anon':
             # extend redis duration if extending cookie!
-            self.redis.expire(session.key, duration)
+            with redis_pipeline(self.redis) as pi:
+                pi.expire(session.key, duration)
+                self.track_active(session, duration, pi)
 
         if not set_cookie:
             return
@@ -454,6 +525,16 @@ class RedisSessionMiddleware(CookieGuard):
 
         pi.lpush(self.long_sessions_key.format(username), session.key)
 
+    def track_active(self, session, ttl, pi):
+        now = time.time()
+        pi.zadd(Session.ACTIVE_SESSIONS_KEY, now + ttl, session.key)
+
+        # count session as seen today, when saved or extended
+        pi.pfadd(Session.UNIQUE_SESSIONS_KEY.format(today_str()), session['id'])
+
+        # drop expired sessions
+        pi.zremrangebyscore(Session.ACTIVE_SESSIONS_KEY, '-inf', now)
+
     def clear_long_term(self, username):
         list_key = self.long_sessions_key.format(username)
 
@@ -462,19 +543,32 @@ class RedisSessionMiddleware(CookieGuard):
         with redis_pipeline(self.redis) as pi:
             for key in long_sesh_keys:
                 pi.delete(key)
+                pi.zrem(Session.ACTIVE_SESSIONS_KEY, key)
 
             pi.delete(list_key)
 
     def signed_cookie_to_id(self, sesh_cookie):
-        serial = URLSafeTimedSerializer(self.secret_key)
+        result = self.cookie_cache.get(sesh_cookie)
+        if result:
+            self.cookie_cache.move_to_end(sesh_cookie)
+            return result
 
         try:
-            return serial.loads(sesh_cookie)
+            sesh_id, is_restricted = self.serializer.loads(sesh_cookie)
         except BadSignature as b:
             return None
 
+        # only cache valid signatures
+        result = (sesh_id, is_restricted)
+        if self.cookie_cache_size > 0:
+            self.cookie_cache[sesh_cookie] = result
+            if len(self.cookie_cache) > self.cookie_cache_size:
+                self.cookie_cache.popitem(last=False)
+
+        return result
+
     def id_to_signed_cookie(self, sesh_id, is_restricted):
-        return URLSafeTimedSerializer(self.secret_key).dumps([sesh_id, is_restricted])
+        return self.serializer.dumps([sesh_id, is_restricted])
 
     def make_id(self):
         return base64.b64encode(os.urandom(20)).decode('utf-8')
@@ -15,6 +15,7 @@ from webrecorder.standalone.serializefakeredis import FakeRedisSerializer
 from gevent.threadpool import ThreadPool
 
 import traceback
+import multiprocessing
 import redis
 import fakeredis
 import logging
@@ -56,7 +57,8 @@ class WebrecPlayerRunner(StandaloneRunner):
             name = os.path.basename(self.inputs[0]) +'-cache.json.gz'
             cache_db = os.path.join(self.cache_dir, name)
 
-            self.serializer = FakeRedisSerializer(cache_db, self.inputs)
+            # check each archive, also those in input directories, for changes
+            self.serializer = FakeRedisSerializer(cache_db, list(self.get_archive_files(self.inputs)))
 
     def _admin_init(self):
         if self.coll_dir:
@@ -247,5 +249,7 @@ webrecorder_player = WebrecPlayerRunner.main
 
 
 if __name__ == "__main__":
+    # required for indexing worker processes in frozen app
+    multiprocessing.freeze_support()
     webrecorder_player()
 
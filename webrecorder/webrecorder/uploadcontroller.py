@@ -2,6 +2,7 @@ from webrecorder.apiutils import wr_api_spec
 from webrecorder.basecontroller import BaseController
 from webrecorder.models.importer import UploadImporter
 from webrecorder.models.stats import Stats
+from webrecorder.rec.webrecrecorder import WebRecRecorder
 
 from bottle import request
 
@@ -12,9 +13,16 @@ class UploadController(BaseController):
         super(UploadController, self).__init__(*args, **kwargs)
         content_app = kwargs['content_app']
 
+        # index uploads while parsing, if enabled
+        if self.config.get('upload_single_pass'):
+            indexer = WebRecRecorder.make_wr_indexer(self.config)
+        else:
+            indexer = None
+
         self.uploader = UploadImporter(self.redis,
                                        self.config,
-                                       wam_loader=content_app.wam_loader)
+                                       wam_loader=content_app.wam_loader,
+                                       indexer=indexer)
 
     def init_routes(self):
         wr_api_spec.set_curr_tag('Uploads')
@@ -7,9 +7,13 @@ import gevent
 import logging
 import datetime
 import os
+import time
 import base64
 
 
+logger = logging.getLogger('wr.io')
+
+
 # ============================================================================
 def init_logging(debug=False):
     logging.basicConfig(format='%(name)s: %(asctime)s: [%(levelname)s]: %(message)s',
@@ -127,6 +131,124 @@ def redis_pipeline(redis_obj, transaction=False):
     p.execute()
 
 
+# ============================================================================
+class CDXJBulkLoader(object):
+    """Streaming loader adding CDXJ lines to a Redis sorted set.
+
+    Lines are added with multi-member ZADD commands of `batch_size` lines,
+    sent in pipelines of `PIPELINE_DEPTH` commands.
+
+    :cvar int BATCH_SIZE: lines per ZADD
+    :cvar int PIPELINE_DEPTH: ZADD commands per pipeline
+    :cvar int READ_SIZE: chunk size when reading from stream
+    :ivar StrictRedis redis: Redis interface
+    :ivar str key: sorted set Redis key
+    :ivar int count: number of lines added
+    """
+    BATCH_SIZE = 1000
+    PIPELINE_DEPTH = 10
+    READ_SIZE = 65536
+
+    def __init__(self, redis, key, batch_size=None):
+        """Initialize CDXJ loader.
+
+        :param StrictRedis redis: Redis interface
+        :param str key: sorted set Redis key
+        :param int batch_size: lines per ZADD
+        """
+        self.redis = redis
+        self.key = key
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+        self.count = 0
+        self.start_time = time.time()
+
+        self._batch = []
+        self._pi = None
+        self._pi_len = 0
+
+    def add(self, line):
+        """Add CDXJ line.
+
+        :param line: CDXJ line
+        :type: str or bytes
+        """
+        if not line:
+            return
+
+        self._batch.append(0)
+        self._batch.append(line)
+
+        if len(self._batch) >= self.batch_size * 2:
+            self._flush_batch()
+
+    def add_lines(self, lines):
+        """Add CDXJ lines.
+
+        :param lines: CDXJ lines
+        :type: iterable
+        """
+        for line in lines:
+            self.add(line)
+
+    def load_stream(self, fh):
+        """Read CDXJ lines from stream, in chunks of `READ_SIZE`.
+
+        :param fh: stream
+        :type: file-like object
+        """
+        partial = b''
+        while True:
+            buff = fh.read(self.READ_SIZE)
+            if not buff:
+                break
+
+            lines = (partial + buff).split(b'\n')
+            partial = lines.pop()
+
+            for line in lines:
+                self.add(line.rstrip(b'\r'))
+
+        self.add(partial.rstrip(b'\r'))
+
+    def _flush_batch(self):
+        if not self._batch:
+            return
+
+        if not self._pi:
+            self._pi = self.redis.pipeline(transaction=False)
+
+        self._pi.zadd(self.key, *self._batch)
+        self._pi_len += 1
+        self.count += len(self._batch) // 2
+        self._batch = []
+
+        if self._pi_len >= self.PIPELINE_DEPTH:
+            self._execute()
+
+    def _execute(self):
+        if self._pi:
+            self._pi.execute()
+            self._pi = None
+            self._pi_len = 0
+
+    def close(self):
+        """Write any remaining lines and log load rate.
+
+        :returns: number of lines added
+        :rtype: int
+        """
+        self._flush_batch()
+        self._execute()
+
+        elapsed = time.time() - self.start_time
+        if self.count:
+            logger.debug('CDXJ Load: {0} lines to {1} in {2:.2f}s ({3:.0f} lines/sec)'.format(
+                         self.count, self.key, elapsed, self.count / max(elapsed, 0.001)))
+
+        return self.count
+
+
 # ============================================================================
 class CacheingLimitReader(LimitReader):
     def __init__(self, stream, length, out):
@@ -2,13 +2,19 @@ from bottle import Bottle, request, HTTPError, response, HTTPResponse, redirect
 import time
 import json
 import os
+import traceback
+
+from collections import defaultdict
 
 import gevent
+import gevent.event
 import gevent.queue
 
 from webrecorder.basecontroller import BaseController
 from webrecorder.models.dynstats import DynStats
 from webrecorder.models.stats import Stats
+from webrecorder.models.recording import Recording
+from webrecorder.models.collection import Collection
 
 
 # ============================================================================
@@ -24,6 +30,13 @@ class WebsockController(BaseController):
         self.dyn_stats = DynStats(self.redis, config)
         self.stats = Stats(self.redis)
 
+        self.pubsub_hub = PubSubHub(self.browser_mgr.browser_redis,
+                                    ['to_cbr_ps:*', 'from_cbr_ps:*'])
+
+        self.status_broadcaster = StatusBroadcaster(self.redis,
+                                                    self.dyn_stats,
+                                                    self.status_update_secs)
+
     def init_routes(self):
         @self.app.get('/_client_ws')
         def client_ws():
@@ -130,52 +143,64 @@ class BaseWebSockHandler(object):
         self.sesh_id = sesh_id
         self.stats_urls = stats_urls or []
 
-        self.updater = None
+        # status pushed by shared broadcaster, if enabled
+        self.status_broadcaster = None
         if status_update_secs:
-            self.updater = StatusUpdater(status_update_secs, self)
+            self.status_broadcaster = websock_controller.status_broadcaster
+
+        self.last_status = None
 
         self.name = name
         self.channel = None
-        self.pubsub = None
+        self.recv_channel = None
+
+        # ('ws', msg) from client, ('ps', msg) from pub/sub hub
+        # or ('status', msg) from status broadcaster
+        self.events = gevent.queue.Queue()
+        self.pubsub_hub = websock_controller.pubsub_hub
 
         self.reqid = reqid
 
         if reqid:
             self.channel = send_to + reqid
-
-            self.pubsub = self.browser_redis.pubsub()
-            self.pubsub.subscribe(recv_from + reqid)
-
-            if not hasattr(self.pubsub, 'connection'):
-                self.pubsub = None
+            self.recv_channel = recv_from + reqid
 
     def run(self):
         self._init_ws(request.environ)
 
+        if self.recv_channel:
+            self.pubsub_hub.subscribe(self.recv_channel, self.events)
+
         accum_buff = None
 
-        while True:
-            # read WS
-            buff = self._recv_ws()
-            if buff:
-                accum_buff = buff if not accum_buff else accum_buff + buff
-                accum_buff = self.handle_client_msg(accum_buff)
+        try:
+            if self.status_broadcaster:
+                self.status_broadcaster.add(self)
 
-            # read pubsub
-            if self.pubsub:
-                ps_msg = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
-                if ps_msg and ps_msg['type'] == 'message':
-                    self._send_ws(ps_msg['data'])
+            while True:
+                type_, data = self._next_event(None)
 
-            if self.updater:
-                res = self.updater.get_update()
-                if res:
-                    self._send_ws(res)
+                if type_ == 'ws':
+                    accum_buff = data if not accum_buff else accum_buff + data
+                    accum_buff = self.handle_client_msg(accum_buff)
 
-            gevent.sleep(1.0)
+                elif type_ in ('ps', 'status'):
+                    self._send_ws(data)
+        finally:
+            if self.status_broadcaster:
+                self.status_broadcaster.remove(self)
+
+            if self.recv_channel:
+                self.pubsub_hub.unsubscribe(self.recv_channel, self.events)
+
+    def _next_event(self, timeout):
+        try:
+            return self.events.get(timeout=timeout)
+        except gevent.queue.Empty as e:
+            return None, None
 
     def _publish(self, channel, msg):
-        self.browser_redis.publish(channel, json.dumps(msg))
+        self.pubsub_hub.publish(channel, json.dumps(msg))
 
     def handle_client_msg(self, msg):
         if not msg:
@@ -252,49 +277,55 @@ class BaseWebSockHandler(object):
             if msg['ws_type'] in ('replace-url', 'load', 'patch_req', 'behaviorDone', 'behaviorStop', 'behaviorStep'):
                 self._publish(from_browser, msg)
 
-    def get_status(self):
-        size = self.recording.size if self.recording else self.collection.size
-
-        if size is None:
-            result = {'ws_type': 'error', 'error': 'not_found'}
-            return json.dumps(result)
+    def get_status_key(self):
+        """Return what the status of this socket is computed from.
 
-        result = {'ws_type': 'status'}
-        result['size'] = size
+        Sockets with the same status key share a single status read.
 
-        if self.recording:
-            pending_size = self.recording.get_pending_size()
+        :returns: collection, recording, whether extracting, dyn stats keys
+        :rtype: tuple
+        """
+        if self.stats_urls:
+            dyn_stats_keys = self.dyn_stats.get_dyn_stats_keys(self.collection,
+                                                               self.recording,
+                                                               self.sesh_id,
+                                                               self.stats_urls)
+        else:
+            dyn_stats_keys = []
 
-            # if extracting, also add the size from patch recording, if any
-            if self.type_.startswith('extract'):
-                patch_recording = self.recording.get_patch_recording()
-                if patch_recording:
-                    patch_size = patch_recording.size
-                    pending_size += patch_recording.get_pending_size()
-                    if patch_size is not None:
-                        size += patch_size
+        return (self.collection.my_id,
+                self.recording.my_id if self.recording else None,
+                bool(self.type_ and self.type_.startswith('extract')),
+                tuple(dyn_stats_keys))
 
-            result['pending_size'] = pending_size
+    def push_status(self, status):
+        """Queue status to be sent, unless unchanged since last sent.
 
-        if self.stats_urls:
-            result['stats'] = self.dyn_stats.get_dyn_stats(
-                                self.user,
-                                self.collection,
-                                self.recording,
-                                self.sesh_id,
-                                self.stats_urls)
-
-        return json.dumps(result)
+        :param str status: status message
+        """
+        if status != self.last_status:
+            self.last_status = status
+            self.events.put(('status', status))
 
 
 # ============================================================================
 class UwsgiWebSockHandler(BaseWebSockHandler):
+    # uwsgi websocket can't be waited on, poll at this interval
+    RECV_POLL_SECS = 0.1
+
     def _init_ws(self, env):
         uwsgi.websocket_handshake(env['HTTP_SEC_WEBSOCKET_KEY'],
                                   env.get('HTTP_ORIGIN', ''))
 
-    def _recv_ws(self):
-        return uwsgi.websocket_recv_nb()
+    def _next_event(self, timeout):
+        buff = uwsgi.websocket_recv_nb()
+        if buff:
+            return 'ws', buff
+
+        if timeout is None or timeout > self.RECV_POLL_SECS:
+            timeout = self.RECV_POLL_SECS
+
+        return super(UwsgiWebSockHandler, self)._next_event(timeout)
 
     def _send_ws(self, msg):
         uwsgi.websocket_send(msg)
@@ -305,7 +336,6 @@ class GeventWebSockHandler(BaseWebSockHandler):
     def _init_ws(self, env):
         self._ws = env['wsgi.websocket']
 
-        self.q = gevent.queue.Queue()
         gevent.spawn(self._do_recv)
 
     def _do_recv(self):
@@ -316,45 +346,288 @@ class GeventWebSockHandler(BaseWebSockHandler):
                 break
 
             if result:
-                self.q.put(result.encode('utf-8'))
+                self.events.put(('ws', result.encode('utf-8')))
+
+        # wake up handler to exit
+        self.events.put(('closed', None))
 
-    def _recv_ws(self):
+    def _next_event(self, timeout):
         if self._ws.closed:
             raise OSError('WS Closed')
 
-        try:
-            return self.q.get_nowait()
-        except gevent.queue.Empty as e:
-            return None
+        type_, data = super(GeventWebSockHandler, self)._next_event(timeout)
+        if type_ == 'closed':
+            raise OSError('WS Closed')
+
+        return type_, data
 
     def _send_ws(self, msg):
         self._ws.send(msg)
 
 
 # ============================================================================
-class StatusUpdater(object):
-    def __init__(self, status_update_secs, ws_handler):
-        self.ws_handler = ws_handler
+class StatusBroadcaster(object):
+    """Periodic size and stats status for all open websockets.
+
+    Each interval, the status of each distinct recording (or collection)
+    and set of stats urls is read once, in a single pipeline, and pushed
+    only to sockets for which it has changed.
+
+    :ivar StrictRedis redis: Redis
+    :ivar DynStats dyn_stats: dynamic stats
+    :ivar float status_update_secs: update interval
+    :ivar set handlers: websocket handlers receiving status
+    """
+    def __init__(self, redis, dyn_stats, status_update_secs):
+        self.redis = redis
+        self.dyn_stats = dyn_stats
+        self.status_update_secs = status_update_secs
+        self.handlers = set()
+        self.greenlet = None
 
-        self.last_status = None
-        self.last_status_time = 0.0
+    def add(self, handler):
+        """Send current status to handler and keep it updated.
 
-        self.status_update_secs = status_update_secs
+        :param BaseWebSockHandler handler: websocket handler
+        """
+        self.handlers.add(handler)
+
+        # initial status sent right away
+        self.broadcast([handler])
+
+        if not self.greenlet or self.greenlet.dead:
+            self.greenlet = gevent.spawn(self._run)
+
+    def remove(self, handler):
+        """Stop updating handler.
+
+        :param BaseWebSockHandler handler: websocket handler
+        """
+        self.handlers.discard(handler)
+
+    def _run(self):
+        while self.handlers:
+            start = time.time()
+
+            try:
+                self.broadcast(list(self.handlers))
+            except Exception:
+                traceback.print_exc()
+
+            gevent.sleep(max(start + self.status_update_secs - time.time(), 0))
+
+    def broadcast(self, handlers):
+        """Compute status once per status key and push to handlers.
+
+        :param list handlers: websocket handlers
+        """
+        groups = defaultdict(list)
+        for handler in handlers:
+            groups[handler.get_status_key()].append(handler)
+
+        pi = self.redis.pipeline(transaction=False)
+        reads = {}
+
+        for coll, rec, extract, dyn_stats_keys in groups:
+            if rec:
+                self._read(pi, reads, 'exists', Recording.INFO_KEY.format(rec=rec))
+                self._read(pi, reads, 'hget', Recording.INFO_KEY.format(rec=rec), 'size')
+                self._read(pi, reads, 'get', Recording.PENDING_SIZE_KEY.format(rec=rec))
+                if extract:
+                    self._read(pi, reads, 'hget', Recording.INFO_KEY.format(rec=rec), 'patch_rec')
+            else:
+                self._read(pi, reads, 'exists', Collection.INFO_KEY.format(coll=coll))
+                self._read(pi, reads, 'hget', Collection.INFO_KEY.format(coll=coll), 'size')
+
+            for dyn_stats_key in dyn_stats_keys:
+                self._read(pi, reads, 'hgetall', dyn_stats_key)
+                self._read(pi, reads, 'expire', dyn_stats_key, self.dyn_stats.dyn_stats_secs)
+
+        results = pi.execute()
+
+        def result(*args):
+            return results[reads[args]]
+
+        # if extracting, also add the pending size from patch recording, if any
+        patch_recs = {}
+        for coll, rec, extract, dyn_stats_keys in groups:
+            if rec and extract:
+                patch_rec = result('hget', Recording.INFO_KEY.format(rec=rec), 'patch_rec')
+                if patch_rec:
+                    patch_recs[rec] = patch_rec
+
+        if patch_recs:
+            pi = self.redis.pipeline(transaction=False)
+            for patch_rec in patch_recs.values():
+                pi.hget(Recording.INFO_KEY.format(rec=patch_rec), 'size')
+                pi.get(Recording.PENDING_SIZE_KEY.format(rec=patch_rec))
+
+            patch_res = pi.execute()
+            patch_sizes = dict(zip(patch_recs.values(), zip(patch_res[0::2], patch_res[1::2])))
+
+        for status_key, group in groups.items():
+            coll, rec, extract, dyn_stats_keys = status_key
+
+            if rec:
+                info_key = Recording.INFO_KEY.format(rec=rec)
+            else:
+                info_key = Collection.INFO_KEY.format(coll=coll)
+
+            # recording or collection deleted
+            if not result('exists', info_key):
+                status = json.dumps({'ws_type': 'error', 'error': 'not_found'})
+                for handler in group:
+                    handler.push_status(status)
+
+                continue
+
+            status = {'ws_type': 'status'}
+
+            if rec:
+                size = int(result('hget', info_key, 'size') or 0)
+                pending_size = int(result('get', Recording.PENDING_SIZE_KEY.format(rec=rec)) or 0)
+
+                if rec in patch_recs:
+                    patch_size, patch_pending = patch_sizes[patch_recs[rec]]
+                    size += int(patch_size or 0)
+                    pending_size += int(patch_pending or 0)
+
+                status['size'] = size
+                status['pending_size'] = pending_size
+
+            else:
+                status['size'] = int(result('hget', info_key, 'size') or 0)
+
+            if dyn_stats_keys:
+                status['stats'] = self.dyn_stats.sum_dyn_stats(
+                                    [result('hgetall', dyn_stats_key)
+                                     for dyn_stats_key in dyn_stats_keys])
+
+            status = json.dumps(status)
+
+            for handler in group:
+                handler.push_status(status)
+
+    def _read(self, pi, reads, *args):
+        # queue each distinct read only once
+        if args not in reads:
+            reads[args] = len(reads)
+            getattr(pi, args[0])(*args[1:])
+
+
+# ============================================================================
+class PubSubHub(object):
+    """Process-wide Redis pub/sub dispatcher for websocket handlers.
+
+    A single connection pattern-subscribes to all handler channels and
+    puts each message on the event queues of handlers subscribed to its
+    channel, instead of one connection per websocket.
+
+    :ivar StrictRedis redis: Redis to subscribe with
+    :ivar list patterns: channel patterns
+    :ivar dict queues: channel -> set of handler event queues
+    :ivar Event ready: set once all patterns are subscribed
+    :ivar list pending: messages to publish once subscribed
+    """
+    RETRY_SECS = 1.0
+
+    def __init__(self, redis, patterns):
+        self.redis = redis
+        self.patterns = patterns
+        self.queues = defaultdict(set)
+        self.greenlet = None
+        self.ready = gevent.event.Event()
+        self.pending = []
+
+    def subscribe(self, channel, queue):
+        """Add queue to receive messages for channel. Does not wait
+        for the hub's subscription to be confirmed by Redis.
+
+        :param str channel: channel
+        :param Queue queue: handler event queue
+        """
+        self.queues[channel].add(queue)
+        self._ensure_running()
+
+    def publish(self, channel, msg):
+        """Publish message, or queue it until the hub's subscription
+        is confirmed by Redis, so that replies to it are not missed.
+
+        :param str channel: channel
+        :param str msg: message
+        """
+        if self.ready.is_set():
+            self.redis.publish(channel, msg)
+            return
+
+        self.pending.append((channel, msg))
+        self._ensure_running()
+
+    def _ensure_running(self):
+        if not self.greenlet or self.greenlet.dead:
+            self.greenlet = gevent.spawn(self._run)
+
+    def _set_ready(self):
+        self.ready.set()
+
+        pending = self.pending
+        self.pending = []
+
+        for channel, msg in pending:
+            self.redis.publish(channel, msg)
+
+    def unsubscribe(self, channel, queue):
+        """Stop sending messages for channel to queue.
+
+        :param str channel: channel
+        :param Queue queue: handler event queue
+        """
+        queues = self.queues.get(channel)
+        if queues is None:
+            return
+
+        queues.discard(queue)
+        if not queues:
+            del self.queues[channel]
+
+    def _run(self):
+        while True:
+            self.ready.clear()
+
+            pubsub = self.redis.pubsub()
+
+            # not supported, eg. fakeredis
+            if not hasattr(pubsub, 'connection'):
+                self._set_ready()
+                return
+
+            try:
+                pubsub.psubscribe(*self.patterns)
+
+                # one confirmation per pattern
+                pending = len(self.patterns)
+
+                for msg in pubsub.listen():
+                    if msg['type'] == 'psubscribe':
+                        pending -= 1
+                        if pending == 0:
+                            self._set_ready()
+
+                        continue
 
-    def get_update(self):
-        curr_time = time.time()
-        result = None
+                    if msg['type'] != 'pmessage':
+                        continue
 
-        if (curr_time - self.last_status_time) > self.status_update_secs:
-            status = self.ws_handler.get_status()
+                    for queue in list(self.queues.get(msg['channel'], ())):
+                        queue.put(('ps', msg['data']))
 
-            if status != self.last_status:
-                self.last_status = status
-                result = status
+            except Exception:
+                traceback.print_exc()
 
-            self.last_status_time = curr_time
+            finally:
+                pubsub.close()
 
-        return result
+            gevent.sleep(self.RETRY_SECS)
 
 
 # ============================================================================